@@ -0,0 +1,319 @@
+# -*- coding: utf-8 -*-
+"""
+功能：分析流程各阶段在合成数据上的扩展性基准测试（耗时 + 内存）
+每个(阶段, 倍数)在独立子进程中运行，互不影响：先读入合成数据，再计时运行该阶段，报告墙钟/CPU耗时、吞吐量、
+峰值常驻内存（相对读入数据后的增量）及进程池子进程的峰值内存（Linux）；结果写成JSON报告，
+存在基线报告时逐项对比，超过REGRESSION_THRESHOLD倍的记为回退
+运行：python benchmarks/run_benchmarks.py
+"""
+
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+# -------------------------- 1. 基础配置 --------------------------
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DIR = os.path.join(BASE_DIR, "benchmarks")
+DASH_DIR = os.path.join(BASE_DIR, "results", "可视化dash表盘")
+sys.path.insert(0, os.path.join(BASE_DIR, "code"))
+
+REPORT_DIR = os.path.join(BENCH_DIR, "reports")
+BASELINE_PATH = os.path.join(REPORT_DIR, "baseline.json")   # 把一次满意的报告复制为基线，之后的报告与之对比
+REGRESSION_THRESHOLD = 1.25   # 耗时或内存增量超过基线的该倍数记为回退
+REGRESSION_MIN_S = 0.5        # 基线耗时低于该值的不比较耗时（计时噪声大）
+REGRESSION_MIN_MB = 20        # 基线内存增量低于该值的不比较内存
+STAGE_TIMEOUT_S = 4 * 3600    # 单个(阶段, 倍数)的超时时间
+
+# 各阶段参数
+STUB_LATENCY_S = 0.02         # 桩服务器每次请求的模拟延迟（秒）
+STUB_RATE_PER_SEC = 1000.0    # 基准测试时的令牌桶速率（远高于真实API，测的是客户端开销与并发）
+KMEANS_RANGE = range(2, 11)
+LDA_TOPICS = 4
+LDA_MAX_ITER = 10
+DASHBOARD_VIEWS = [           # 地图回调的测试视图：(天气, 景区类型, 情感类型, 缩小视图)
+    (None, None, None, False),
+    ("晴", None, None, False),
+    ("雨", None, "愉悦", False),
+    (None, None, None, True),
+]
+
+
+# -------------------------- 2. 内存与耗时测量 --------------------------
+def _proc_status() -> Dict[str, float]:
+    """/proc/self/status中的VmRSS/VmHWM（MB），非Linux返回空字典"""
+    try:
+        with open("/proc/self/status", "r") as f:
+            return {line.split(":")[0]: int(line.split()[1]) / 1024 for line in f
+                    if line.startswith(("VmRSS", "VmHWM"))}
+    except OSError:
+        return {}
+
+
+def _reset_peak_rss():
+    """把峰值常驻内存（VmHWM）重置为当前值，使峰值只反映之后的阶段（Linux 4.0+）"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def _children_peak_mb() -> Optional[float]:
+    """已结束的子进程（进程池、桩服务器）中最大的峰值常驻内存（MB）；Linux上fork时继承的常驻内存也计入"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return peak / 1024 / (1024 if sys.platform == "darwin" else 1)
+
+
+def measure(func, *args) -> Dict:
+    """运行func并记录耗时与内存；func返回{"rows": 处理行数, "phases": {...}, "extra": {...}}"""
+    _reset_peak_rss()
+    before = _proc_status()
+    cpu_start, wall_start = os.times(), time.perf_counter()
+    result = func(*args)
+    wall = time.perf_counter() - wall_start
+    cpu_end, after = os.times(), _proc_status()
+    cpu = sum(cpu_end[:4]) - sum(cpu_start[:4])   # 本进程 + 已回收子进程的用户态/内核态时间
+    memory = {}
+    if after:
+        memory = {"baseline_rss_mb": round(before["VmRSS"], 1), "peak_rss_mb": round(after["VmHWM"], 1),
+                  "peak_delta_mb": round(after["VmHWM"] - before["VmRSS"], 1)}
+    children = _children_peak_mb()
+    return {
+        "wall_s": round(wall, 3), "cpu_s": round(cpu, 3),
+        "rows_per_s": round(result["rows"] / wall, 1) if wall > 0 else None,
+        **memory, "children_peak_rss_mb": None if children is None else round(children, 1),
+        **result,
+    }
+
+
+def _timed(phases: Dict, name: str, func, *args, **kwargs):
+    start = time.perf_counter()
+    value = func(*args, **kwargs)
+    phases[f"{name}_s"] = round(time.perf_counter() - start, 3)
+    return value
+
+
+# -------------------------- 3. 各阶段 --------------------------
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def bench_sentiment(df) -> Dict:
+    """情感分析：label_messages（打包+并发+限流）对本地桩服务器，不使用结果缓存"""
+    import requests
+    sentiment = sys.modules["ds情感分析"]
+    port = _free_port()
+    env = dict(os.environ, STUB_LATENCY_S=str(STUB_LATENCY_S))
+    server = subprocess.Popen([sys.executable, os.path.join(BENCH_DIR, "stub_llm_server.py"), str(port)],
+                              env=env, stdout=subprocess.DEVNULL)
+    stats_url = f"http://127.0.0.1:{port}/stats"
+    try:
+        for _ in range(100):
+            try:
+                requests.get(stats_url, timeout=1)
+                break
+            except requests.ConnectionError:
+                time.sleep(0.1)
+        sentiment.DEEPSEEK_API_URL = f"http://127.0.0.1:{port}/v1/chat/completions"
+        sentiment.RATE_LIMITER = sentiment.TokenBucket(STUB_RATE_PER_SEC, STUB_RATE_PER_SEC)
+        messages = [str(m).strip() for m in df["message"]]
+        mids = df["mid"].tolist()
+        results = sentiment.label_messages(messages, mids, cache=None)
+        stats = requests.get(stats_url, timeout=5).json()
+    finally:
+        server.terminate()
+        server.wait()
+    return {"rows": len(results), "extra": {"api_requests": stats["requests"], "api_messages": stats["messages"],
+                                            "stub_latency_s": STUB_LATENCY_S}}
+
+
+def bench_clustering(df) -> Dict:
+    """景区聚合（向量化分组核）+ K-means选K扫描（不读写扫描缓存）"""
+    from kmeans_sweep import best_k, sweep_k
+    from scenic_features import scenic_aggregates, scenic_table
+    from 景区聚类 import prepare_features
+    phases = {}
+    sums, tag_counts = _timed(phases, "aggregate", scenic_aggregates, df)
+    scenic_agg = scenic_table(sums, tag_counts)
+    X_scaled, _, _ = prepare_features(scenic_agg)
+    sweep = _timed(phases, "sweep", sweep_k, X_scaled, KMEANS_RANGE, use_cache=False)
+    return {"rows": len(df), "phases": phases, "extra": {"n_spots": len(X_scaled), "best_k": best_k(sweep)}}
+
+
+def bench_lda(df) -> Dict:
+    """LDA：分词（不使用分词缓存）→ 稀疏词袋 → 在线变分贝叶斯训练（最多LDA_MAX_ITER轮）"""
+    from lda_cpu import build_corpus_and_tensor, train_lda_and_extract_results
+    from tokenize_cache import LDA_POS_FLAGS, filter_tokens, tokenize_messages
+    phases = {}
+    df = df.dropna(subset=["message"]).reset_index(drop=True)
+    tokens = _timed(phases, "tokenize", tokenize_messages, df["message"].tolist(), df["mid"], cache_path=None)
+    words = [filter_tokens(t, keep_flags=LDA_POS_FLAGS) for t in tokens]
+    keep = [i for i, w in enumerate(words) if w]
+    words = [words[i] for i in keep]
+    dictionary, doc_word, n_words, n_docs = _timed(phases, "corpus", build_corpus_and_tensor, words)
+    _timed(phases, "train", train_lda_and_extract_results, doc_word, LDA_TOPICS, n_words, n_docs,
+           df.iloc[keep].reset_index(drop=True), dictionary, max_iter=LDA_MAX_ITER)
+    return {"rows": len(df), "phases": phases, "extra": {"n_docs": n_docs, "n_words": n_words}}
+
+
+def bench_statistics(df) -> Dict:
+    """天气×景区类型分片的统计检验（ANOVA/Levene/Kruskal/置换检验/Bootstrap + BH校正）"""
+    from analysis_pivots import add_analysis_columns
+    from stat_tests import run_tests
+    df = add_analysis_columns(df[["tag5", "sentiment", "intensity", "emotion_type", "天气", "降水", "低能见度"]])
+    df["sentiment_score"] = df["sentiment_score"].fillna(0)
+    tests, _ = run_tests(df)
+    return {"rows": len(df), "extra": {"n_slices": len(tests), "n_significant": int(tests["显著"].sum())}}
+
+
+def bench_dashboard(df) -> Dict:
+    """地图页：由数据构建筛选立方体，再对DASHBOARD_VIEWS逐个冷调用update_dashboard（每次先清空LRU缓存）"""
+    from page_data import set_dataset
+    from pages import map_view
+    phases = {}
+    set_dataset("map_view", _timed(phases, "build", map_view.map_data_from_frame, df))
+    for i, (weather, poi_type, emotion, zoomed_out) in enumerate(DASHBOARD_VIEWS):
+        map_view.update_dashboard.cache_clear()
+        _timed(phases, f"view{i}", map_view.update_dashboard, weather, poi_type, emotion, zoomed_out)
+    return {"rows": len(df), "phases": phases}
+
+
+# 阶段名: (计时前先导入的模块, 基准函数)；导入耗时不计入阶段耗时
+STAGES = {
+    "sentiment": (["requests", "ds情感分析"], bench_sentiment),
+    "clustering": (["kmeans_sweep", "scenic_features", "景区聚类"], bench_clustering),
+    "lda": (["lda_cpu", "tokenize_cache", "jieba.posseg"], bench_lda),
+    "statistics": (["analysis_pivots", "stat_tests"], bench_statistics),
+    "dashboard": (["app", "page_data", "pages.map_view"], bench_dashboard),   # map_view需在app实例化后导入
+}
+
+
+# -------------------------- 4. 子进程：运行单个(阶段, 倍数) --------------------------
+def run_one(stage: str, scale: int) -> Dict:
+    import importlib
+    from synthetic_data import load_synthetic
+    modules, func = STAGES[stage]
+    sys.path.insert(0, DASH_DIR)
+    for module in modules:
+        importlib.import_module(module)
+    start = time.perf_counter()
+    df = load_synthetic(scale)
+    load_s = round(time.perf_counter() - start, 3)
+    result = measure(func, df)
+    return {"stage": stage, "scale": scale, "status": "ok", "load_s": load_s, **result}
+
+
+def run_isolated(stage: str, scale: int) -> Dict:
+    """在独立子进程中运行，结果为子进程标准输出的最后一行JSON"""
+    env = dict(os.environ, MPLBACKEND="Agg", PYTHONIOENCODING="utf-8")
+    try:
+        proc = subprocess.run([sys.executable, os.path.abspath(__file__), stage, str(scale)], cwd=BENCH_DIR,
+                              env=env, capture_output=True, text=True, encoding="utf-8", timeout=STAGE_TIMEOUT_S)
+    except subprocess.TimeoutExpired:
+        return {"stage": stage, "scale": scale, "status": "timeout"}
+    lines = proc.stdout.strip().splitlines()
+    if proc.returncode != 0 or not lines:
+        return {"stage": stage, "scale": scale, "status": "failed", "error": proc.stderr.strip()[-2000:]}
+    return json.loads(lines[-1])
+
+
+# -------------------------- 5. 报告与基线对比 --------------------------
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment() -> Dict:
+    import numpy
+    import pandas
+    import sklearn
+    return {"python": platform.python_version(), "platform": platform.platform(), "cpu_count": os.cpu_count(),
+            "numpy": numpy.__version__, "pandas": pandas.__version__, "sklearn": sklearn.__version__,
+            "git_commit": _git_commit()}
+
+
+def compare(results: List[Dict], baseline: Dict) -> List[Dict]:
+    """与基线逐项对比墙钟耗时与内存增量，比值超过REGRESSION_THRESHOLD的记为回退"""
+    old = {(r["stage"], r["scale"]): r for r in baseline.get("results", []) if r.get("status") == "ok"}
+    rows = []
+    for r in results:
+        prev = old.get((r["stage"], r["scale"]))
+        if r.get("status") != "ok" or prev is None:
+            continue
+        for metric, floor in (("wall_s", REGRESSION_MIN_S), ("peak_delta_mb", REGRESSION_MIN_MB)):
+            if prev.get(metric) is None or r.get(metric) is None or prev[metric] < floor:
+                continue
+            ratio = r[metric] / prev[metric]
+            rows.append({"stage": r["stage"], "scale": r["scale"], "metric": metric, "baseline": prev[metric],
+                         "current": r[metric], "ratio": round(ratio, 3), "regression": ratio > REGRESSION_THRESHOLD})
+    return rows
+
+
+def run_benchmarks(scales: List[int], stages: List[str], report_path: Optional[str] = None) -> Dict:
+    """生成（或复用）各倍数的合成数据，逐个运行(阶段, 倍数)，写出JSON报告并返回"""
+    from synthetic_data import ensure_synthetic
+    datasets = {}
+    for scale in scales:
+        info = ensure_synthetic(scale)
+        datasets[str(scale)] = {"rows": info["rows"], "generate_s": info["generate_s"],
+                                "path": os.path.relpath(info["path"], BASE_DIR)}
+        print(f"合成数据×{scale}：{info['rows']}行")
+
+    results = []
+    for scale in scales:
+        for stage in stages:
+            result = run_isolated(stage, scale)
+            results.append(result)
+            if result["status"] == "ok":
+                print(f"  {stage:<11}×{scale:<5} {result['wall_s']:>9.2f}秒  {result['rows_per_s']:>11.1f}行/秒  "
+                      f"内存增量{result.get('peak_delta_mb', 'NA')}MB")
+            else:
+                print(f"  {stage:<11}×{scale:<5} {result['status']}")
+
+    report = {"created": datetime.now().isoformat(timespec="seconds"), "environment": environment(),
+              "config": {"stub_latency_s": STUB_LATENCY_S, "kmeans_range": [KMEANS_RANGE.start, KMEANS_RANGE.stop],
+                         "lda_topics": LDA_TOPICS, "lda_max_iter": LDA_MAX_ITER},
+              "datasets": datasets, "results": results}
+    if os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH, encoding="utf-8") as f:
+            report["comparison"] = compare(results, json.load(f))
+
+    os.makedirs(REPORT_DIR, exist_ok=True)
+    report_path = report_path or os.path.join(REPORT_DIR, f"benchmark_{datetime.now():%Y%m%d_%H%M%S}.json")
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    report["path"] = report_path
+    return report
+
+
+# -------------------------- 6. 运行入口 --------------------------
+if __name__ == "__main__":
+    if len(sys.argv) == 3:
+        print(json.dumps(run_one(sys.argv[1], int(sys.argv[2])), ensure_ascii=False))
+        raise SystemExit(0)
+
+    SCALES = [10, 100, 1000]   # 合成数据相对真实数据（约5.5k条）的倍数
+    BENCH_STAGES = list(STAGES)  # 只测部分阶段时修改，如["clustering", "dashboard"]
+
+    report = run_benchmarks(SCALES, BENCH_STAGES)
+    regressions = [c for c in report.get("comparison", []) if c["regression"]]
+    for c in regressions:
+        print(f"⚠ 回退：{c['stage']}×{c['scale']} {c['metric']} {c['baseline']} → {c['current']}（{c['ratio']}倍）")
+    if "comparison" in report and not regressions:
+        print("与基线相比无回退")
+    print(f"报告已保存到：{report['path']}")
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+功能：模拟DeepSeek chat接口的本地桩服务器（基准测试用，不消耗API额度）
+解析情感分析的请求（单条或多条打包的提示词），按文本哈希返回确定的情感结果；可设置每次请求的延迟与出错比例
+运行：python stub_llm_server.py [端口]，ds情感分析.py的DEEPSEEK_API_URL指向 http://127.0.0.1:端口/v1/chat/completions
+GET /stats 返回已处理的请求数与message条数
+"""
+
+import hashlib
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# -------------------------- 1. 基础配置 --------------------------
+STUB_HOST = "127.0.0.1"
+STUB_PORT = 8000
+LATENCY_S = float(os.environ.get("STUB_LATENCY_S", "0.02"))        # 每次请求的模拟延迟（秒）
+ERROR_RATE = float(os.environ.get("STUB_ERROR_RATE", "0"))         # 返回503的请求比例（测试重试路径）
+
+# 情感类型 → 情感倾向（与ds情感分析.py的ALLOWED_EMOTIONS一致）
+EMOTION_SENTIMENT = {"愉悦": "正面", "怀旧": "正面", "悲伤": "负面", "烦躁": "负面", "失望": "负面", "无情绪": "中性"}
+EMOTIONS = list(EMOTION_SENTIMENT)
+
+_BATCH_MARKER = "待分析列表：\n"
+_SINGLE_PATTERN = re.compile(r"id：(.*)\nmessage：(.*?)\n\n仅返回JSON", re.S)
+
+
+# -------------------------- 2. 模拟结果 --------------------------
+def fake_emotion(message: str) -> dict:
+    """同一文本总是得到同一结果"""
+    h = int(hashlib.md5(message.encode("utf-8")).hexdigest()[:8], 16)
+    emotion = EMOTIONS[h % len(EMOTIONS)]
+    intensity = 0 if emotion == "无情绪" else 1 + (h >> 8) % 10
+    return {"sentiment": EMOTION_SENTIMENT[emotion], "intensity": intensity, "emotion_type": emotion}
+
+
+def answer(prompt: str):
+    """提示词 → (模型输出文本, message条数)"""
+    if _BATCH_MARKER in prompt:
+        items = json.loads(prompt.split(_BATCH_MARKER, 1)[1].split("\n", 1)[0])
+        return json.dumps([{"id": item["id"], **fake_emotion(item["message"])} for item in items],
+                          ensure_ascii=False), len(items)
+    match = _SINGLE_PATTERN.search(prompt)
+    return json.dumps(fake_emotion(match.group(2) if match else prompt), ensure_ascii=False), 1
+
+
+# -------------------------- 3. HTTP服务 --------------------------
+class StubHandler(BaseHTTPRequestHandler):
+    stats = {"requests": 0, "messages": 0, "errors": 0}
+    lock = threading.Lock()
+
+    def _send_json(self, status: int, body: dict, headers=()):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in headers:
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        with self.lock:
+            self._send_json(200, dict(self.stats))
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        time.sleep(LATENCY_S)
+        if ERROR_RATE and random.random() < ERROR_RATE:
+            with self.lock:
+                self.stats["errors"] += 1
+            self._send_json(503, {"error": "stub overloaded"}, headers=[("Retry-After", "0")])
+            return
+        content, n_messages = answer(payload["messages"][-1]["content"])
+        with self.lock:
+            self.stats["requests"] += 1
+            self.stats["messages"] += n_messages
+        self._send_json(200, {"choices": [{"message": {"role": "assistant", "content": content}}]})
+
+    def log_message(self, format, *args):
+        pass  # 不逐条打印请求日志
+
+
+def serve(port: int = STUB_PORT, host: str = STUB_HOST):
+    server = ThreadingHTTPServer((host, port), StubHandler)
+    server.daemon_threads = True
+    print(f"桩服务器已启动：http://{host}:{port}/v1/chat/completions（延迟{LATENCY_S}秒）", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+# -------------------------- 4. 运行入口 --------------------------
+if __name__ == "__main__":
+    serve(int(sys.argv[1]) if len(sys.argv) > 1 else STUB_PORT)
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""
+功能：合成南京签到数据生成器（基准测试用）
+以真实的情感分析结果表为模板按倍数放大：每条合成签到从真实表中有放回地抽一行，保留该行的日期、天气、
+景区类型与情感字段（各字段的联合分布与真实数据一致）；每个真实景区复制为scale个合成景区，复制出的景区
+落在随机抽取的Nanjing_AOI面上（坐标不超出AOI范围）；message由真实微博的分句随机拼接而成（中文文本，重复率低）
+"""
+
+import hashlib
+import os
+import re
+import sys
+import time
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+# -------------------------- 1. 基础配置 --------------------------
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BASE_DIR, "code"))
+
+from data_store import load_table, table_fingerprint  # noqa: E402
+from spatial_fusion import AoiIndex  # noqa: E402
+
+SYNTHETIC_DIR = os.path.join(BASE_DIR, "data", "processed_data", "benchmark")
+GENERATOR_VERSION = "v1"    # 生成方式改变时修改，旧的合成数据自然失效
+CHUNK_ROWS = 500_000        # 每块生成的行数（控制临时数组大小）
+MAX_CLAUSES = 6             # 每条message最多拼接的分句数
+RANDOM_STATE = 2023
+
+_CLAUSE_SPLIT = re.compile(r"[。！？!?；;，,、\s]+")
+
+
+# -------------------------- 2. 模板 --------------------------
+def _clause_pool(messages: pd.Series):
+    """真实微博拆成分句：返回去重后的分句池与每条微博的分句数（用于抽样拼接长度）"""
+    pieces = [[c for c in _CLAUSE_SPLIT.split(str(m)) if c] for m in messages.dropna()]
+    pool = np.array(sorted({c for p in pieces for c in p}), dtype=object)
+    counts = np.clip([len(p) for p in pieces if p], 1, MAX_CLAUSES)
+    return pool, np.asarray(counts, dtype=np.int64)
+
+
+def _clone_categories(values: pd.Series, scale: int) -> list:
+    """每个类别复制scale份：第0份保留原名，其余加“·序号”后缀；编码 = 原编码 × scale + 副本号"""
+    return [name if j == 0 else f"{name}·{j}" for name in map(str, values.cat.categories) for j in range(scale)]
+
+
+# -------------------------- 3. 生成 --------------------------
+def generate_checkins(scale: int, random_state: int = RANDOM_STATE, template: Optional[pd.DataFrame] = None,
+                      aoi: Optional[AoiIndex] = None) -> pd.DataFrame:
+    """生成 len(模板) × scale 行的合成签到表（列与类型同data_store的emotion表）"""
+    template = load_table("emotion") if template is None else template
+    template = template[template["name"].notna()].reset_index(drop=True)
+    aoi = AoiIndex() if aoi is None else aoi
+    rng = np.random.default_rng(random_state)
+
+    pool, clause_counts = _clause_pool(template["message"])
+    bbox = aoi.bbox[~np.isnan(aoi.bbox).any(axis=1)]
+    centers = (bbox[:, :2] + bbox[:, 2:]) / 2
+    low, high = bbox[:, :2].min(axis=0), bbox[:, 2:].max(axis=0)
+    name_codes = template["name"].cat.codes.to_numpy().astype(np.int64)
+
+    # 真实景区的签到中心；复制出的景区（副本号>0）整体平移到随机AOI面的外包框中心
+    spot_center = template.groupby("name", observed=False)[["lon", "lat"]].mean().to_numpy()
+    shift = centers[rng.integers(len(centers), size=(len(spot_center), scale))] - spot_center[:, None, :]
+    shift[:, 0] = 0.0
+
+    categories = {col: _clone_categories(template[col], scale) for col in ("name", "poiid", "uid")}
+    n_rows = len(template) * scale
+    chunks = []
+    for start in range(0, n_rows, CHUNK_ROWS):
+        n = min(CHUNK_ROWS, n_rows - start)
+        rows = rng.integers(len(template), size=n)
+        clone = rng.integers(scale, size=n)
+        chunk = template.iloc[rows].reset_index(drop=True)
+
+        for col in ("name", "poiid", "uid"):
+            codes = chunk[col].cat.codes.to_numpy().astype(np.int64)
+            chunk[col] = pd.Categorical.from_codes(np.where(codes >= 0, codes * scale + clone, -1),
+                                                   categories=categories[col])
+        offset = shift[name_codes[rows], clone]
+        chunk["lon"] = np.clip(chunk["lon"].to_numpy() + offset[:, 0], low[0], high[0])
+        chunk["lat"] = np.clip(chunk["lat"].to_numpy() + offset[:, 1], low[1], high[1])
+
+        k = clause_counts[rng.integers(len(clause_counts), size=n)]
+        picks = pool[rng.integers(len(pool), size=(n, MAX_CLAUSES))]
+        chunk["message"] = pd.array(["，".join(p[:m]) for p, m in zip(picks, k)], dtype="string")
+        chunk["mid"] = pd.array((5_000_000_000_000_000 + start + np.arange(n)).astype(str), dtype="string")
+        chunk["userid"] = pd.array((6_000_000_000 + rng.integers(template["userid"].nunique() * scale, size=n))
+                                   .astype(str), dtype="string")
+        chunks.append(chunk)
+    return pd.concat(chunks, ignore_index=True)
+
+
+# -------------------------- 4. 合成数据缓存 --------------------------
+def synthetic_path(scale: int, random_state: int = RANDOM_STATE) -> str:
+    """合成数据的Parquet路径；生成器版本或模板表改变时路径随之改变"""
+    key = f"{GENERATOR_VERSION}|{table_fingerprint('emotion')}|{random_state}"
+    digest = hashlib.sha1(key.encode("utf-8")).hexdigest()[:10]
+    return os.path.join(SYNTHETIC_DIR, f"synthetic_x{scale}_{digest}.parquet")
+
+
+def ensure_synthetic(scale: int, random_state: int = RANDOM_STATE) -> dict:
+    """合成数据不存在时生成并保存，返回路径、行数与生成耗时（已存在时耗时为None）"""
+    path = synthetic_path(scale, random_state)
+    if os.path.exists(path):
+        import pyarrow.parquet as pq
+        return {"path": path, "rows": pq.ParquetFile(path).metadata.num_rows, "generate_s": None}
+    start = time.perf_counter()
+    df = generate_checkins(scale, random_state)
+    os.makedirs(SYNTHETIC_DIR, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    df.to_parquet(tmp_path, engine="pyarrow", index=False, compression="zstd")
+    os.replace(tmp_path, path)
+    return {"path": path, "rows": len(df), "generate_s": round(time.perf_counter() - start, 3)}
+
+
+def load_synthetic(scale: int, random_state: int = RANDOM_STATE, columns=None) -> pd.DataFrame:
+    return pd.read_parquet(ensure_synthetic(scale, random_state)["path"], engine="pyarrow", columns=columns)
+
+
+# -------------------------- 5. 运行入口 --------------------------
+if __name__ == "__main__":
+    SCALES = [10, 100, 1000]
+    for scale in SCALES:
+        info = ensure_synthetic(scale)
+        print(f"×{scale}：{info['rows']}行 → {info['path']}"
+              + (f"（生成耗时{info['generate_s']}秒）" if info["generate_s"] is not None else "（已存在）"))
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+功能：天气-景区-情感交叉分析的透视计算（与描述性统计笔记本同一口径）
+全部基于groupby/透视表的向量化计算，输出小表；仪表盘页面、静态图导出等只负责把这些小表画出来
+"""
+
+from collections import Counter
+from typing import Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from scenic_features import sentiment_direction
+from tokenize_cache import STOPWORDS, filter_tokens, tokenize_messages
+
+# -------------------------- 1. 分析口径 --------------------------
+TYPICAL_WEATHER = ["晴", "雾~晴", "多云~小雨"]   # 典型天气（晴/雾~晴/雨天）
+
+
+def add_analysis_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """合成情感得分（方向×强度），并按降水/能见度/原始天气细分天气类型"""
+    df = df.copy()
+    df["sentiment_dir"] = sentiment_direction(df["sentiment"])
+    df["sentiment_score"] = df["sentiment_dir"] * df["intensity"]
+    # 无天气记录的签到与笔记本口径一致：计为无降水天、高能见度，原始天气类型保持缺失（不参与该维度分组）
+    df["是否降水"] = df["降水"].map({True: "降水天", False: "无降水天"}).fillna("无降水天")
+    df["能见度等级"] = df["低能见度"].map({True: "低能见度", False: "高能见度"}).fillna("高能见度")
+    df["原始天气类型"] = df["天气"].astype("string")
+    if "emotion_type" in df.columns and isinstance(df["emotion_type"].dtype, pd.CategoricalDtype):
+        df["emotion_type"] = df["emotion_type"].cat.remove_unused_categories()
+    return df
+
+
+# -------------------------- 2. 透视计算 --------------------------
+def mean_pivot(df: pd.DataFrame, index: str, columns, values: str = "sentiment_score") -> pd.DataFrame:
+    """index × columns 的均值透视表（如 景区类型×天气 的平均情感得分）"""
+    return df.pivot_table(index=index, columns=columns, values=values, aggfunc="mean", observed=True)
+
+
+def share_pivot(df: pd.DataFrame, index: str, columns: str) -> pd.DataFrame:
+    """index × columns 的行内占比（每行合计为1）"""
+    counts = df.groupby([index, columns], observed=True).size().unstack(fill_value=0)
+    return counts.div(counts.sum(axis=1), axis=0)
+
+
+def group_mean_ci(df: pd.DataFrame, x: str, hue: str, values: str = "sentiment_score") -> pd.DataFrame:
+    """x × hue 分组的均值及95%置信区间半宽（正态近似，对应分组柱状图的误差线）"""
+    stats = df.groupby([x, hue], observed=True)[values].agg(["mean", "std", "count"]).reset_index()
+    stats["ci95"] = 1.96 * stats["std"].fillna(0) / np.sqrt(stats["count"])
+    return stats
+
+
+def box_stats(df: pd.DataFrame, by: str, values: str = "sentiment_score") -> pd.DataFrame:
+    """各组箱线图统计量：四分位数 + 1.5倍IQR内的上下须（与seaborn箱线图一致）"""
+    grouped = df.groupby(by, observed=True)[values]
+    stats = grouped.quantile([0.25, 0.5, 0.75]).unstack()
+    stats.columns = ["q1", "median", "q3"]
+    iqr = stats["q3"] - stats["q1"]
+    low = df[by].map(stats["q1"] - 1.5 * iqr).astype(float)
+    high = df[by].map(stats["q3"] + 1.5 * iqr).astype(float)
+    inside = df[values].where((df[values] >= low) & (df[values] <= high))
+    stats["lowerfence"] = inside.groupby(df[by], observed=True).min()
+    stats["upperfence"] = inside.groupby(df[by], observed=True).max()
+    return stats
+
+
+def top_emotion_intensity(df: pd.DataFrame, top_n: int = 3) -> pd.DataFrame:
+    """三维交叉：景区类型 × (天气, TOP-N情感类型) 的平均强度"""
+    top_emotions = df["emotion_type"].value_counts().index[:top_n]
+    subset = df[df["emotion_type"].isin(top_emotions)]
+    return mean_pivot(subset, "tag5", ["原始天气类型", "emotion_type"], values="intensity")
+
+
+def emotion_mean_intensity(df: pd.DataFrame) -> pd.Series:
+    """各情感类型的平均强度（按强度降序）"""
+    return df.groupby("emotion_type", observed=True)["intensity"].mean().sort_values(ascending=False)
+
+
+# -------------------------- 3. 文本关键词 --------------------------
+def top_keywords(texts: Iterable[str], mids: Optional[Iterable] = None, top_n: int = 20,
+                 stopwords=STOPWORDS, n_workers: Optional[int] = None) -> List[tuple]:
+    """统计高频词（分词结果来自统一分词阶段的缓存；过滤停用词与单字）
+    n_workers：缓存未命中时的分词进程数（None为全部CPU核；Web worker中传1，不在请求里启动进程池）"""
+    tokens = tokenize_messages(list(texts), None if mids is None else list(mids), n_workers)
+    return Counter(w for doc in tokens for w in filter_tokens(doc, stopwords)).most_common(top_n)
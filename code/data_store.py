@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+功能：处理后数据的统一读写层（列式Parquet快照）
+各阶段产出的CSV只在首次读取（或CSV更新后）转换一次：统一类型、分类编码、天气字段解析、情感类别校验，
+之后所有脚本/页面/笔记本都通过load_table读取，支持只读部分列（列投影）和按条件过滤（谓词下推）
+"""
+
+import os
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from weather_fusion import (DAILY_WEATHER_CSV_PATH, FUSED_ENCODING, add_weather_features, join_weather,
+                            load_daily_weather)
+
+# -------------------------- 1. 路径与表定义 --------------------------
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROCESSED_DIR = os.path.join(BASE_DIR, "data", "processed_data")
+PARQUET_DIR = os.path.join(PROCESSED_DIR, "parquet")
+
+TABLES: Dict[str, Dict] = {
+    # 表名: 源CSV、编码、转换时调用的整理函数名、是否关联每日天气表（天气表更新后快照需重建）
+    "fused": {"csv": os.path.join(PROCESSED_DIR, "南京景区-天气-社媒情感融合表.csv"), "encoding": FUSED_ENCODING,
+              "prepare": "prepare_checkin_frame", "weather": True},
+    "emotion": {"csv": os.path.join(PROCESSED_DIR, "情感分析结果（限制情感大类）.csv"), "encoding": "utf-8-sig",
+                "prepare": "prepare_emotion_frame", "weather": True},
+    "clusters": {"csv": os.path.join(PROCESSED_DIR, "景区聚类结果.csv"), "encoding": "utf-8-sig",
+                 "prepare": "prepare_cluster_frame"},
+    "weather": {"csv": DAILY_WEATHER_CSV_PATH, "encoding": "utf-8-sig", "prepare": None},
+}
+
+VALID_EMOTION_TYPES = ["愉悦", "无情绪", "怀旧", "失望", "悲伤", "烦躁"]
+INVALID_EMOTION_LABEL = "中性"   # 不在VALID_EMOTION_TYPES中的情感类型统一标记为“中性”
+SENTIMENT_ORDER = ["正面", "中性", "负面"]
+CATEGORY_COLUMNS = ["name", "tag1", "tag2", "tag3", "tag4", "tag5", "tag5.1", "poiid", "uid"]
+
+
+# -------------------------- 2. 类型整理（只在生成快照时做一次） --------------------------
+def _clean_id(values: pd.Series) -> pd.Series:
+    return values.astype("string").str.strip()
+
+
+def _restore_mid(df: pd.DataFrame) -> pd.Series:
+    """旧CSV经Excel保存后mid变成科学计数法（4.97E+15）丢失精度：
+    若与融合表逐行对应（行数、userid一致），从融合表取回原始mid"""
+    if df["mid"].dtype.kind != "f":
+        return _clean_id(df["mid"])
+    fused_csv = TABLES["fused"]["csv"]
+    if os.path.exists(fused_csv):
+        ids = pd.read_csv(fused_csv, encoding=TABLES["fused"]["encoding"], usecols=["mid", "userid"],
+                          dtype={"mid": str, "userid": str})
+        if len(ids) == len(df) and (_clean_id(ids["userid"]).to_numpy() == _clean_id(df["userid"]).to_numpy()).all():
+            return _clean_id(ids["mid"])
+    print("提示：mid已丢失精度且无法从融合表恢复，按整数格式保存")
+    return pd.Series([format(v, ".0f") if pd.notna(v) else pd.NA for v in df["mid"]], dtype="string")
+
+
+def prepare_checkin_frame(df: pd.DataFrame, daily_weather: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+    """签到/融合表通用整理：id转字符串、经纬度float64、景区字段分类编码、天气字段解析为带类型列"""
+    df = df.copy()
+    if "mid" in df.columns:
+        df["mid"] = _restore_mid(df)
+    for col in ["userid"]:
+        if col in df.columns:
+            df[col] = _clean_id(df[col])
+    for col in ["lon", "lat"]:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors="coerce").astype(np.float64)
+    for col in CATEGORY_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype("string").astype("category")
+    if "message" in df.columns:
+        df["message"] = df["message"].astype("string")
+    if "ts_created" in df.columns and "天气" in df.columns:
+        df = add_weather_features(df, daily_weather)
+    elif "ts_created" in df.columns and daily_weather is not None:
+        df = join_weather(df, daily_weather)   # 紧凑融合表（COMPACT_OUTPUT）不含天气列：按日期从每日天气表关联
+    return df
+
+
+def prepare_emotion_frame(df: pd.DataFrame, daily_weather: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+    """情感分析结果整理：在签到整理基础上，intensity转0-10整数、情感类别校验并分类编码"""
+    df = prepare_checkin_frame(df, daily_weather)
+    df["intensity"] = pd.to_numeric(df["intensity"], errors="coerce").fillna(0).clip(0, 10).astype(np.int8)
+    emotion = df["emotion_type"].where(df["emotion_type"].isin(VALID_EMOTION_TYPES), INVALID_EMOTION_LABEL)
+    df["emotion_type"] = pd.Categorical(emotion, categories=VALID_EMOTION_TYPES + [INVALID_EMOTION_LABEL])
+    known = list(SENTIMENT_ORDER)
+    extra = sorted(set(df["sentiment"].dropna().unique()) - set(known))  # 保留模型偶发的非常规取值，便于排查
+    df["sentiment"] = pd.Categorical(df["sentiment"], categories=known + extra)
+    return df
+
+
+def prepare_cluster_frame(df: pd.DataFrame, daily_weather: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+    df = df.copy()
+    for col in ["景区名称", "主要类型"]:
+        if col in df.columns:
+            df[col] = df[col].astype("string").astype("category")
+    return df
+
+
+# -------------------------- 3. 快照读写 --------------------------
+def table_path(name: str) -> str:
+    return os.path.join(PARQUET_DIR, f"{name}.parquet")
+
+
+def write_table(df: pd.DataFrame, name: str) -> str:
+    """把已整理好类型的表写成Parquet快照（分类列以字典编码存储）"""
+    os.makedirs(PARQUET_DIR, exist_ok=True)
+    path = table_path(name)
+    tmp_path = f"{path}.{os.getpid()}.tmp"   # 并行运行的多个阶段可能同时重建同一快照
+    df.to_parquet(tmp_path, engine="pyarrow", index=False, compression="zstd")
+    os.replace(tmp_path, path)
+    return path
+
+
+def is_stale(name: str) -> bool:
+    """快照不存在，或源CSV（关联天气的表还有每日天气表）比快照新时需要重建"""
+    path = table_path(name)
+    if not os.path.exists(path):
+        return True
+    sources = [TABLES[name]["csv"]] + ([DAILY_WEATHER_CSV_PATH] if TABLES[name].get("weather") else [])
+    return any(os.path.exists(p) and os.path.getmtime(p) > os.path.getmtime(path) for p in sources)
+
+
+def build_table(name: str) -> pd.DataFrame:
+    """从源CSV整理类型并写出快照"""
+    spec = TABLES[name]
+    if name == "weather":
+        df = load_daily_weather(spec["csv"])
+    else:
+        df = pd.read_csv(spec["csv"], encoding=spec["encoding"])
+        daily_weather = load_daily_weather() if os.path.exists(DAILY_WEATHER_CSV_PATH) else None
+        df = globals()[spec["prepare"]](df, daily_weather)
+    write_table(df, name)
+    return df
+
+
+def load_table(name: str, columns: Optional[List[str]] = None, filters: Optional[List] = None) -> pd.DataFrame:
+    """读取处理后的表（自动按需重建快照）
+    columns：只读取这些列；filters：pyarrow过滤条件，如[("天气分类", "==", "雨"), ("intensity", ">=", 5)]"""
+    if name not in TABLES:
+        raise KeyError(f"未知的数据表：{name}（可选：{', '.join(TABLES)}）")
+    if is_stale(name):
+        build_table(name)
+    return pd.read_parquet(table_path(name), engine="pyarrow", columns=columns, filters=filters)
+
+
+def table_fingerprint(name: str) -> str:
+    """表的数据指纹（快照大小+修改时间）：源CSV更新后快照重建，指纹随之改变，可作为下游缓存的失效依据"""
+    if is_stale(name):
+        build_table(name)
+    stat = os.stat(table_path(name))
+    return f"{stat.st_size:x}-{stat.st_mtime_ns:x}"
+
+
+def refresh_all():
+    """重建所有源CSV存在的表的快照"""
+    for name, spec in TABLES.items():
+        if os.path.exists(spec["csv"]):
+            df = build_table(name)
+            print(f"{name}: {len(df)}行 → {table_path(name)}")
+
+
+# -------------------------- 4. 运行入口 --------------------------
+if __name__ == "__main__":
+    refresh_all()
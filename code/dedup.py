@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+"""
+功能：近重复message合并（MinHash-LSH，复杂度近似线性）
+每条文本（去掉标点、表情与空白后）取字符n-gram集合，计算NUM_PERM个MinHash值；签名分成BANDS段，至少一段完全相同的文本才成为候选对，
+候选对的估计Jaccard相似度（MinHash值相同的比例）不低于阈值即视为近重复。按出现顺序贪心聚簇：尚未归簇的文本自成一簇并作为代表，
+只有与代表本身相似度达到阈值的文本才并入该簇（近重复关系不传递，A~B、B~C不会把A、C并在一起）。每簇只处理代表文本，结果回填给簇内所有文本：情感分析（label_messages）只为代表文本请求API，分词（tokenize_messages）只为代表文本分词
+"""
+
+import re
+import time
+import unicodedata
+from typing import Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+# -------------------------- 1. 基础配置 --------------------------
+SIMILARITY_THRESHOLD = 0.9      # 字符n-gram集合的Jaccard相似度不低于该值视为近重复；设为None只合并去标点后完全相同的文本
+NGRAM_SIZE = 2                  # 字符2-gram（中文短文本的一个词大多为两个字）
+MIN_CHARS = 6                   # 去标点后短于该长度的文本只合并完全相同的（短文本改一个字相似度就大幅下降，容易误合并）
+NUM_PERM = 64                   # MinHash个数
+BANDS = 16                      # LSH分段数（每段NUM_PERM/BANDS=4个值）；相似度0.7的文本对成为候选的概率约98%，0.9时接近100%
+CHUNK_CHARS = 500_000           # 计算MinHash时每块的字符数（控制临时数组大小）
+BLOCK_ELEMENTS = 4_000_000      # 桶内两两比较时每块的最大元素数
+RANDOM_STATE = 2023
+
+_NON_WORD = re.compile(r"[\W_]+")
+
+
+# -------------------------- 2. MinHash签名 --------------------------
+def clean_for_dedup(text) -> str:
+    """全角转半角、转小写，只保留中文、字母、数字"""
+    return _NON_WORD.sub("", unicodedata.normalize("NFKC", str(text)).lower())
+
+
+def _shingles(texts: Sequence[str]):
+    """所有文本的字符n-gram（按文本依次排列，n-gram编号 = 各字符码位拼接），以及每条文本的起始位置"""
+    lengths = np.fromiter((len(t) for t in texts), np.int64, len(texts))
+    codes = np.frombuffer("".join(texts).encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+    ends = np.cumsum(lengths)
+    counts = np.maximum(lengths - NGRAM_SIZE + 1, 0)
+    # 每条文本第k个n-gram在codes中的起点：文本起点 + k
+    starts = np.repeat(ends - lengths, counts) + (np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts))
+    shingles = np.zeros(len(starts), dtype=np.uint64)
+    for k in range(NGRAM_SIZE):
+        shingles = (shingles << np.uint64(21)) | codes[starts + k]   # Unicode码位不超过21位
+    return shingles, np.r_[0, np.cumsum(counts)]
+
+
+def minhash(texts: Sequence[str], num_perm: int = NUM_PERM, random_state: int = RANDOM_STATE) -> np.ndarray:
+    """批量计算MinHash签名（len(texts)×num_perm的uint32矩阵，文本需不短于NGRAM_SIZE）
+    哈希函数为乘法移位哈希：(a·x+b) mod 2^64 的高32位，a为随机奇数"""
+    texts = list(texts)
+    rng = np.random.default_rng(random_state)
+    a = (rng.integers(0, 2 ** 63, size=num_perm, dtype=np.uint64) * np.uint64(2) + np.uint64(1))[:, None]
+    b = rng.integers(0, 2 ** 63, size=num_perm, dtype=np.uint64)[:, None]
+
+    signatures = np.empty((num_perm, len(texts)), dtype=np.uint32)
+    cum_chars = np.cumsum([len(t) for t in texts])
+    start = 0
+    while start < len(texts):
+        # 按字符数分块：块内所有n-gram × num_perm个哈希值，再按文本取最小
+        done = cum_chars[start - 1] if start else 0
+        stop = max(int(np.searchsorted(cum_chars, done + CHUNK_CHARS, side="right")), start + 1)
+        shingles, offsets = _shingles(texts[start:stop])
+        with np.errstate(over="ignore"):
+            hashes = ((a * shingles[None, :] + b) >> np.uint64(32)).astype(np.uint32)
+        signatures[:, start:stop] = np.minimum.reduceat(hashes, offsets[:-1], axis=1)
+        start = stop
+    return np.ascontiguousarray(signatures.T)
+
+
+# -------------------------- 3. LSH分桶与聚簇 --------------------------
+def _band_keys(signatures: np.ndarray, band: int, rows_per_band: int) -> np.ndarray:
+    """一段MinHash值合成一个64位桶键（不同段值偶尔撞键也没关系，候选对还要核对相似度）"""
+    key = np.zeros(len(signatures), dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        for col in signatures[:, band * rows_per_band:(band + 1) * rows_per_band].T:
+            key = (key ^ col.astype(np.uint64)) * np.uint64(0x100000001B3)
+    return key
+
+
+def _near_pairs(signatures: np.ndarray, threshold: float, bands: int = BANDS):
+    """估计Jaccard相似度不低于threshold的文本对（行号数组i、j，i<j）"""
+    rows_per_band = signatures.shape[1] // bands
+    pairs_i, pairs_j = [], []
+    for band in range(bands):
+        keys = _band_keys(signatures, band, rows_per_band)
+        order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+        starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+        ends = np.r_[starts[1:], len(order)]
+        for start, end in zip(starts[ends - starts > 1], ends[ends - starts > 1]):
+            bucket = order[start:end]
+            step = max(1, BLOCK_ELEMENTS // (len(bucket) * signatures.shape[1]))
+            for k in range(0, len(bucket), step):
+                rows = bucket[k:k + step]
+                similarity = (signatures[rows][:, None, :] == signatures[bucket][None, :, :]).mean(axis=2)
+                i, j = np.nonzero(similarity >= threshold)
+                keep = rows[i] < bucket[j]   # 每对只保留一次（也去掉与自身的比较）
+                pairs_i.append(rows[i][keep])
+                pairs_j.append(bucket[j][keep])
+    if not pairs_i:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    return np.concatenate(pairs_i), np.concatenate(pairs_j)
+
+
+def _leader_clusters(n: int, pair_i: np.ndarray, pair_j: np.ndarray) -> np.ndarray:
+    """贪心代表聚簇：按行号从小到大，尚未归簇的行作为代表，把与它直接相似且尚未归簇的行并入；返回每行的代表行号"""
+    leaders = np.arange(n)
+    order = np.lexsort((pair_j, pair_i))
+    pair_i, pair_j = pair_i[order], pair_j[order]
+    starts = np.flatnonzero(np.r_[True, pair_i[1:] != pair_i[:-1]]) if len(pair_i) else np.empty(0, dtype=np.int64)
+    for start, end in zip(starts, np.r_[starts[1:], len(pair_i)]):
+        leader = pair_i[start]
+        if leaders[leader] != leader:   # 已并入更早的簇，不再作为代表
+            continue
+        members = pair_j[start:end]
+        members = members[leaders[members] == members]   # pair_j > leader，未归簇的行其值等于自身
+        leaders[members] = leader
+    return leaders
+
+
+def near_duplicate_groups(texts: Sequence[str], threshold: Optional[float] = SIMILARITY_THRESHOLD) -> np.ndarray:
+    """返回每条文本所在簇的代表行号（簇内最先出现的一条，代表行的值等于自身行号）
+    threshold=None时只合并去标点后完全相同的文本；去标点后为空的文本（只有表情、符号）只合并原文完全相同的"""
+    raw_codes, raw_texts = pd.factorize(pd.Series([str(t) for t in texts], dtype=object))
+    keys = [clean_for_dedup(t) or f"#{t}" for t in raw_texts]   # “#”前缀：原文键不会与去标点后的键（只含字母数字）相同
+    key_codes, unique_texts = pd.factorize(pd.Series(keys, dtype=object))
+    text_codes = key_codes[raw_codes]
+    n_texts = len(unique_texts)
+    labels = np.arange(n_texts)
+
+    long_enough = np.flatnonzero(np.fromiter((len(t) >= MIN_CHARS and not t.startswith("#") for t in unique_texts),
+                                             bool, n_texts))
+    if threshold is not None and len(long_enough) > 1:
+        i, j = _near_pairs(minhash(unique_texts[long_enough]), threshold)
+        # unique_texts按首次出现排序，行号小的代表即簇内最先出现的文本
+        labels[long_enough] = n_texts + _leader_clusters(len(long_enough), i, j)   # 与其他文本的标签错开
+
+    row_labels = labels[text_codes]
+    first_row = np.full(row_labels.max() + 1 if len(row_labels) else 0, len(row_labels), dtype=np.int64)
+    np.minimum.at(first_row, row_labels, np.arange(len(row_labels)))
+    return first_row[row_labels]
+
+
+def reduction_ratio(representatives: np.ndarray) -> float:
+    """合并后减少的比例：1 - 簇数/总条数"""
+    if len(representatives) == 0:
+        return 0.0
+    return 1 - len(np.unique(representatives)) / len(representatives)
+
+
+# -------------------------- 4. 运行入口 --------------------------
+if __name__ == "__main__":
+    from data_store import load_table
+
+    THRESHOLDS = [None, 0.9, 0.8, 0.7, 0.6]
+    SHOW_CLUSTERS = 5
+
+    messages = load_table("emotion")["message"].dropna().astype(str).tolist()
+    for threshold in THRESHOLDS:
+        start = time.perf_counter()
+        reps = near_duplicate_groups(messages, threshold)
+        seconds = time.perf_counter() - start
+        print(f"阈值{threshold}：{len(messages)}条 → {len(np.unique(reps))}簇，减少{reduction_ratio(reps):.1%}，耗时{seconds:.2f}秒")
+
+    reps = near_duplicate_groups(messages)
+    members = pd.Series(messages).groupby(reps)
+    sizes = members.size().sort_values(ascending=False)
+    print(f"\n阈值{SIMILARITY_THRESHOLD}下最大的{SHOW_CLUSTERS}个簇：")
+    for rep in sizes.index[:SHOW_CLUSTERS]:
+        texts = members.get_group(rep).drop_duplicates()
+        print(f"[{sizes[rep]}条，{len(texts)}种写法] " + " | ".join(t[:40] for t in texts.head(3)))
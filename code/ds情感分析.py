@@ -5,17 +5,29 @@
 """
 
 import json
+import os
 import requests
 import random
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
 from tqdm import tqdm
 import time
+import numpy as np
 import pandas as pd
-from typing import Dict
+from typing import Dict, List, Optional
+
+import metrics
+from dedup import near_duplicate_groups
+from emotion_cache import EmotionCache, cache_namespace, normalize_message
+from weather_fusion import FUSED_ENCODING
 
 # -------------------------- 1. 基础配置（需修改2处：API密钥、文件路径） --------------------------
 # 1.1 DeepSeek API配置（替换为你的密钥）
-DEEPSEEK_API_KEY = "sk-YOURAPI"  # 必须替换！
-DEEPSEEK_API_URL = "https://api.deepseek.com/v1/chat/completions"
+DEEPSEEK_API_KEY = os.environ.get("DEEPSEEK_API_KEY", "sk-YOURAPI")  # 必须替换！
+# 可通过环境变量指向本地桩服务器（如 http://127.0.0.1:8000/v1/chat/completions）做离线测试
+DEEPSEEK_API_URL = os.environ.get("DEEPSEEK_API_URL", "https://api.deepseek.com/v1/chat/completions")
 
 # 1.2 文件路径（替换为你的原始CSV和输出路径）
 INPUT_CSV_PATH = "南京景区-天气-社媒情感融合表.csv"    # 你的输入CSV路径
@@ -40,7 +52,142 @@ EMOTION_FEW_SHOT = [
     }
 ]
 
-# -------------------------- 2. 核心函数（严格限制情感大类） --------------------------
+# 1.5 并发与限流配置（替代原先每行固定sleep）
+MAX_CONCURRENCY = 8        # 同时在途的API请求数（设为1即逐行串行）
+RATE_LIMIT_PER_SEC = 5.0   # 令牌桶平均速率：每秒最多发出的请求数
+RATE_LIMIT_BURST = 5       # 令牌桶容量：允许的瞬时突发请求数
+MAX_RETRIES = 5            # 单次请求最大重试次数（429/5xx/网络异常）
+BACKOFF_BASE = 1.0         # 指数退避基数（秒）：1s、2s、4s……
+BACKOFF_MAX = 60.0         # 单次退避上限（秒）
+
+# 1.6 多条打包（一次请求分析BATCH_SIZE条message，示例与规则只发送一次）
+BATCH_SIZE = 20            # 设为1即退回逐条请求
+
+# 1.7 本地结果缓存（相同文本命中缓存即跳过API，增量爬取只为新文本付费）
+MODEL_NAME = "deepseek-chat"
+PROMPT_VERSION = "v2"                       # 修改提示词后请同步修改，使旧缓存失效
+CACHE_DB_PATH = "情感分析缓存.sqlite"        # 设为None关闭缓存
+SEED_CACHE_FROM_OUTPUT = True               # 启动时把已有的OUTPUT_CSV_PATH结果导入缓存
+CACHE_MAX_AGE_DAYS = 180                    # 超过该天数未使用的缓存条目被清理
+CACHE_MAX_ENTRIES = 1_000_000               # 缓存最多保留的条数（按最近使用保留）
+
+# 1.8 流式处理（分块读取输入、逐块追加输出，中断后从检查点续跑）
+STREAMING_MODE = False                      # 默认整表读入内存、最后一次性写出；True则分块处理并可断点续跑
+STREAM_CHUNK_SIZE = 2000                    # 每块行数（决定内存占用上限）
+CHECKPOINT_PATH = OUTPUT_CSV_PATH + ".checkpoint.json"
+
+# 1.9 本地模型预标注（先运行local_sentiment.py训练；高置信度的message直接采用本地结果，其余请求API）
+USE_LOCAL_MODEL = False                     # 默认全部请求API；True时需先训练模型，模型文件不存在时自动退回全部请求API
+
+# 1.10 近重复合并（同一景区的模板化签到、同一用户的近似重复微博只标注一条，结果回填给同簇的其他message）
+NEAR_DUP_THRESHOLD = 0.9                    # 字符2-gram的Jaccard相似度阈值（见dedup.py）；设为None关闭，只合并完全相同的文本
+
+# 空message或多次失败时的默认结果（合规）
+DEFAULT_EMOTION = {"sentiment": "中性", "intensity": 0, "emotion_type": "无情绪"}
+
+# -------------------------- 2. 限流与重试 --------------------------
+class TokenBucket:
+    """线程安全的令牌桶：平均速率rate（次/秒），最多积攒capacity个令牌"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self._tokens = float(capacity)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def acquire(self):
+        """取一个令牌，不够时阻塞到令牌补足"""
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds: float):
+        """服务端要求等待（429/Retry-After）时，让所有线程一起暂停seconds秒
+        多个线程同时收到429时暂停取最大值而不是累加"""
+        with self._lock:
+            self._refill()
+            self._tokens = min(self._tokens, -seconds * self.rate)
+
+
+RATE_LIMITER = TokenBucket(RATE_LIMIT_PER_SEC, RATE_LIMIT_BURST)
+_thread_local = threading.local()
+
+
+def _get_session() -> requests.Session:
+    """每个线程复用一个Session（保持HTTP长连接）"""
+    if not hasattr(_thread_local, "session"):
+        _thread_local.session = requests.Session()
+    return _thread_local.session
+
+
+def _retry_after_seconds(response: requests.Response) -> Optional[float]:
+    """解析Retry-After响应头（秒数或HTTP日期），无法解析时返回None"""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+def _backoff_delay(attempt: int, retry_after: Optional[float] = None) -> float:
+    """第attempt次失败后的等待时间：优先服从Retry-After，否则指数退避+随机抖动"""
+    if retry_after is not None:
+        return min(retry_after, BACKOFF_MAX)
+    return min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)) * random.uniform(0.5, 1.0)
+
+
+def post_chat_completion(payload: Dict) -> str:
+    """限流后发送chat请求，返回模型输出文本；429/5xx/网络异常按指数退避重试，重试耗尽抛出异常"""
+    headers = {"Authorization": f"Bearer {DEEPSEEK_API_KEY}", "Content-Type": "application/json"}
+    last_error = None
+    for attempt in range(MAX_RETRIES):
+        with metrics.span("api.rate_limit_wait"):
+            RATE_LIMITER.acquire()
+        start = time.perf_counter()
+        try:
+            response = _get_session().post(DEEPSEEK_API_URL, headers=headers, json=payload, timeout=20)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            metrics.incr("api_retries", reason=type(e).__name__)
+            last_error = e
+            time.sleep(_backoff_delay(attempt))
+            continue
+        metrics.observe("api_latency_seconds", time.perf_counter() - start, status=response.status_code)
+
+        if response.status_code == 429 or response.status_code >= 500:
+            metrics.incr("api_retries", reason=response.status_code)
+            last_error = requests.HTTPError(f"HTTP {response.status_code}", response=response)
+            retry_after = _retry_after_seconds(response)
+            if retry_after is not None:
+                RATE_LIMITER.pause(retry_after)
+            time.sleep(_backoff_delay(attempt, retry_after))
+            continue
+
+        if response.status_code >= 400:
+            metrics.incr("api_failures", reason=response.status_code)
+        response.raise_for_status()  # 其余4xx（如密钥错误）重试无意义，直接抛出
+        return response.json()["choices"][0]["message"]["content"].strip()
+
+    metrics.incr("api_failures", reason="retries_exhausted")
+    raise RuntimeError(f"API请求重试{MAX_RETRIES}次仍失败：{last_error}")
+
+# -------------------------- 3. 核心函数（严格限制情感大类） --------------------------
 def call_deepseek_emotion(text: str, sample_id: str) -> Dict:
     """调用API分析情感，确保emotion_type仅来自ALLOWED_EMOTIONS"""
     # 构建提示词（强制要求情感大类从预设列表选择）
@@ -59,70 +206,255 @@ message：{text}
 仅返回JSON（不要加其他内容，emotion_type必须在允许的列表中）："""
 
     # API请求配置
-    headers = {"Authorization": f"Bearer {DEEPSEEK_API_KEY}", "Content-Type": "application/json"}
     payload = {
-        "model": "deepseek-chat",
+        "model": MODEL_NAME,
         "messages": [{"role": "user", "content": prompt}],
         "temperature": 0.1,  # 低随机性，确保严格遵循规则
         "max_tokens": 500
     }
 
-    # 3次重试机制
+    # 3次解析重试（HTTP层面的限流/退避在post_chat_completion中处理）
     for _ in range(3):
         try:
-            response = requests.post(DEEPSEEK_API_URL, headers=headers, json=payload, timeout=20)
-            response.raise_for_status()
-            result = json.loads(response.json()["choices"][0]["message"]["content"].strip())
-            
-            # 关键：验证emotion_type是否合规，不合规则强制修正为"无情绪"
-            if result.get("emotion_type") not in ALLOWED_EMOTIONS:
-                result["emotion_type"] = "无情绪"
-            
-            return {
-                "sentiment": result.get("sentiment", "中性"),
-                "intensity": int(result.get("intensity", 0)) if str(result.get("intensity", 0)).isdigit() else 0,
-                "emotion_type": result["emotion_type"]  # 已确保合规
-            }
+            result = json.loads(post_chat_completion(payload))
+        except (ValueError, KeyError, TypeError):
+            metrics.incr("emotion_parse_errors", path="single")
+            continue  # 模型输出不是合法JSON，重新请求
         except Exception as e:
-            time.sleep(5)
-            continue
-    
+            metrics.incr("emotion_api_errors", path="single", error=type(e).__name__)
+            break  # 重试耗尽或不可重试的错误
+        if isinstance(result, dict):
+            return _normalize_emotion(result)
+
     # 多次失败返回默认值（合规）
-    return {"sentiment": "中性", "intensity": 0, "emotion_type": "无情绪"}
+    metrics.incr("emotion_fallbacks", path="single")
+    return dict(DEFAULT_EMOTION)
+
+
+def _normalize_emotion(result: Dict) -> Dict:
+    """关键：验证emotion_type是否合规，不合规则强制修正为"无情绪"；intensity非整数时置0"""
+    emotion_type = result.get("emotion_type")
+    if emotion_type not in ALLOWED_EMOTIONS:
+        metrics.incr("emotion_coerced", field="emotion_type")
+        emotion_type = "无情绪"
+    return {
+        "sentiment": result.get("sentiment", "中性"),
+        "intensity": int(result.get("intensity", 0)) if str(result.get("intensity", 0)).isdigit() else 0,
+        "emotion_type": emotion_type  # 已确保合规
+    }
+
+
+def call_deepseek_emotion_batch(items: List[Dict]) -> Dict[str, Dict]:
+    """一次请求分析多条message（items形如[{"id": mid, "message": text}]）
+    返回{id: 结果}；响应不是合法JSON数组或缺少某条时，对应id不出现在返回值中"""
+    prompt = f"""你是情感分析助手，下面给出一个JSON数组，每个元素含id和message。
+请逐条分析，仅输出一个JSON数组（无任何额外文字），每个元素对应一条输入，含4个字段：
+1. id：原样返回输入的id
+2. sentiment：情感倾向（仅"正面"/"负面"/"中性"）
+3. intensity：情感强度（0-10整数，0=无情绪，10=最强）
+4. emotion_type：具体情感，**必须从[{','.join(ALLOWED_EMOTIONS)}]中选择1个**（禁止自定义）
+
+参考示例（单条输入→单条输出）：
+{json.dumps(EMOTION_FEW_SHOT, ensure_ascii=False, indent=2)}
+
+待分析列表：
+{json.dumps(items, ensure_ascii=False)}
+
+仅返回JSON数组（共{len(items)}个元素，不要加其他内容，emotion_type必须在允许的列表中）："""
+
+    payload = {
+        "model": MODEL_NAME,
+        "messages": [{"role": "user", "content": prompt}],
+        "temperature": 0.1,
+        "max_tokens": 100 + 60 * len(items)  # 每条结果约60个token
+    }
 
-def process_csv_emotion():
-    """读取CSV→分析情感（限制大类）→保存结果"""
-    # 1. 读取原始CSV
     try:
-        df = pd.read_csv(INPUT_CSV_PATH, encoding="utf-8-sig")
+        content = post_chat_completion(payload)
+    except Exception as e:
+        metrics.incr("emotion_api_errors", path="batch", error=type(e).__name__)
+        return {}
+
+    # 容错：去掉```json代码块等包裹，只取最外层的[...]
+    start, end = content.find("["), content.rfind("]")
+    if start < 0 or end <= start:
+        metrics.incr("emotion_parse_errors", path="batch")
+        return {}
+    try:
+        parsed = json.loads(content[start:end + 1])
+    except ValueError:
+        metrics.incr("emotion_parse_errors", path="batch")
+        return {}
+
+    wanted = {item["id"] for item in items}
+    results = {}
+    for entry in parsed if isinstance(parsed, list) else []:
+        if isinstance(entry, dict) and str(entry.get("id")) in wanted:
+            results[str(entry["id"])] = _normalize_emotion(entry)
+    metrics.incr("emotion_batch_missing", len(wanted) - len(results))  # 这些message会逐条重试
+    return results
+
+
+@metrics.span("sentiment.batch")
+def _label_batch(batch: List[int], messages: List[str], mids: List[str]) -> Dict[int, Dict]:
+    """分析一个打包批次（batch为行号列表），批量结果缺失的message逐条重试"""
+    if len(batch) == 1:
+        i = batch[0]
+        return {i: call_deepseek_emotion(messages[i], mids[i])}
+
+    # 批内id必须唯一（mid可能重复或因科学计数法丢精度），重复时加序号区分
+    ids, seen = [], {}
+    for i in batch:
+        key = mids[i]
+        seen[key] = seen.get(key, 0) + 1
+        ids.append(key if seen[key] == 1 else f"{key}#{seen[key]}")
+
+    batch_results = call_deepseek_emotion_batch(
+        [{"id": key, "message": messages[i]} for key, i in zip(ids, batch)]
+    )
+    return {
+        i: batch_results[key] if key in batch_results else call_deepseek_emotion(messages[i], mids[i])
+        for key, i in zip(ids, batch)
+    }
+
+
+def _is_empty_message(message: str) -> bool:
+    return not message or message in ["nan", "None"]
+
+
+def open_emotion_cache() -> Optional[EmotionCache]:
+    """按当前提示词/模型/情感大类打开缓存（CACHE_DB_PATH为None时返回None）"""
+    if not CACHE_DB_PATH:
+        return None
+    namespace = cache_namespace(PROMPT_VERSION, MODEL_NAME, ALLOWED_EMOTIONS, EMOTION_FEW_SHOT)
+    return EmotionCache(CACHE_DB_PATH, namespace)
+
+
+@metrics.span("sentiment.label_messages")
+def label_messages(messages: List[str], mids: List[str], max_workers: int = MAX_CONCURRENCY,
+                   batch_size: int = BATCH_SIZE, cache: Optional[EmotionCache] = None,
+                   local_model=None, near_dup_threshold: Optional[float] = NEAR_DUP_THRESHOLD) -> List[Dict]:
+    """并发分析一批message（每batch_size条打包成一次请求），结果按输入顺序返回（速率由RATE_LIMITER控制）
+    相同文本（规范化后）只请求一次；传入cache时先查缓存，新结果写回缓存；缓存未命中的近重复文本合并为一簇，只标注代表文本；
+    传入local_model时缓存未命中的文本先由本地模型标注，只有低置信度的才请求API（本地结果不写入缓存）
+    每条结果带label_source：llm（API或缓存）、local（本地模型）、near_dup（沿用近重复代表文本的API结果）、default（空message）"""
+    results = [None] * len(messages)
+    groups = {}  # 规范化文本 → 行号列表
+    for i, message in enumerate(messages):
+        if _is_empty_message(message):
+            results[i] = {**DEFAULT_EMOTION, "label_source": "default"}  # 空message不调用API
+        else:
+            groups.setdefault(normalize_message(message), []).append(i)
+
+    if cache is not None:
+        for text, res in cache.get_many(groups).items():
+            for i in groups.pop(text):
+                results[i] = dict(res)
+
+    merged_rows = set()  # 并入近重复代表的行（结果不写入缓存，也不作为本地模型的训练样本）
+    if near_dup_threshold is not None and len(groups) > 1:
+        texts = list(groups)
+        reps = near_duplicate_groups(texts, near_dup_threshold)
+        for k in np.flatnonzero(reps != np.arange(len(texts))):   # 代表文本总在其成员之前
+            rows = groups.pop(texts[k])
+            groups[texts[reps[k]]].extend(rows)
+            merged_rows.update(rows)
+        metrics.incr("sentiment_near_dup_merged", len(texts) - len(groups))
+
+    if local_model is not None and groups:
+        texts = list(groups)
+        predictions = local_model.predict(texts)
+        confident = predictions[predictions["confident"]]
+        for k, res in zip(confident.index, confident[["sentiment", "intensity", "emotion_type"]].to_dict("records")):
+            for i in groups.pop(texts[k]):
+                results[i] = {**res, "intensity": int(res["intensity"]), "label_source": "local"}
+        metrics.incr("sentiment_local_labeled", len(confident))
+        metrics.incr("sentiment_local_routed", len(texts) - len(confident))   # 低置信度，交给API
+
+    # 每组只请求第一条，结果回填到同组所有行
+    pending = [rows[0] for rows in groups.values()]
+    metrics.incr("sentiment_messages", len(messages))
+    metrics.incr("sentiment_api_messages", len(pending))   # 去掉空文本、重复文本和缓存命中后需要请求的条数
+    text_of = {rows[0]: text for text, rows in groups.items()}
+
+    batch_size = max(1, batch_size)
+    batches = [pending[k:k + batch_size] for k in range(0, len(pending), batch_size)]
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool, \
+            tqdm(total=len(pending), desc="分析情感中（限制大类）") as progress:
+        futures = [pool.submit(_label_batch, batch, messages, mids) for batch in batches]
+        for future in as_completed(futures):
+            batch_results = future.result()
+            for i, res in batch_results.items():
+                for j in groups[text_of[i]]:
+                    results[j] = {**res, "label_source": "near_dup"} if j in merged_rows else dict(res)
+            if cache is not None:
+                cache.put_many((text_of[i], res) for i, res in batch_results.items())   # 只缓存实际请求过的文本
+            progress.update(len(batch_results))
+    for res in results:
+        res.setdefault("label_source", "llm")
+    return results
+
+
+def _open_cache_for_run() -> Optional[EmotionCache]:
+    cache = open_emotion_cache()
+    if cache is not None and SEED_CACHE_FROM_OUTPUT:
+        try:
+            seeded = cache.seed_from_csv(OUTPUT_CSV_PATH)
+        except Exception as e:
+            print(f"导入旧结果到缓存失败（不影响本次分析）：{str(e)}")
+            seeded = 0
+        if seeded:
+            print(f"已从旧结果导入缓存：{seeded}条")
+    return cache
+
+
+def _open_local_model():
+    """USE_LOCAL_MODEL开启且模型文件存在时返回本地模型，否则返回None（全部请求API）"""
+    if not USE_LOCAL_MODEL:
+        return None
+    from local_sentiment import MODEL_PATH, load_model
+    model = load_model()
+    if model is None:
+        print(f"未找到可用的本地情感模型（{MODEL_PATH}），全部message请求API")
+    return model
+
+
+def _close_cache_for_run(cache: Optional[EmotionCache]):
+    if cache is None:
+        return
+    stats = cache.stats()
+    evicted = cache.evict(CACHE_MAX_AGE_DAYS, CACHE_MAX_ENTRIES)
+    cache.close()
+    print(f"缓存命中{stats['hits']}条/未命中{stats['misses']}条（命中率{stats['hit_rate']:.1%}），"
+          f"缓存共{stats['entries']}条，清理{evicted}条")
+
+
+def process_csv_emotion() -> bool:
+    """读取CSV→分析情感（限制大类）→保存结果；返回是否成功"""
+    # 1. 读取原始CSV（天气融合表，编码见weather_fusion.FUSED_ENCODING）
+    try:
+        df = pd.read_csv(INPUT_CSV_PATH, encoding=FUSED_ENCODING)
     except FileNotFoundError:
         print(f"错误：原始CSV文件没找到 → {INPUT_CSV_PATH}")
-        return
+        return False
     except Exception as e:
         print(f"读取CSV失败：{str(e)}")
-        return
+        return False
 
     # 检查必要字段
     if not all(col in df.columns for col in ["mid", "message"]):
         print("错误：原始CSV缺少'mid'或'message'字段")
-        return
+        return False
 
-    # 2. 批量分析（逐行处理）
-    emotion_list = []
-    for _, row in tqdm(df.iterrows(), total=len(df), desc="分析情感中（限制大类）"):
-        message = str(row["message"]).strip()
-        mid = str(row["mid"])
-        
-        # 处理空message
-        if not message or message in ["nan", "None"]:
-            emotion_list.append({"sentiment": "中性", "intensity": 0, "emotion_type": "无情绪"})
-            time.sleep(0.5)
-            continue
-        
-        # 调用API（已限制情感大类）
-        emotion_res = call_deepseek_emotion(message, mid)
-        emotion_list.append(emotion_res)
-        time.sleep(1)  # 避免API频率限制
+    # 2. 批量分析（多条打包+并发+令牌桶限流，结果保持输入行顺序）
+    messages = [str(m).strip() for m in df["message"]]
+    mids = [str(m) for m in df["mid"]]
+    cache = _open_cache_for_run()
+    local_model = _open_local_model()
+    try:
+        emotion_list = label_messages(messages, mids, cache=cache, local_model=local_model)
+    finally:
+        _close_cache_for_run(cache)
 
     # 3. 合并结果并保存
     emotion_df = pd.DataFrame(emotion_list)
@@ -133,11 +465,104 @@ def process_csv_emotion():
         print(f"\n✅ 处理完成！")
         print(f"📁 新CSV路径：{OUTPUT_CSV_PATH}")
         print(f"🔍 情感大类限制为：{ALLOWED_EMOTIONS}")
-        print(f"🔍 新增字段：sentiment、intensity、emotion_type（严格限制）")
+        print(f"🔍 新增字段：sentiment、intensity、emotion_type（严格限制）、label_source（结果来源）")
     except Exception as e:
         print(f"保存CSV失败：{str(e)}")
+        return False
+    return True
+
+
+def _load_checkpoint() -> Dict:
+    """读取检查点；不存在或与当前输入文件不符时从头开始"""
+    if os.path.exists(CHECKPOINT_PATH):
+        with open(CHECKPOINT_PATH, encoding="utf-8") as f:
+            checkpoint = json.load(f)
+        if checkpoint.get("input") == INPUT_CSV_PATH and os.path.exists(OUTPUT_CSV_PATH):
+            return checkpoint
+    return {"input": INPUT_CSV_PATH, "rows_done": 0, "last_mid": None, "output_bytes": 0}
+
+
+def _save_checkpoint(checkpoint: Dict):
+    """先写临时文件再原子替换，避免中断时留下半个检查点"""
+    tmp_path = CHECKPOINT_PATH + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(checkpoint, f, ensure_ascii=False)
+    os.replace(tmp_path, CHECKPOINT_PATH)
+
+
+def process_csv_emotion_streaming(chunk_size: int = STREAM_CHUNK_SIZE) -> bool:
+    """分块读取CSV→分析情感→逐块追加到输出CSV；每块提交后更新检查点，重启时从最后提交的mid之后续跑；返回是否全部完成"""
+    checkpoint = _load_checkpoint()
+    rows_done = checkpoint["rows_done"]
+    if rows_done:
+        # 截掉上次中断时已写入但未提交（检查点之后）的半块输出
+        with open(OUTPUT_CSV_PATH, "r+b") as f:
+            f.truncate(checkpoint["output_bytes"])
+        print(f"从检查点续跑：已完成{rows_done}行，最后提交的mid={checkpoint['last_mid']}")
+
+    cache = _open_cache_for_run()  # 先把旧输出导入缓存，再开始新的输出
+    local_model = _open_local_model()
+    if not rows_done and os.path.exists(OUTPUT_CSV_PATH):
+        os.remove(OUTPUT_CSV_PATH)
+
+    try:
+        chunks = pd.read_csv(INPUT_CSV_PATH, encoding=FUSED_ENCODING, dtype={"mid": str}, chunksize=chunk_size)
+        position = 0
+        with tqdm(desc="流式分析", initial=rows_done, unit="行") as progress:
+            for chunk in chunks:
+                if not {"mid", "message"}.issubset(chunk.columns):
+                    print("错误：原始CSV缺少'mid'或'message'字段")
+                    return False
+                start, position = position, position + len(chunk)
+                if start < rows_done <= position:
+                    # 检查点所在的块（含检查点恰好落在块末尾的情况）：核对最后提交的mid，防止输入文件被改动后错位续跑
+                    if str(chunk["mid"].iloc[rows_done - start - 1]) != checkpoint["last_mid"]:
+                        print(f"错误：输入文件与检查点不一致，请删除{CHECKPOINT_PATH}后重跑")
+                        return False
+                if position <= rows_done:
+                    continue  # 已提交的块直接跳过
+                if start < rows_done:
+                    chunk = chunk.iloc[rows_done - start:]
+
+                chunk = chunk.reset_index(drop=True)
+                messages = [str(m).strip() for m in chunk["message"]]
+                mids = [str(m) for m in chunk["mid"]]
+                with metrics.span("sentiment.chunk"):
+                    emotion_df = pd.DataFrame(label_messages(messages, mids, cache=cache, local_model=local_model))
+                out = pd.concat([chunk, emotion_df], axis=1)
+
+                # 先追加写出并落盘，再提交检查点
+                first = checkpoint["output_bytes"] == 0
+                data = out.to_csv(index=False, header=first).encode("utf-8-sig" if first else "utf-8")
+                with open(OUTPUT_CSV_PATH, "ab") as f:
+                    f.write(data)
+                    f.flush()
+                    os.fsync(f.fileno())
+                    checkpoint["output_bytes"] = f.tell()
+                checkpoint["rows_done"] = position
+                checkpoint["last_mid"] = mids[-1]
+                _save_checkpoint(checkpoint)
+                progress.update(len(chunk))
+    except KeyboardInterrupt:
+        print(f"\n⏸ 已中断，已提交{checkpoint['rows_done']}行；重新运行即可从检查点续跑")
+        return False
+    finally:
+        _close_cache_for_run(cache)
+
+    if os.path.exists(CHECKPOINT_PATH):
+        os.remove(CHECKPOINT_PATH)
+    print(f"\n✅ 处理完成！共{checkpoint['rows_done']}行")
+    print(f"📁 新CSV路径：{OUTPUT_CSV_PATH}")
+    return True
 
-# -------------------------- 3. 运行入口 --------------------------
+# -------------------------- 4. 运行入口 --------------------------
 if __name__ == "__main__":
     random.seed(42)
-    process_csv_emotion()
\ No newline at end of file
+    ok = process_csv_emotion_streaming() if STREAMING_MODE else process_csv_emotion()
+    print("\n📊 运行统计：\n" + metrics.summary())
+    counters = {c["name"]: c["value"] for c in metrics.snapshot()["counters"] if not c["labels"]}
+    if counters.get("sentiment_messages"):
+        print(f"近重复合并：{counters.get('sentiment_near_dup_merged', 0):g}条并入同簇代表文本，"
+              f"占全部message的{counters.get('sentiment_near_dup_merged', 0) / counters['sentiment_messages']:.1%}")
+    if not ok:
+        raise SystemExit(1)   # 读取/保存失败或中断时以非零状态退出，流水线不会把本阶段记为已完成
\ No newline at end of file
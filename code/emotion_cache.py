@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""
+功能：情感分析结果的本地SQLite缓存（内容寻址）
+键 = sha256(规范化message + 提示词版本/示例 + 模型名 + ALLOWED_EMOTIONS)，命中即跳过API调用；
+修改任一配置都会得到新的命名空间，旧结果自然失效，可按时间或条数清理
+"""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import time
+import unicodedata
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import pandas as pd
+
+_SQL_CHUNK = 500  # SQLite单条语句的参数个数有上限，分块查询
+
+
+def normalize_message(text: str) -> str:
+    """规范化message：全角转半角（NFKC）、去首尾空白、连续空白合并为一个空格"""
+    text = unicodedata.normalize("NFKC", str(text))
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def cache_namespace(prompt_version: str, model: str, allowed_emotions: List[str], few_shot: List[Dict]) -> str:
+    """由提示词版本、示例、模型名和情感大类生成命名空间，任一变化即视为不同的缓存"""
+    spec = json.dumps(
+        {"prompt": prompt_version, "model": model, "emotions": list(allowed_emotions), "few_shot": few_shot},
+        ensure_ascii=False, sort_keys=True
+    )
+    return hashlib.sha256(spec.encode("utf-8")).hexdigest()[:16]
+
+
+class EmotionCache:
+    """SQLite情感结果缓存（同一个实例只在一个线程中使用）"""
+
+    def __init__(self, db_path: str, namespace: str):
+        self.db_path = db_path
+        self.namespace = namespace
+        self.hits = 0
+        self.misses = 0
+        self._conn = sqlite3.connect(db_path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS emotion_cache (
+                   key TEXT PRIMARY KEY,
+                   sentiment TEXT NOT NULL,
+                   intensity INTEGER NOT NULL,
+                   emotion_type TEXT NOT NULL,
+                   created_at REAL NOT NULL,
+                   last_used REAL NOT NULL
+               )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_used ON emotion_cache(last_used)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS cache_stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        self._conn.commit()
+
+    def key(self, message: str) -> str:
+        """message（已规范化）→ 缓存键"""
+        return hashlib.sha256(f"{self.namespace}\x1f{message}".encode("utf-8")).hexdigest()
+
+    def get_many(self, messages: Iterable[str]) -> Dict[str, Dict]:
+        """批量查询，返回{message: 结果}，未命中的message不在返回值中"""
+        by_key = {self.key(m): m for m in messages}
+        found = {}
+        keys = list(by_key)
+        for k in range(0, len(keys), _SQL_CHUNK):
+            chunk = keys[k:k + _SQL_CHUNK]
+            rows = self._conn.execute(
+                f"SELECT key, sentiment, intensity, emotion_type FROM emotion_cache "
+                f"WHERE key IN ({','.join('?' * len(chunk))})", chunk
+            ).fetchall()
+            for key, sentiment, intensity, emotion_type in rows:
+                found[by_key[key]] = {"sentiment": sentiment, "intensity": int(intensity), "emotion_type": emotion_type}
+
+        now = time.time()
+        hit_keys = [self.key(m) for m in found]
+        self._conn.executemany("UPDATE emotion_cache SET last_used = ? WHERE key = ?", [(now, k) for k in hit_keys])
+        self._record(hits=len(found), misses=len(by_key) - len(found))
+        return found
+
+    def put_many(self, items: Iterable[Tuple[str, Dict]]):
+        """批量写入(message, 结果)"""
+        now = time.time()
+        rows = [
+            (self.key(m), r["sentiment"], int(r["intensity"]), r["emotion_type"], now, now)
+            for m, r in items
+        ]
+        self._conn.executemany("INSERT OR REPLACE INTO emotion_cache VALUES (?, ?, ?, ?, ?, ?)", rows)
+        self._conn.commit()
+
+    def seed_from_csv(self, csv_path: str, encoding: str = "utf-8-sig") -> int:
+        """把已有的情感分析结果CSV导入缓存（已存在的键不覆盖），返回导入条数
+        有label_source列时跳过本地模型标注和沿用近重复结果的行（缓存只保存LLM对该文本本身的结果）"""
+        if not os.path.exists(csv_path):
+            return 0
+        before = self._conn.total_changes
+        chunks = pd.read_csv(csv_path, encoding=encoding, chunksize=100_000,
+                             usecols=lambda c: c in {"message", "sentiment", "intensity", "emotion_type", "label_source"})
+        for df in chunks:  # 分块读取，大文件也只占用有限内存
+            if "label_source" in df.columns:
+                df = df[~df.pop("label_source").isin(["local", "near_dup"])]
+            df = df.dropna()
+            df["intensity"] = pd.to_numeric(df["intensity"], errors="coerce")
+            df = df.dropna(subset=["intensity"])
+            now = time.time()
+            rows = [
+                (self.key(normalize_message(m)), s, int(i), e, now, now)
+                for m, s, i, e in zip(df["message"], df["sentiment"], df["intensity"], df["emotion_type"])
+            ]
+            self._conn.executemany("INSERT OR IGNORE INTO emotion_cache VALUES (?, ?, ?, ?, ?, ?)", rows)
+        self._conn.commit()
+        return self._conn.total_changes - before
+
+    def evict(self, max_age_days: Optional[float] = None, max_entries: Optional[int] = None) -> int:
+        """删除超过max_age_days未使用的条目，并只保留最近使用的max_entries条，返回删除条数"""
+        before = self._conn.total_changes
+        if max_age_days is not None:
+            self._conn.execute("DELETE FROM emotion_cache WHERE last_used < ?", (time.time() - max_age_days * 86400,))
+        if max_entries is not None:
+            self._conn.execute(
+                "DELETE FROM emotion_cache WHERE key NOT IN "
+                "(SELECT key FROM emotion_cache ORDER BY last_used DESC LIMIT ?)", (int(max_entries),)
+            )
+        self._conn.commit()
+        return self._conn.total_changes - before
+
+    def _record(self, hits: int, misses: int):
+        self.hits += hits
+        self.misses += misses
+        self._conn.executemany(
+            "INSERT INTO cache_stats VALUES (?, ?) ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+            [("hits", hits), ("misses", misses)]
+        )
+        self._conn.commit()
+
+    def stats(self) -> Dict:
+        """本次运行与累计的命中/未命中统计"""
+        totals = dict(self._conn.execute("SELECT name, value FROM cache_stats").fetchall())
+        entries = self._conn.execute("SELECT COUNT(*) FROM emotion_cache").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "total_hits": totals.get("hits", 0),
+            "total_misses": totals.get("misses", 0),
+            "entries": entries,
+        }
+
+    def close(self):
+        self._conn.close()
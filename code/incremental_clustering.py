@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+功能：景区聚类的增量模式
+持久化每个景区的累计量（情感得分/经纬度的和与计数、tag2各类型计数）以及标准化器和MiniBatchKMeans模型；
+新签到只需向量化地并入累计量，再用变化景区的特征对簇中心做一次partial_fit，开销与新增行数成正比
+"""
+
+import os
+import pickle
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from sklearn.cluster import MiniBatchKMeans
+
+from kmeans_sweep import SWEEP_CACHE_DIR
+from scenic_features import scenic_aggregates, scenic_table
+
+# -------------------------- 1. 基础配置 --------------------------
+STATE_PATH = os.path.join(SWEEP_CACHE_DIR, "incremental_state.pkl")
+
+
+# -------------------------- 2. 景区累计量 --------------------------
+def merge_aggregates(sums: pd.DataFrame, tag_counts: pd.DataFrame,
+                     new_sums: pd.DataFrame, new_tag_counts: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """两份累计量相加（景区、tag2类型取并集）"""
+    sums = sums.add(new_sums, fill_value=0).astype(sums.dtypes.to_dict())
+    tag_counts = tag_counts.add(new_tag_counts, fill_value=0).fillna(0).astype(np.int64)
+    return sums, tag_counts.reindex(columns=sorted(tag_counts.columns))
+
+
+# -------------------------- 3. 状态读写 --------------------------
+def build_state(df: pd.DataFrame, sums: pd.DataFrame, tag_counts: pd.DataFrame, scaler, feature_columns,
+                X_scaled: np.ndarray, centers: np.ndarray) -> Dict:
+    """全量聚类完成后建立增量状态：以选定K的簇中心初始化MiniBatchKMeans，并用全量特征设置各簇计数"""
+    model = MiniBatchKMeans(n_clusters=len(centers), init=centers, n_init=1, random_state=42,
+                            reassignment_ratio=0.0)
+    model.partial_fit(X_scaled)
+    return {
+        "rows_done": len(df),
+        "last_mid": str(df["mid"].iloc[-1]) if len(df) else None,
+        "sums": sums,
+        "tag_counts": tag_counts,
+        "scaler": scaler,
+        "feature_columns": list(feature_columns),
+        "model": model,
+    }
+
+
+def save_state(state: Dict, path: str = STATE_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(state, f)
+    os.replace(tmp_path, path)
+
+
+def load_state(path: str = STATE_PATH) -> Optional[Dict]:
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+# -------------------------- 4. 增量更新 --------------------------
+def new_rows(df: pd.DataFrame, state: Dict) -> Optional[pd.DataFrame]:
+    """数据表只追加时返回上次之后的新增行；若表被改写（行数变少或衔接处mid不一致）返回None，需全量重建"""
+    rows_done = state["rows_done"]
+    if len(df) < rows_done:
+        return None
+    if rows_done and str(df["mid"].iloc[rows_done - 1]) != state["last_mid"]:
+        return None
+    return df.iloc[rows_done:]
+
+
+def fold_in(state: Dict, batch: pd.DataFrame, to_features) -> pd.DataFrame:
+    """把新增签到并入累计量，用变化景区的特征partial_fit更新簇中心，返回带最新聚类标签的景区聚合表
+    to_features(scenic_agg)：景区聚合表 → 与全量聚类相同列顺序的特征矩阵（未标准化）"""
+    if len(batch):
+        new_sums, new_tag_counts = scenic_aggregates(batch)
+        state["sums"], state["tag_counts"] = merge_aggregates(state["sums"], state["tag_counts"],
+                                                              new_sums, new_tag_counts)
+    else:
+        new_sums = state["sums"].iloc[:0]
+
+    scenic_agg = scenic_table(state["sums"], state["tag_counts"])
+    unseen = set(scenic_agg["main_type"].dropna().astype(str)) - \
+        {col.split("main_type_", 1)[-1] for col in state["feature_columns"]}
+    if unseen:
+        print(f"提示：出现全量聚类时没有的景区类型{sorted(unseen)}，其独热列按0处理；建议择机全量重跑")
+    features = to_features(scenic_agg)
+    # 特征构造可能丢掉含缺失值的景区（如无经纬度），变化掩码须按实际保留的行计算
+    changed = scenic_agg.loc[features.index, "name"].isin(new_sums.index).to_numpy()
+    X_scaled = state["scaler"].transform(features)
+    if len(changed) != len(X_scaled):
+        raise ValueError("变化掩码与特征矩阵行数不一致")
+
+    if changed.any():
+        state["model"].partial_fit(X_scaled[changed])
+    # 标签按最新簇中心重新分配（开销与景区数成正比，与签到总行数无关）；被特征构造丢掉的景区标签为NaN
+    scenic_agg["cluster_label"] = pd.Series(state["model"].predict(X_scaled), index=features.index)
+    state["rows_done"] += len(batch)
+    if len(batch):
+        state["last_mid"] = str(batch["mid"].iloc[-1])
+    return scenic_agg
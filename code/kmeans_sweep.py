@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+功能：K-means选K（轮廓系数法）的并行扫描与结果缓存
+各个K在进程池中并行拟合；每个K的拟合结果（标签、簇中心、轮廓系数）按（特征矩阵哈希, K, 参数）缓存到磁盘，
+输入不变时重复运行直接读缓存；选定的最优K直接复用扫描时拟合好的模型，不再重新拟合
+"""
+
+import hashlib
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+from sklearn.cluster import KMeans
+from sklearn.metrics import pairwise_distances, silhouette_score
+
+import metrics
+
+# -------------------------- 1. 基础配置 --------------------------
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SWEEP_CACHE_DIR = os.path.join(BASE_DIR, "data", "processed_data", "cluster_cache")
+SILHOUETTE_SAMPLE_THRESHOLD = 5000   # 样本数超过该值时，轮廓系数改为抽样估计（完整计算为O(n²)）
+SILHOUETTE_SAMPLE_SIZE = 5000
+PRECOMPUTE_DISTANCE_MAX = 20000      # 样本数不超过该值时可一次性计算距离矩阵，供所有K共用
+
+
+# -------------------------- 2. 缓存键 --------------------------
+def matrix_hash(X: np.ndarray) -> str:
+    """特征矩阵内容哈希（形状+数值），作为缓存键的一部分"""
+    X = np.ascontiguousarray(X, dtype=np.float64)
+    digest = hashlib.sha1(str(X.shape).encode("utf-8"))
+    digest.update(X.tobytes())
+    return digest.hexdigest()[:16]
+
+
+def _cache_path(x_hash: str, k: int, n_init: int, random_state: int, silhouette_mode: str,
+                sample_size: Optional[int] = None) -> str:
+    if silhouette_mode == "sample":
+        silhouette_mode = f"sample{sample_size}"   # 抽样估计的轮廓系数随抽样数变化
+    return os.path.join(SWEEP_CACHE_DIR, f"{x_hash}_k{k}_n{n_init}_r{random_state}_{silhouette_mode}.npz")
+
+
+def _load_result(path: str) -> Optional[Dict]:
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as data:
+        return {"labels": data["labels"], "centers": data["centers"],
+                "inertia": float(data["inertia"]), "silhouette": float(data["silhouette"])}
+
+
+def _save_result(path: str, result: Dict):
+    os.makedirs(SWEEP_CACHE_DIR, exist_ok=True)
+    tmp_path = path + ".tmp.npz"
+    np.savez(tmp_path, labels=result["labels"], centers=result["centers"],
+             inertia=result["inertia"], silhouette=result["silhouette"])
+    os.replace(tmp_path, path)
+
+
+# -------------------------- 3. 单个K的拟合与评分 --------------------------
+def score_silhouette(X: np.ndarray, labels: np.ndarray, sample_size: Optional[int] = None,
+                     distances: Optional[np.ndarray] = None, random_state: int = 42) -> float:
+    """轮廓系数：有距离矩阵时直接用；样本量大时按sample_size抽样估计；否则完整计算"""
+    if len(np.unique(labels)) < 2:
+        return float("nan")
+    if distances is not None:
+        return float(silhouette_score(distances, labels, metric="precomputed"))
+    if sample_size is not None and sample_size < len(X):
+        return float(silhouette_score(X, labels, sample_size=sample_size, random_state=random_state))
+    return float(silhouette_score(X, labels))
+
+
+def fit_k(X: np.ndarray, k: int, n_init: int = 10, random_state: int = 42,
+          silhouette_sample: Optional[int] = None, with_silhouette: bool = True) -> Dict:
+    """拟合一个K并评分（进程池中每个任务调用一次；限制为单线程，避免多进程×多线程争抢CPU）"""
+    from threadpoolctl import threadpool_limits
+    start = time.perf_counter()
+    with threadpool_limits(limits=1):
+        model = KMeans(n_clusters=k, random_state=random_state, n_init=n_init).fit(X)
+        silhouette = score_silhouette(X, model.labels_, silhouette_sample, random_state=random_state) \
+            if with_silhouette else float("nan")
+    return {"labels": model.labels_.astype(np.int32), "centers": model.cluster_centers_,
+            "inertia": float(model.inertia_), "silhouette": silhouette, "seconds": time.perf_counter() - start}
+
+
+# -------------------------- 4. 并行扫描 --------------------------
+@metrics.span("kmeans.sweep")
+def sweep_k(X: np.ndarray, k_values: Iterable[int], n_init: int = 10, random_state: int = 42,
+            max_workers: Optional[int] = None, silhouette: str = "auto", use_cache: bool = True) -> Dict[int, Dict]:
+    """对每个K拟合KMeans并计算轮廓系数，返回{K: 结果}
+    silhouette：full=完整计算；sample=抽样估计；precomputed=一次计算距离矩阵供所有K共用；
+    auto=样本数不超过SILHOUETTE_SAMPLE_THRESHOLD时完整计算，否则抽样"""
+    X = np.asarray(X, dtype=np.float64)
+    k_values = list(k_values)
+    if silhouette == "auto":
+        silhouette = "full" if len(X) <= SILHOUETTE_SAMPLE_THRESHOLD else "sample"
+    if silhouette == "precomputed" and len(X) > PRECOMPUTE_DISTANCE_MAX:
+        print(f"提示：样本数{len(X)}超过{PRECOMPUTE_DISTANCE_MAX}，距离矩阵过大，改为抽样计算轮廓系数")
+        silhouette = "sample"
+    sample_size = SILHOUETTE_SAMPLE_SIZE if silhouette == "sample" else None
+
+    x_hash = matrix_hash(X)
+    results: Dict[int, Dict] = {}
+    paths = {k: _cache_path(x_hash, k, n_init, random_state, silhouette, sample_size) for k in k_values}
+    if use_cache:
+        for k in k_values:
+            cached = _load_result(paths[k])
+            if cached is not None:
+                results[k] = cached
+    todo = [k for k in k_values if k not in results]
+
+    if todo:
+        with_silhouette = silhouette != "precomputed"
+        if len(todo) > 1 and max_workers != 1:
+            with ProcessPoolExecutor(max_workers=max_workers) as pool:
+                futures = {k: pool.submit(fit_k, X, k, n_init, random_state, sample_size, with_silhouette)
+                           for k in todo}
+                fitted = {k: future.result() for k, future in futures.items()}
+        else:
+            fitted = {k: fit_k(X, k, n_init, random_state, sample_size, with_silhouette) for k in todo}
+
+        if not with_silhouette:
+            distances = pairwise_distances(X)
+            for result in fitted.values():
+                result["silhouette"] = score_silhouette(X, result["labels"], distances=distances)
+        for k, result in fitted.items():
+            metrics.observe("kmeans_fit_seconds", result.pop("seconds"), k=k)   # 在子进程中计时，回到主进程后记录
+            if use_cache:
+                _save_result(paths[k], result)
+            results[k] = result
+
+    return {k: results[k] for k in k_values}
+
+
+def best_k(results: Dict[int, Dict]) -> int:
+    """轮廓系数最大的K（并列时取较小的K）"""
+    return max(results, key=lambda k: (np.nan_to_num(results[k]["silhouette"], nan=-1.0), -k))
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""
+功能：CPU版LDA主题模型（与Ida_cuda.ipynb相同的接口：load_and_preprocess_data → build_corpus_and_tensor → train_lda_and_extract_results）
+词袋用稀疏CSR矩阵保存（不再构造n_docs×n_words的稠密张量），模型为在线（小批量）变分贝叶斯LDA，
+E步按文档分块多核并行，困惑度收敛后提前停止，不再固定迭代1000轮；不依赖torch/gensim/GPU
+"""
+
+from typing import List, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from sklearn.decomposition import LatentDirichletAllocation
+from sklearn.feature_extraction.text import CountVectorizer
+
+import metrics
+from data_store import load_table
+from dedup import SIMILARITY_THRESHOLD, near_duplicate_groups, reduction_ratio
+from tokenize_cache import LDA_POS_FLAGS, filter_tokens, tokenize_messages
+from topic_inference import TOPIC_MODEL_PATH, save_topic_model
+
+# -------------------------- 1. 基础配置 --------------------------
+# 词典过滤（与gensim的filter_extremes(no_below=2)默认参数一致）
+NO_BELOW = 2        # 至少在2条文档中出现
+NO_ABOVE = 0.5      # 出现在超过50%文档中的词视为无区分度
+KEEP_N = 100000     # 最多保留的词数
+DEDUP_DOCUMENTS = True   # 近重复微博（模板化签到、同一用户的重复发文）合并为一条文档训练，主题结果回填给同簇的每一行
+                         # （分词阶段只复用代表文本的分词结果，不合并文档；不合并时每个簇仍按成员数重复计入语料）
+
+N_JOBS = -1          # E步并行进程数（-1为全部CPU核）
+BATCH_SIZE = 256     # 在线学习的小批量大小
+MAX_ITER = 100       # 最多遍历语料的轮数
+EVALUATE_EVERY = 5   # 每隔几轮计算一次困惑度（计算困惑度需要对全语料做一次E步）
+TOL = 1e-3           # 两次评估间困惑度的相对变化小于该值时视为收敛，提前停止
+
+
+# -------------------------- 2. 读取与分词 --------------------------
+def load_and_preprocess_data(table="fused") -> Tuple[pd.DataFrame, List[List[str]]]:
+    """读取数据表并分词（统一分词阶段，按mid缓存），只保留名词/动词/形容词，过滤空文本与无有效词的文档"""
+    df = load_table(table)
+    df = df.dropna(subset=["message"]).reset_index(drop=True)
+    messages = df["message"].tolist()
+    tokens = tokenize_messages(messages, df["mid"] if "mid" in df.columns else None)
+
+    processed_words = []
+    valid_indices = []  # 记录有效文档的索引（用于后续筛选df）
+    for idx, doc_tokens in enumerate(tokens):
+        words = filter_tokens(doc_tokens, keep_flags=LDA_POS_FLAGS)
+        if words:  # 只保留有有效词的文档
+            processed_words.append(words)
+            valid_indices.append(idx)
+
+    df_valid = df.iloc[valid_indices].reset_index(drop=True)
+    print(f"原始数据量：{len(messages)}条 → 过滤后有效数据量：{len(processed_words)}条")
+    return df_valid, processed_words
+
+
+# -------------------------- 3. 稀疏词袋 --------------------------
+def _identity(words):
+    return words
+
+
+def build_corpus_and_tensor(processed_words, device=None) -> Tuple[List[str], sparse.csr_matrix, int, int]:
+    """构建词典与稀疏词袋矩阵（CSR，n_docs×n_words，只存非零计数）
+    返回值顺序与GPU版一致：(dictionary, doc_word, n_words, n_docs)，dictionary[词ID]为对应的词；device参数仅为兼容保留"""
+    max_df = NO_ABOVE if len(processed_words) * NO_ABOVE >= NO_BELOW else 1.0
+    vectorizer = CountVectorizer(analyzer=_identity, min_df=NO_BELOW, max_df=max_df, max_features=KEEP_N)
+    doc_word = vectorizer.fit_transform(processed_words).astype(np.float64).tocsr()
+    dictionary = vectorizer.get_feature_names_out().tolist()
+    n_docs, n_words = doc_word.shape
+    print(f"词典大小：{n_words} | 非零元素：{doc_word.nnz}（稠密矩阵的{doc_word.nnz / max(n_docs * n_words, 1):.2%}）")
+    return dictionary, doc_word, n_words, n_docs
+
+
+# -------------------------- 4. 训练与结果提取 --------------------------
+@metrics.span("lda.train")
+def train_lda_and_extract_results(
+    doc_word_tensor, n_topics, n_words, n_docs, df_valid, dictionary,
+    alpha=1.0, beta=0.1, max_iter=MAX_ITER, tol=TOL, evaluate_every=EVALUATE_EVERY, batch_size=BATCH_SIZE,
+    n_jobs=N_JOBS, random_state=2023, return_model=False, model_path=None, dedup=DEDUP_DOCUMENTS,
+    **_gpu_only_kwargs
+):
+    """在线变分贝叶斯LDA：每轮按小批量更新主题-词分布，定期计算困惑度，相对变化小于tol即停
+    alpha/beta与GPU版StableLDA的先验含义相同；lr/n_epochs/device等GPU版参数会被忽略
+    model_path不为None时保存topic_word与词典，供topic_inference对新微博做主题推断
+    dedup为True时每个近重复簇（按df_valid的message列）只用代表文档训练与推断，df_valid的每一行仍得到主题结果"""
+    rows = np.arange(n_docs)
+    if dedup and "message" in df_valid.columns:
+        reps = near_duplicate_groups(df_valid["message"].astype(str).tolist(), SIMILARITY_THRESHOLD)
+        print(f"近重复合并：{n_docs}条文档 → {len(np.unique(reps))}条（减少{reduction_ratio(reps):.1%}）")
+        keep = np.flatnonzero(reps == rows)
+        position = np.empty(n_docs, dtype=np.int64)
+        position[keep] = np.arange(len(keep))
+        doc_word_tensor, n_docs, rows = doc_word_tensor[keep], len(keep), position[reps]
+
+    model = LatentDirichletAllocation(
+        n_components=n_topics,
+        doc_topic_prior=alpha,
+        topic_word_prior=beta,
+        learning_method="online",
+        batch_size=batch_size,
+        total_samples=n_docs,
+        n_jobs=n_jobs,
+        random_state=random_state,
+    )
+    print("\n开始训练LDA模型...")
+    last_perplexity = None
+    for epoch in range(max_iter):
+        with metrics.span("lda.epoch"):
+            model.partial_fit(doc_word_tensor)  # 遍历一轮语料（按batch_size分小批量更新）
+        if (epoch + 1) % evaluate_every == 0 or epoch + 1 == max_iter:
+            perplexity = model.perplexity(doc_word_tensor)
+            print(f"迭代 {epoch + 1}/{max_iter} | 困惑度：{perplexity:.2f}")
+            if last_perplexity is not None and abs(last_perplexity - perplexity) / last_perplexity < tol:
+                print("困惑度已收敛，提前停止")
+                break
+            last_perplexity = perplexity
+    doc_topic = model.transform(doc_word_tensor)[rows]
+
+    # 文档→主题结果
+    df_valid["topic_id"] = doc_topic.argmax(axis=1)   # 主主题ID
+    df_valid["topic_prob"] = doc_topic.max(axis=1)    # 主主题概率
+
+    # 主题→关键词结果（取前10个词）
+    topic_word = model.components_ / model.components_.sum(axis=1, keepdims=True)
+    topic_keywords = []
+    for topic_idx in range(n_topics):
+        top_word_ids = topic_word[topic_idx].argsort()[-10:][::-1]  # 权重最高的10个词ID
+        top_words = [dictionary[i] for i in top_word_ids]
+        topic_keywords.append(f"主题{topic_idx}：{', '.join(top_words)}")
+    if model_path is not None:
+        save_topic_model(topic_word, dictionary, model_path)
+
+    if return_model:
+        return df_valid, topic_keywords, model
+    return df_valid, topic_keywords
+
+
+# -------------------------- 5. 运行入口 --------------------------
+if __name__ == "__main__":
+    TABLE_NAME = "fused"  # data_store中的表名（南京景区-天气-社媒情感融合表）
+    N_TOPICS = 4  # 主题数
+    SAVE_PATH = "全量数据_带主题_最终版.csv"  # 结果保存路径
+
+    df_valid, processed_words = load_and_preprocess_data(TABLE_NAME)
+    dictionary, doc_word, n_words, n_docs = build_corpus_and_tensor(processed_words)
+    df_result, topic_keywords = train_lda_and_extract_results(
+        doc_word_tensor=doc_word,
+        n_topics=N_TOPICS,
+        n_words=n_words,
+        n_docs=n_docs,
+        df_valid=df_valid,
+        dictionary=dictionary,
+        model_path=TOPIC_MODEL_PATH
+    )
+    df_result.to_csv(SAVE_PATH, index=False, encoding="utf-8")
+    print(f"\n主题关键词列表：")
+    for kw in topic_keywords:
+        print(kw)
+    print(f"\n结果已保存到：{SAVE_PATH}")
+    print(f"主题模型已保存到：{TOPIC_MODEL_PATH}")
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+功能：本地情感分类器（用已有的LLM标注结果训练，只需CPU）
+字符n-gram TF-IDF特征 + 线性模型分别预测情感倾向、情感大类（逻辑回归）与强度（岭回归），批量标注每秒数千条；
+情感倾向与情感大类的预测概率都不低于置信度阈值的结果直接采用，其余交给LLM（ds情感分析.py的label_messages）
+"""
+
+import os
+import pickle
+import time
+from typing import Optional, Sequence
+
+import numpy as np
+import pandas as pd
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.linear_model import LogisticRegression, Ridge
+from sklearn.model_selection import train_test_split
+
+from emotion_cache import normalize_message
+
+# -------------------------- 1. 基础配置 --------------------------
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODEL_PATH = os.path.join(BASE_DIR, "data", "processed_data", "本地情感模型.pkl")
+REPORT_CSV_PATH = os.path.join(BASE_DIR, "data", "processed_data", "本地情感模型评估.csv")
+MODEL_VERSION = "v1"            # 特征或模型结构改变时修改，旧模型文件不再加载
+
+NGRAM_RANGE = (1, 2)            # 字符1~2-gram（不需要分词，标注速度快；1~3-gram在本数据上没有更好）
+MIN_DF = 2
+MAX_FEATURES = 200_000
+C = 4.0                         # 逻辑回归正则化强度的倒数
+RIDGE_ALPHA = 1.0
+CONFIDENCE_THRESHOLD = 0.8      # 情感倾向与情感大类的预测概率都不低于该值才直接采用本地结果
+TEST_SIZE = 0.2                 # 评估时留出的比例（按去重后的文本划分）
+EVAL_THRESHOLDS = [0.5, 0.6, 0.7, 0.8, 0.9]
+RANDOM_STATE = 2023
+
+ALLOWED_EMOTIONS = ["愉悦", "悲伤", "怀旧", "烦躁", "失望", "无情绪"]   # 与ds情感分析.py一致
+ALLOWED_SENTIMENTS = ["正面", "中性", "负面"]
+
+
+# -------------------------- 2. 模型 --------------------------
+class LocalSentimentModel:
+    """三个输出共用一套TF-IDF特征：sentiment/emotion_type为逻辑回归，intensity为岭回归（取整并截断到0~10）"""
+
+    def __init__(self, threshold: float = CONFIDENCE_THRESHOLD):
+        self.threshold = threshold
+        self.version = MODEL_VERSION
+        self.vectorizer = TfidfVectorizer(analyzer="char", ngram_range=NGRAM_RANGE, min_df=MIN_DF,
+                                          max_features=MAX_FEATURES, sublinear_tf=True)
+        self.sentiment_model = LogisticRegression(C=C, max_iter=1000)
+        self.emotion_model = LogisticRegression(C=C, max_iter=1000)
+        self.intensity_model = Ridge(alpha=RIDGE_ALPHA)
+
+    def fit(self, messages: Sequence[str], labels: pd.DataFrame) -> "LocalSentimentModel":
+        """labels含sentiment、intensity、emotion_type三列，与messages逐行对应"""
+        X = self.vectorizer.fit_transform([normalize_message(m) for m in messages])
+        self.sentiment_model.fit(X, labels["sentiment"].astype(str))
+        self.emotion_model.fit(X, labels["emotion_type"].astype(str))
+        self.intensity_model.fit(X, labels["intensity"].astype(float))
+        return self
+
+    def predict(self, messages: Sequence[str], threshold: Optional[float] = None) -> pd.DataFrame:
+        """批量预测，返回sentiment、intensity、emotion_type、confidence（两个分类概率的较小者）、confident列"""
+        threshold = self.threshold if threshold is None else threshold
+        X = self.vectorizer.transform([normalize_message(m) for m in messages])
+        sentiment_proba = self.sentiment_model.predict_proba(X)
+        emotion_proba = self.emotion_model.predict_proba(X)
+        confidence = np.minimum(sentiment_proba.max(axis=1), emotion_proba.max(axis=1))
+        return pd.DataFrame({
+            "sentiment": self.sentiment_model.classes_[sentiment_proba.argmax(axis=1)],
+            "intensity": np.clip(np.rint(self.intensity_model.predict(X)), 0, 10).astype(int),
+            "emotion_type": self.emotion_model.classes_[emotion_proba.argmax(axis=1)],
+            "confidence": confidence,
+            "confident": confidence >= threshold,
+        })
+
+
+def save_model(model: LocalSentimentModel, path: str = MODEL_PATH) -> str:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(model, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+    return path
+
+
+def load_model(path: str = MODEL_PATH) -> Optional[LocalSentimentModel]:
+    """读取模型；文件不存在或版本不符时返回None"""
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        model = pickle.load(f)
+    return model if getattr(model, "version", None) == MODEL_VERSION else None
+
+
+# -------------------------- 3. 训练数据 --------------------------
+def training_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """LLM标注的训练样本：只保留LLM给出的结果（不含本地模型自己的标注）和合规标签，同一文本只保留一条"""
+    if "label_source" in df.columns:
+        df = df[df["label_source"].astype(str) == "llm"]
+    df = df[df["message"].notna()
+            & df["sentiment"].astype(str).isin(ALLOWED_SENTIMENTS)
+            & df["emotion_type"].astype(str).isin(ALLOWED_EMOTIONS)]
+    df = df.assign(text=df["message"].astype(str).map(normalize_message))
+    df = df[df["text"].str.len() > 0].drop_duplicates("text")
+    return df[["text", "sentiment", "intensity", "emotion_type"]].reset_index(drop=True)
+
+
+# -------------------------- 4. 评估 --------------------------
+def evaluate(train: pd.DataFrame, test: pd.DataFrame, thresholds: Sequence[float] = EVAL_THRESHOLDS) -> pd.DataFrame:
+    """在留出集上对比本地预测与LLM标注：每个阈值下本地直接采用的比例（即减少的API调用比例）、
+    采用部分与LLM的一致率，以及其余交给LLM后整体的一致率"""
+    model = LocalSentimentModel().fit(train["text"], train)
+    start = time.perf_counter()
+    pred = model.predict(test["text"].tolist(), threshold=0.0)
+    rows_per_s = len(test) / max(time.perf_counter() - start, 1e-9)
+
+    sentiment_ok = pred["sentiment"].to_numpy() == test["sentiment"].astype(str).to_numpy()
+    emotion_ok = pred["emotion_type"].to_numpy() == test["emotion_type"].astype(str).to_numpy()
+    intensity_err = np.abs(pred["intensity"].to_numpy() - test["intensity"].to_numpy(dtype=float))
+    rows = []
+    for threshold in [0.0] + list(thresholds):
+        local = pred["confidence"].to_numpy() >= threshold
+        n_local = int(local.sum())
+        rows.append({
+            "阈值": threshold,
+            "本地采用比例": n_local / len(test),          # = API调用减少的比例
+            "情感倾向一致率": sentiment_ok[local].mean() if n_local else np.nan,
+            "情感大类一致率": emotion_ok[local].mean() if n_local else np.nan,
+            "强度平均绝对误差": intensity_err[local].mean() if n_local else np.nan,
+            "强度误差≤1比例": (intensity_err[local] <= 1).mean() if n_local else np.nan,
+            "整体情感大类一致率": (emotion_ok[local].sum() + (len(test) - n_local)) / len(test),
+        })
+    report = pd.DataFrame(rows)
+    report.attrs["rows_per_s"] = rows_per_s
+    return report
+
+
+def train_and_report(df: pd.DataFrame, threshold: float = CONFIDENCE_THRESHOLD,
+                     test_size: float = TEST_SIZE, random_state: int = RANDOM_STATE):
+    """留出集评估后用全部样本重新训练，返回(模型, 评估表)"""
+    data = training_frame(df)
+    train, test = train_test_split(data, test_size=test_size, random_state=random_state,
+                                   stratify=data["emotion_type"].astype(str))
+    report = evaluate(train, test)
+    model = LocalSentimentModel(threshold).fit(data["text"], data)
+    return model, report
+
+
+# -------------------------- 5. 运行入口 --------------------------
+if __name__ == "__main__":
+    import local_sentiment  # 通过模块名构建模型，pickle中记录的类路径为local_sentiment而不是__main__
+    from data_store import load_table
+
+    df = load_table("emotion")
+    model, report = local_sentiment.train_and_report(df)
+    save_model(model)
+    report.to_csv(REPORT_CSV_PATH, index=False, encoding="utf-8-sig")
+
+    print(f"训练样本：{len(training_frame(df))}条（去重后），留出{TEST_SIZE:.0%}评估")
+    print(f"本地标注速度：约{report.attrs['rows_per_s']:.0f}条/秒")
+    print(report.round(3).to_string(index=False))
+    chosen = report[report["阈值"] == CONFIDENCE_THRESHOLD].iloc[0]
+    print(f"\n阈值{CONFIDENCE_THRESHOLD}：API调用减少{chosen['本地采用比例']:.1%}，"
+          f"采用部分情感大类一致率{chosen['情感大类一致率']:.1%}，整体一致率{chosen['整体情感大类一致率']:.1%}")
+    print(f"模型已保存到：{MODEL_PATH}")
+    print(f"评估结果已保存到：{REPORT_CSV_PATH}")
@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+"""
+功能：各阶段的耗时与计数埋点（进程内汇总，可导出为Prometheus文本或JSON Lines）
+span()记录一段代码的耗时（次数/总和/最大值），incr()累加计数（API重试、回退为无情绪等），observe()记录数值分布（回调负载大小等）；
+设置环境变量METRICS_DIR后，每个事件追加写入METRICS_DIR/events.jsonl，进程退出时写出Prometheus文本；
+设置METRICS_PROFILE后，对应span在cProfile下运行并保存.prof文件（可用snakeviz或pstats查看）
+"""
+
+import atexit
+import cProfile
+import json
+import os
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Tuple
+
+# -------------------------- 1. 基础配置 --------------------------
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+METRICS_DIR = os.environ.get("METRICS_DIR") or None      # 不设置时只在进程内汇总，不写文件
+PROFILE_SPANS = os.environ.get("METRICS_PROFILE", "")    # 需要cProfile采集的span名（逗号分隔），"1"或"all"为全部
+PROFILE_DIR = os.path.join(METRICS_DIR or os.path.join(BASE_DIR, "data", "processed_data", "metrics"), "profiles")
+
+_lock = threading.Lock()
+_event_lock = threading.Lock()
+_counters: Dict[Tuple, float] = {}
+_summaries: Dict[Tuple, List[float]] = {}   # (名称, 标签) → [次数, 总和, 最大值]
+_events_file = None
+_profiling = False
+_NAME_INVALID = re.compile(r"[^a-zA-Z0-9_:]")
+
+
+def _key(name: str, labels: Dict) -> Tuple:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _emit(kind: str, name: str, labels: Dict, value: float):
+    """METRICS_DIR已设置时把事件追加写入events.jsonl（多个进程可同时追加，每个事件一行）"""
+    global _events_file
+    if METRICS_DIR is None:
+        return
+    line = json.dumps({"ts": round(time.time(), 3), "pid": os.getpid(), "type": kind, "name": name,
+                       "labels": {k: str(v) for k, v in labels.items()}, "value": value}, ensure_ascii=False)
+    with _event_lock:
+        if _events_file is None:
+            os.makedirs(METRICS_DIR, exist_ok=True)
+            _events_file = open(os.path.join(METRICS_DIR, "events.jsonl"), "a", encoding="utf-8", buffering=1)
+        _events_file.write(line + "\n")
+
+
+# -------------------------- 2. 埋点接口 --------------------------
+def incr(name: str, value: float = 1, **labels):
+    """计数器累加（如incr("api_retries", reason="429")）"""
+    if not value:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+    _emit("counter", name, labels, value)
+
+
+def observe(name: str, value: float, **labels):
+    """记录一个观测值（次数、总和、最大值）"""
+    key = _key(name, labels)
+    with _lock:
+        stats = _summaries.setdefault(key, [0, 0.0, float("-inf")])
+        stats[0] += 1
+        stats[1] += value
+        stats[2] = max(stats[2], value)
+    _emit("observe", name, labels, value)
+
+
+def _should_profile(name: str) -> bool:
+    if not PROFILE_SPANS:
+        return False
+    return PROFILE_SPANS in ("1", "all") or name in {s.strip() for s in PROFILE_SPANS.split(",")}
+
+
+@contextmanager
+def span(name: str, **labels):
+    """记录with块的耗时到“{name}_seconds”；也可作装饰器（@span("lda.train")）
+    METRICS_PROFILE包含该span时在cProfile下运行（同一时刻只采集一个span，只采集进入span的线程）"""
+    global _profiling
+    profiler = None
+    if _should_profile(name):
+        with _lock:
+            if not _profiling:
+                _profiling = True
+                profiler = cProfile.Profile()
+    start = time.perf_counter()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        observe(f"{name}_seconds", time.perf_counter() - start, **labels)
+        if profiler is not None:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            profiler.dump_stats(os.path.join(PROFILE_DIR, f"{name}_{os.getpid()}_{int(time.time() * 1000)}.prof"))
+            with _lock:
+                _profiling = False
+
+
+# -------------------------- 3. 导出 --------------------------
+def snapshot() -> Dict[str, List[Dict]]:
+    """当前进程的全部计数与观测汇总"""
+    with _lock:
+        counters = [{"name": n, "labels": dict(l), "value": v} for (n, l), v in sorted(_counters.items())]
+        summaries = [{"name": n, "labels": dict(l), "count": s[0], "sum": s[1], "max": s[2]}
+                     for (n, l), s in sorted(_summaries.items())]
+    return {"counters": counters, "summaries": summaries}
+
+
+def _prom_name(name: str) -> str:
+    return _NAME_INVALID.sub("_", name)
+
+
+def _prom_labels(labels: Dict) -> str:
+    if not labels:
+        return ""
+    escape = lambda v: str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{escape(v)}"' for k, v in labels.items()) + "}"
+
+
+def prometheus_text() -> str:
+    """Prometheus文本格式：计数器为{name}_total，观测值为summary（_count/_sum）加{name}_max"""
+    data = snapshot()
+    lines, typed = [], set()
+    for c in data["counters"]:
+        name = _prom_name(c["name"]) + "_total"
+        if name not in typed:
+            lines.append(f"# TYPE {name} counter")
+            typed.add(name)
+        lines.append(f"{name}{_prom_labels(c['labels'])} {c['value']:g}")
+    for s in data["summaries"]:
+        name = _prom_name(s["name"])
+        if name not in typed:
+            lines += [f"# TYPE {name} summary", f"# TYPE {name}_max gauge"]
+            typed.add(name)
+        labels = _prom_labels(s["labels"])
+        lines += [f"{name}_count{labels} {s['count']}", f"{name}_sum{labels} {s['sum']:.6g}",
+                  f"{name}_max{labels} {s['max']:.6g}"]
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus(path: str) -> str:
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(prometheus_text())
+    os.replace(tmp_path, path)
+    return path
+
+
+def summary() -> str:
+    """控制台打印用的简要汇总（每个计数/耗时一行）"""
+    data = snapshot()
+    lines = []
+    for c in data["counters"]:
+        labels = ",".join(f"{k}={v}" for k, v in c["labels"].items())
+        lines.append(f"  {c['name']}{f'[{labels}]' if labels else ''}: {c['value']:g}")
+    for s in data["summaries"]:
+        labels = ",".join(f"{k}={v}" for k, v in s["labels"].items())
+        lines.append(f"  {s['name']}{f'[{labels}]' if labels else ''}: {s['count']}次，"
+                     f"合计{s['sum']:.3f}，平均{s['sum'] / s['count']:.3f}，最大{s['max']:.3f}")
+    return "\n".join(lines)
+
+
+def _write_on_exit():
+    if METRICS_DIR is None or not (_counters or _summaries):
+        return
+    script = os.path.splitext(os.path.basename(sys.argv[0] or ""))[0].lstrip("-") or "python"
+    write_prometheus(os.path.join(METRICS_DIR, f"{script}_{os.getpid()}.prom"))
+
+
+atexit.register(_write_on_exit)
+
+
+# -------------------------- 4. Dash回调埋点 --------------------------
+def instrument_dash(app):
+    """记录每个Dash回调请求的耗时与响应大小（按回调函数名区分），并提供/metrics（Prometheus文本）
+    gunicorn多worker时每个worker各自汇总，/metrics返回处理该请求的worker的数据"""
+    from flask import Response, g, request
+
+    server = app.server
+
+    @server.before_request
+    def _start_timer():
+        g._metrics_start = time.perf_counter()
+
+    @server.after_request
+    def _record_callback(response):
+        start = getattr(g, "_metrics_start", None)
+        if start is None or not request.path.endswith("_dash-update-component"):
+            return response
+        output = (request.get_json(silent=True) or {}).get("output", "")
+        callback = app.callback_map.get(output, {}).get("callback")
+        name = getattr(callback, "__name__", output)
+        size = response.calculate_content_length()
+        observe("dash_callback_seconds", time.perf_counter() - start, callback=name)
+        observe("dash_payload_bytes", size if size is not None else len(response.get_data()), callback=name)
+        incr("dash_callback_requests", callback=name, status=response.status_code)
+        return response
+
+    @server.route("/metrics")
+    def _metrics():
+        return Response(prometheus_text(), mimetype="text/plain; version=0.0.4")
+
+    return app
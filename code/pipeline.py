@@ -0,0 +1,304 @@
+# -*- coding: utf-8 -*-
+"""
+功能：整条分析流程的阶段依赖图（DAG）运行器
+每个阶段声明脚本、依赖、输入/输出文件与关键参数；阶段指纹 = 输入文件内容哈希 + 参数取值 + 脚本及其导入的code/下模块的代码（忽略注释与排版），
+指纹未变且输出齐全的阶段直接跳过（上游重跑但输出内容没变时，下游也会跳过）；互不依赖的阶段
+（聚类、LDA、统计检验、导出图）在线程池中以子进程并行运行，各阶段输出写入日志文件
+"""
+
+import ast
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, Iterable, List, Optional
+
+import metrics
+
+# -------------------------- 1. 基础配置 --------------------------
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CODE_DIR = os.path.join(BASE_DIR, "code")
+RAW_DIR = os.path.join(BASE_DIR, "data", "raw_data")
+PROCESSED_DIR = os.path.join(BASE_DIR, "data", "processed_data")
+FIGURE_DIR = os.path.join(BASE_DIR, "results", "figures")
+STATE_PATH = os.path.join(PROCESSED_DIR, "pipeline_state.json")
+LOG_DIR = os.path.join(PROCESSED_DIR, "pipeline_logs")
+MAX_PARALLEL = 4   # 同时运行的阶段数
+
+
+def _raw(name):
+    return os.path.join(RAW_DIR, name)
+
+
+def _processed(name):
+    return os.path.join(PROCESSED_DIR, name)
+
+
+# 阶段定义（按依赖顺序书写）：
+#   script：code/下的脚本；cwd：运行目录（脚本中使用相对路径时指定）；deps：依赖的阶段
+#   inputs/outputs：输入输出文件；params：计入指纹的脚本内常量名（含__main__中的配置）；env：运行所需的环境变量
+STAGES: Dict[str, Dict] = {
+    "spatial": {
+        "script": "spatial_fusion.py", "deps": [],
+        "inputs": [_raw(f"Nanjing_AOI.{ext}") for ext in ("shp", "shx", "dbf", "cpg")] + [_raw("南京市_20231114_1119.csv")],
+        "outputs": [_processed("南京景区-签到空间关联表.csv")],
+        "params": ["CHECKIN_ENCODING"],
+    },
+    "weather": {
+        "script": "weather_fusion.py", "deps": ["spatial"],
+        "inputs": [_processed("南京景区-签到空间关联表.csv")],
+        "outputs": [_processed("南京景区-天气-社媒情感融合表.csv"), _processed("南京每日天气表.csv")],
+        "params": ["COMPACT_OUTPUT", "WEATHER_TEXT_COLUMNS", "WEATHER_CATEGORY_ORDER"],
+    },
+    "sentiment": {
+        "script": "ds情感分析.py", "cwd": PROCESSED_DIR, "deps": ["weather"], "env": ["DEEPSEEK_API_KEY"],
+        "inputs": [_processed("南京景区-天气-社媒情感融合表.csv")],
+        "outputs": [_processed("情感分析结果（限制情感大类）.csv")],
+        "params": ["ALLOWED_EMOTIONS", "EMOTION_FEW_SHOT", "MODEL_NAME", "PROMPT_VERSION", "DEFAULT_EMOTION", "USE_LOCAL_MODEL",
+                   "NEAR_DUP_THRESHOLD"],
+    },
+    "snapshots": {
+        "script": "data_store.py", "deps": ["weather", "sentiment"],
+        "inputs": [_processed("南京景区-天气-社媒情感融合表.csv"), _processed("情感分析结果（限制情感大类）.csv")],
+        "outputs": [os.path.join(PROCESSED_DIR, "parquet", f"{name}.parquet") for name in ("fused", "emotion")],
+        "params": ["VALID_EMOTION_TYPES", "INVALID_EMOTION_LABEL", "SENTIMENT_ORDER", "CATEGORY_COLUMNS"],
+    },
+    "clustering": {
+        "script": "景区聚类.py", "deps": ["snapshots"],
+        "inputs": [_processed("情感分析结果（限制情感大类）.csv")],
+        "outputs": [_processed("景区聚类结果.csv"), os.path.join(FIGURE_DIR, "轮廓系数图.png"),
+                    os.path.join(FIGURE_DIR, "聚类结果散点图.png")],
+        "params": ["cluster_range", "N_INIT", "SILHOUETTE_MODE", "INCREMENTAL_MODE"],
+    },
+    "lda": {
+        "script": "lda_cpu.py", "cwd": PROCESSED_DIR, "deps": ["snapshots"],
+        "inputs": [_processed("南京景区-天气-社媒情感融合表.csv")],
+        "outputs": [_processed("全量数据_带主题_最终版.csv"), _processed("LDA主题模型.npz")],
+        "params": ["TABLE_NAME", "N_TOPICS", "NO_BELOW", "NO_ABOVE", "KEEP_N", "MAX_ITER", "EVALUATE_EVERY", "TOL",
+                   "DEDUP_DOCUMENTS"],
+    },
+    "statistics": {
+        "script": "stat_tests.py", "deps": ["snapshots"],
+        "inputs": [_processed("情感分析结果（限制情感大类）.csv")],
+        "outputs": [_processed("统计检验_分片结果.csv"), _processed("统计检验_分组均值.csv")],
+        "params": ["MIN_SAMPLE", "N_RESAMPLES", "FDR_ALPHA", "RANDOM_STATE", "DEFAULT_FAMILY"],
+    },
+    "figures": {
+        "script": "render_figures.py", "deps": ["snapshots"],
+        "inputs": [_processed("情感分析结果（限制情感大类）.csv")],
+        "outputs": [os.path.join(PROCESSED_DIR, "figure_cache", "render_manifest.json")],
+        "params": ["RENDER_VERSION", "DPI", "WORDCLOUD_EMOTIONS", "FORCE"],
+    },
+}
+
+
+# -------------------------- 2. 指纹 --------------------------
+def file_digest(path: str, cache: Dict[str, List]) -> Optional[str]:
+    """文件内容的SHA-256（按(大小, 修改时间)缓存，文件未动时不重新读取）；文件不存在返回None"""
+    if not os.path.exists(path):
+        return None
+    stat = os.stat(path)
+    cached = cache.get(path)
+    if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+        return cached[2]
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    cache[path] = [stat.st_size, stat.st_mtime_ns, digest.hexdigest()]
+    return cache[path][2]
+
+
+def script_params(tree: ast.Module, names: Iterable[str]) -> Dict[str, str]:
+    """脚本中常量的取值（按源码表达式），包括顶层if块（如__main__）中的赋值；不执行脚本"""
+    wanted = set(names)
+    found = {}
+    nodes = list(tree.body)
+    nodes += [child for node in tree.body if isinstance(node, ast.If) for child in node.body]
+    for node in nodes:
+        if isinstance(node, ast.Assign):
+            for target in node.targets:
+                if isinstance(target, ast.Name) and target.id in wanted:
+                    found[target.id] = ast.unparse(node.value)
+    return {name: found.get(name, "<未定义>") for name in names}
+
+
+def _parse(path: str) -> ast.Module:
+    with open(path, "r", encoding="utf-8") as f:
+        return ast.parse(f.read())
+
+
+def _code_digest(tree: ast.Module) -> str:
+    return hashlib.sha256(ast.dump(tree).encode("utf-8")).hexdigest()
+
+
+def local_modules(tree: ast.Module) -> Dict[str, ast.Module]:
+    """脚本直接或间接导入的code/下模块（含函数内的延迟导入）：模块名 → 语法树"""
+    found = {}
+    pending = [tree]
+    while pending:
+        for node in ast.walk(pending.pop()):
+            if isinstance(node, ast.Import):
+                names = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+                names = [node.module]
+            else:
+                continue
+            for module in (name.split(".")[0] for name in names):
+                path = os.path.join(CODE_DIR, module + ".py")
+                if module not in found and os.path.exists(path):
+                    found[module] = _parse(path)
+                    pending.append(found[module])
+    return found
+
+
+def stage_fingerprint(name: str, file_cache: Dict[str, List]) -> Dict:
+    """阶段指纹的各组成部分：输入文件哈希、参数取值、脚本代码哈希、所导入的code/下模块的代码哈希（基于语法树，注释和排版不影响）"""
+    stage = STAGES[name]
+    tree = _parse(os.path.join(CODE_DIR, stage["script"]))
+    script_module = os.path.splitext(stage["script"])[0]
+    parts = {
+        "inputs": {os.path.relpath(path, BASE_DIR): file_digest(path, file_cache) for path in stage["inputs"]},
+        "params": script_params(tree, stage.get("params", [])),
+        "code": _code_digest(tree),
+        "modules": {module: _code_digest(module_tree) for module, module_tree in sorted(local_modules(tree).items())
+                    if module != script_module},
+    }
+    parts["digest"] = hashlib.sha256(json.dumps(parts, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+    return parts
+
+
+def describe_changes(old: Optional[Dict], new: Dict) -> List[str]:
+    """指纹变化的原因（哪些输入、参数、代码变了）"""
+    if not old:
+        return ["首次运行"]
+    reasons = [f"输入 {path}" for path, digest in new["inputs"].items() if old["inputs"].get(path) != digest]
+    reasons += [f"参数 {key}: {old['params'].get(key)} → {value}" for key, value in new["params"].items()
+                if old["params"].get(key) != value]
+    if old.get("code") != new["code"]:
+        reasons.append("脚本代码")
+    reasons += [f"模块 {module}.py" for module, digest in new["modules"].items()
+                if old.get("modules", {}).get(module) != digest]
+    return reasons or ["输出缺失"]
+
+
+def _load_state() -> Dict:
+    if not os.path.exists(STATE_PATH):
+        return {"stages": {}, "files": {}}
+    with open(STATE_PATH, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _save_state(state: Dict):
+    os.makedirs(os.path.dirname(STATE_PATH), exist_ok=True)
+    with open(STATE_PATH + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, indent=1)
+    os.replace(STATE_PATH + ".tmp", STATE_PATH)
+
+
+# -------------------------- 3. 运行 --------------------------
+def run_stage(name: str) -> int:
+    """以子进程运行阶段脚本（无界面绘图后端），标准输出与错误写入日志文件，返回退出码"""
+    stage = STAGES[name]
+    os.makedirs(LOG_DIR, exist_ok=True)
+    env = dict(os.environ, MPLBACKEND="Agg", PYTHONIOENCODING="utf-8",
+               PYTHONPATH=os.pathsep.join(filter(None, [CODE_DIR, os.environ.get("PYTHONPATH")])))
+    with open(os.path.join(LOG_DIR, f"{name}.log"), "w", encoding="utf-8") as log, \
+            metrics.span("pipeline.stage", stage=name):
+        return subprocess.run([sys.executable, os.path.join(CODE_DIR, stage["script"])],
+                              cwd=stage.get("cwd", CODE_DIR), env=env, stdout=log, stderr=subprocess.STDOUT).returncode
+
+
+def _with_ancestors(targets: Iterable[str]) -> List[str]:
+    selected, todo = set(), list(targets)
+    while todo:
+        name = todo.pop()
+        if name not in STAGES:
+            raise KeyError(f"未知的阶段：{name}（可选：{', '.join(STAGES)}）")
+        if name not in selected:
+            selected.add(name)
+            todo.extend(STAGES[name]["deps"])
+    return [name for name in STAGES if name in selected]
+
+
+def run_pipeline(targets: Optional[Iterable[str]] = None, force: Iterable[str] = (), dry_run: bool = False,
+                 max_parallel: int = MAX_PARALLEL) -> Dict[str, Dict]:
+    """运行targets（默认全部）及其上游阶段；返回{阶段: {status, seconds, reasons}}
+    status：skipped=指纹未变跳过；ran=已运行；failed=运行失败（下游标记为blocked）；
+    unavailable=缺少输入文件或环境变量，无法运行（沿用已有输出，下游按自己的输入继续）；pending=dry_run时将要运行"""
+    selected = _with_ancestors(targets or list(STAGES))
+    force = set(force)
+    state = _load_state()
+    file_cache = state.setdefault("files", {})
+    results: Dict[str, Dict] = {}
+    running = {}
+
+    def schedule(name):
+        stage = STAGES[name]
+        missing = [os.path.relpath(p, BASE_DIR) for p in stage["inputs"] if not os.path.exists(p)]
+        outputs_ready = all(os.path.exists(p) for p in stage["outputs"])
+        if missing:
+            keep = "沿用已有输出" if any(os.path.exists(p) for p in stage["outputs"]) else "且没有已有输出"
+            return {"status": "unavailable", "reasons": [f"缺少输入 {', '.join(missing)}，{keep}"]}
+        fingerprint = stage_fingerprint(name, file_cache)
+        previous = state["stages"].get(name)
+        if name not in force and outputs_ready and previous and previous["digest"] == fingerprint["digest"]:
+            return {"status": "skipped", "reasons": []}
+        reasons = ["强制重跑"] if name in force else describe_changes(previous, fingerprint)
+        missing_env = [var for var in stage.get("env", []) if not os.environ.get(var)]
+        if missing_env:
+            return {"status": "unavailable", "reasons": [f"未设置环境变量 {', '.join(missing_env)}，沿用已有输出"] + reasons}
+        if dry_run:
+            return {"status": "pending", "reasons": reasons}
+        print(f"▶ 运行 {name}：{'；'.join(reasons)}")
+        running[name] = (pool.submit(run_stage, name), time.perf_counter(), fingerprint, reasons)
+        return None
+
+    with ThreadPoolExecutor(max_workers=max_parallel) as pool:
+        waiting = list(selected)
+        while waiting or running:
+            for name in list(waiting):
+                deps = [d for d in STAGES[name]["deps"] if d in selected]
+                if any(results.get(d, {}).get("status") in ("failed", "blocked") for d in deps):
+                    results[name] = {"status": "blocked", "reasons": ["上游阶段失败"]}
+                elif all(d in results for d in deps):
+                    outcome = schedule(name)
+                    if outcome is not None:
+                        results[name] = outcome
+                else:
+                    continue
+                waiting.remove(name)
+            if not running:
+                continue
+            done, _ = wait([item[0] for item in running.values()], return_when=FIRST_COMPLETED)
+            for name, (future, start, fingerprint, reasons) in list(running.items()):
+                if future not in done:
+                    continue
+                del running[name]
+                seconds = round(time.perf_counter() - start, 1)
+                code = future.result()
+                if code == 0:
+                    state["stages"][name] = fingerprint
+                    _save_state(state)
+                    results[name] = {"status": "ran", "seconds": seconds, "reasons": reasons}
+                else:
+                    results[name] = {"status": "failed", "seconds": seconds,
+                                     "reasons": [f"退出码{code}，见{os.path.join(LOG_DIR, name + '.log')}"]}
+                print(f"{'✔' if code == 0 else '✘'} {name}：{seconds}秒")
+    _save_state(state)
+    return {name: results[name] for name in selected}
+
+
+# -------------------------- 4. 运行入口 --------------------------
+if __name__ == "__main__":
+    TARGETS = None     # 只刷新这些阶段（及其上游），None为全部，如["clustering", "figures"]
+    FORCE = []         # 忽略指纹强制重跑的阶段
+    DRY_RUN = False    # True时只列出将要运行的阶段及原因
+
+    summary = run_pipeline(TARGETS, force=FORCE, dry_run=DRY_RUN)
+    print("\n阶段         状态          耗时(秒)  原因")
+    for name, result in summary.items():
+        print(f"{name:<12} {result['status']:<12} {str(result.get('seconds', '')):>8}  {'；'.join(result['reasons'])}")
@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+"""
+功能：描述性统计笔记本静态图的批量导出（无界面、并行、增量）
+各透视表只计算一次（analysis_pivots，与仪表盘同一口径），每张图在进程池中直接用Agg画布并行绘制（不经过pyplot），
+PNG直接写入results/figures/与仪表盘assets/可视化图片/；图的输入数据指纹未变且文件都在时跳过重绘
+"""
+
+import hashlib
+import importlib.util
+import io
+import json
+import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+import matplotlib
+import matplotlib.font_manager as fm
+import pandas as pd
+import seaborn as sns
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from analysis_pivots import (TYPICAL_WEATHER, add_analysis_columns, box_stats, emotion_mean_intensity,
+                             group_mean_ci, mean_pivot, share_pivot, top_emotion_intensity, top_keywords)
+from data_store import PROCESSED_DIR, load_table
+import metrics
+
+# -------------------------- 1. 基础配置 --------------------------
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIGURE_DIRS = [
+    os.path.join(BASE_DIR, "results", "figures"),
+    os.path.join(BASE_DIR, "results", "可视化dash表盘", "assets", "可视化图片"),
+]
+MANIFEST_PATH = os.path.join(PROCESSED_DIR, "figure_cache", "render_manifest.json")
+RENDER_VERSION = "v1"   # 修改绘图代码后递增，所有图强制重绘
+DPI = 300
+CHINESE_FONTS = ["SimHei", "WenQuanYi Zen Hei", "Microsoft YaHei", "DejaVu Sans"]
+WORDCLOUD_EMOTIONS = ["怀旧", "愉悦"]
+INPUT_COLUMNS = ["mid", "message", "tag5", "sentiment", "intensity", "emotion_type", "天气", "降水", "低能见度"]
+
+RC_PARAMS = {"font.sans-serif": CHINESE_FONTS, "axes.unicode_minus": False}
+
+
+# -------------------------- 2. 绘图函数（只画传入的小表） --------------------------
+def _new_axes(figsize):
+    """直接创建Agg画布上的Figure（不经过pyplot，不改变调用方的后端，不弹窗，可在子进程中绘图）"""
+    fig = Figure(figsize=figsize)
+    FigureCanvasAgg(fig)
+    return fig, fig.add_subplot()
+
+
+def plot_heatmap(data: pd.DataFrame, title: str, cmap: str, fmt: str, figsize=(12, 6)):
+    fig, ax = _new_axes(figsize)
+    sns.heatmap(data, annot=True, cmap=cmap, fmt=fmt, ax=ax)
+    ax.set_title(title)
+    return fig
+
+
+def plot_grouped_bar(stats: pd.DataFrame, x: str, hue: str, title: str, ylabel: str, legend: str):
+    """分组柱状图，误差线为95%置信区间（group_mean_ci的正态近似）"""
+    means = stats.pivot(index=x, columns=hue, values="mean")
+    errors = stats.pivot(index=x, columns=hue, values="ci95")
+    fig, ax = _new_axes((10, 5))
+    means.plot(kind="bar", yerr=errors, capsize=3, ax=ax)
+    ax.set_title(title)
+    ax.set_xlabel(x)
+    ax.set_ylabel(ylabel)
+    ax.tick_params(axis="x", rotation=45)
+    ax.legend(title=legend)
+    return fig
+
+
+def plot_box(stats: pd.DataFrame, title: str, xlabel: str, ylabel: str):
+    """由box_stats的四分位数与须线画箱线图（不需要原始数据，不画离群点）"""
+    boxes = [{"label": str(label), "q1": row["q1"], "med": row["median"], "q3": row["q3"],
+              "whislo": row["lowerfence"], "whishi": row["upperfence"], "fliers": []}
+             for label, row in stats.iterrows()]
+    fig, ax = _new_axes((12, 6))
+    ax.bxp(boxes, showfliers=False, patch_artist=True,
+           boxprops={"facecolor": sns.color_palette()[0], "alpha": 0.8})
+    ax.set_title(title)
+    ax.set_xlabel(xlabel)
+    ax.set_ylabel(ylabel)
+    ax.tick_params(axis="x", rotation=45)
+    return fig
+
+
+def plot_stacked_share(data: pd.DataFrame, title: str, ylabel: str, legend: str):
+    fig, ax = _new_axes((12, 6))
+    data.plot(kind="bar", stacked=True, colormap="Set2", ax=ax)
+    ax.set_title(title)
+    ax.set_ylabel(ylabel)
+    ax.tick_params(axis="x", rotation=45)
+    ax.legend(title=legend)
+    return fig
+
+
+def plot_bar(data: pd.Series, title: str, xlabel: str, ylabel: str):
+    fig, ax = _new_axes((10, 5))
+    ax.bar(data.index.astype(str), data.values, color=sns.color_palette()[0])
+    for i, value in enumerate(data.values):
+        ax.text(i, value, f"{value:.2f}", ha="center", va="bottom")
+    ax.set_title(title)
+    ax.set_xlabel(xlabel)
+    ax.set_ylabel(ylabel)
+    ax.tick_params(axis="x", rotation=45)
+    return fig
+
+
+def plot_wordcloud(keywords, title: str):
+    from wordcloud import WordCloud
+    wc = WordCloud(font_path=fm.findfont(fm.FontProperties(family=CHINESE_FONTS)),
+                   background_color="white", width=800, height=400).generate_from_frequencies(dict(keywords))
+    fig, ax = _new_axes((10, 5))
+    ax.imshow(wc)
+    ax.axis("off")
+    ax.set_title(title)
+    return fig
+
+
+# -------------------------- 3. 各图的输入（透视表只算一次） --------------------------
+def figure_inputs(df: pd.DataFrame) -> Dict[str, Tuple[Callable, Dict]]:
+    """{图名（即文件名）: (绘图函数, 参数)}，参数中的表即该图的全部输入数据"""
+    emotion_sentiment = share_pivot(df, "emotion_type", "sentiment")
+    inputs = {
+        "天气-景区情感热力图": (plot_heatmap, dict(
+            data=mean_pivot(df, "tag5", "原始天气类型"), title="全天气类型×景区类型的平均情感得分热力图",
+            cmap="YlGnBu", fmt=".1f")),
+        "降水-景区情感对比": (plot_grouped_bar, dict(
+            stats=group_mean_ci(df, "tag5", "是否降水"), x="tag5", hue="是否降水",
+            title="降水/无降水天气下不同景区类型的情感得分", ylabel="情感得分（正值=正面，绝对值=强度）", legend="天气类型")),
+        "能见度-景区情感对比": (plot_grouped_bar, dict(
+            stats=group_mean_ci(df, "tag5", "能见度等级"), x="tag5", hue="能见度等级",
+            title="低/高能见度下不同景区类型的情感得分（雾~晴=低能见度）", ylabel="情感得分", legend="能见度等级")),
+        "天气情感分布箱线图": (plot_box, dict(
+            stats=box_stats(df, "原始天气类型"), title="各天气类型的情感得分分布对比",
+            xlabel="原始天气类型", ylabel="情感得分")),
+        "景区-情感类型占比": (plot_heatmap, dict(
+            data=share_pivot(df, "tag5", "emotion_type"), title="不同景区类型中各情感类型的占比",
+            cmap="YlOrRd", fmt=".1%")),
+        "天气-情感类型占比": (plot_heatmap, dict(
+            data=share_pivot(df[df["原始天气类型"].isin(TYPICAL_WEATHER)], "原始天气类型", "emotion_type"),
+            title="典型天气中各情感类型的占比", cmap="YlOrRd", fmt=".1%")),
+        "三维交叉-情感强度": (plot_heatmap, dict(
+            data=top_emotion_intensity(df), title="景区×天气×TOP3情感类型的平均强度",
+            cmap="YlGnBu", fmt=".1f", figsize=(15, 6))),
+        "情感类型-正负倾向": (plot_stacked_share, dict(
+            data=emotion_sentiment, title="各情感类型中正面/负面/中性的占比", ylabel="占比", legend="情感方向")),
+        "不同情绪类型的平均强度": (plot_bar, dict(
+            data=emotion_mean_intensity(df), title="不同情绪类型的平均强度", xlabel="情感类型", ylabel="平均强度")),
+    }
+    if importlib.util.find_spec("wordcloud") is None:
+        print("提示：未安装wordcloud库，跳过词云图（pip install wordcloud可安装）")
+        return inputs
+    for emotion in WORDCLOUD_EMOTIONS:
+        subset = df[df["emotion_type"] == emotion]
+        keywords = top_keywords(subset["message"], subset["mid"])
+        if keywords:
+            title = f"“{emotion}”情感关键词云"
+            inputs[title] = (plot_wordcloud, dict(keywords=keywords, title=title))
+    return inputs
+
+
+def input_fingerprint(plot: Callable, kwargs: Dict) -> str:
+    """图的输入指纹：绘图函数名 + 参数（含透视表）的内容哈希"""
+    digest = hashlib.sha256(f"{RENDER_VERSION}|{plot.__name__}".encode())
+    digest.update(pickle.dumps(kwargs, protocol=4))
+    return digest.hexdigest()[:16]
+
+
+# -------------------------- 4. 并行绘制与写出 --------------------------
+def render_figure(name: str, plot: Callable, kwargs: Dict) -> str:
+    """绘制一张图，PNG写入所有输出目录（先写临时文件再替换）"""
+    with metrics.span("figures.render", figure=name), matplotlib.rc_context(RC_PARAMS):
+        fig = plot(**kwargs)
+        fig.tight_layout()
+        buffer = io.BytesIO()
+        fig.savefig(buffer, format="png", dpi=DPI, bbox_inches="tight")
+    for directory in FIGURE_DIRS:
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{name}.png")
+        with open(path + ".tmp", "wb") as f:
+            f.write(buffer.getvalue())
+        os.replace(path + ".tmp", path)
+    return name
+
+
+def _load_manifest() -> Dict[str, str]:
+    if not os.path.exists(MANIFEST_PATH):
+        return {}
+    with open(MANIFEST_PATH, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _save_manifest(manifest: Dict[str, str]):
+    os.makedirs(os.path.dirname(MANIFEST_PATH), exist_ok=True)
+    with open(MANIFEST_PATH + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    os.replace(MANIFEST_PATH + ".tmp", MANIFEST_PATH)
+
+
+def render_all(names: Optional[Iterable[str]] = None, force: bool = False, max_workers: Optional[int] = None,
+               table: str = "emotion") -> Dict[str, str]:
+    """导出全部（或names指定的）静态图，返回{图名: "rendered"/"skipped"/"failed"}"""
+    df = add_analysis_columns(load_table(table, columns=INPUT_COLUMNS))
+    inputs = figure_inputs(df)
+    if names is not None:
+        inputs = {name: inputs[name] for name in names}
+
+    manifest = _load_manifest()
+    fingerprints = {name: input_fingerprint(plot, kwargs) for name, (plot, kwargs) in inputs.items()}
+    status = {}
+    todo = []
+    for name in inputs:
+        exists = all(os.path.exists(os.path.join(d, f"{name}.png")) for d in FIGURE_DIRS)
+        if not force and exists and manifest.get(name) == fingerprints[name]:
+            status[name] = "skipped"
+        else:
+            todo.append(name)
+
+    def record(name, error):
+        if error is None:
+            manifest[name] = fingerprints[name]
+            status[name] = "rendered"
+        else:  # 单张图失败不影响其他图，下次运行重试
+            print(f"绘制失败：{name}（{error}）")
+            status[name] = "failed"
+
+    if len(todo) > 1 and max_workers != 1:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            futures = {name: pool.submit(render_figure, name, *inputs[name]) for name in todo}
+            for name, future in futures.items():
+                record(name, future.exception())
+    else:
+        for name in todo:
+            try:
+                render_figure(name, *inputs[name])
+                record(name, None)
+            except Exception as e:
+                record(name, e)
+    _save_manifest(manifest)
+    return status
+
+
+# -------------------------- 5. 运行入口 --------------------------
+if __name__ == "__main__":
+    FORCE = False        # True时忽略指纹，全部重绘
+    MAX_WORKERS = None   # 并行进程数（None为CPU核数）
+
+    result = render_all(force=FORCE, max_workers=MAX_WORKERS)
+    for name, state in result.items():
+        print(f"{state:>8}  {name}.png")
+    print(f"\n已写入：{'、'.join(FIGURE_DIRS)}")
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+功能：签到 → 景区特征的向量化聚合核
+分组键统一转为整数编码（分类列直接取codes），多个键合成一个组号后用np.bincount一次求出各组计数与加权和，
+不再对每个分组调用Python函数；聚类、地图页和笔记本共用同一套情感得分与聚合口径
+"""
+
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+# -------------------------- 1. 情感得分 --------------------------
+SENTIMENT_DIRECTION = {"正面": 1, "负面": -1, "中性": 0}
+
+
+def sentiment_direction(sentiment: pd.Series) -> pd.Series:
+    """情感倾向 → 方向（正面1/负面-1/中性0，其他为NaN）；分类列只对类别做一次映射"""
+    if isinstance(sentiment.dtype, pd.CategoricalDtype):
+        lookup = np.array([SENTIMENT_DIRECTION.get(str(c), np.nan) for c in sentiment.cat.categories] + [np.nan])
+        return pd.Series(lookup[sentiment.cat.codes.to_numpy()], index=sentiment.index)
+    return sentiment.astype(str).map(SENTIMENT_DIRECTION).astype(float)
+
+
+def sentiment_score(df: pd.DataFrame) -> pd.Series:
+    """情感得分 = 方向 × 强度"""
+    return sentiment_direction(df["sentiment"]) * df["intensity"].astype(float)
+
+
+# -------------------------- 2. 分组聚合核 --------------------------
+def _key_codes(values: pd.Series) -> Tuple[np.ndarray, pd.Index]:
+    """分组键 → 从0开始的整数编码（缺失值单独编为最后一组）"""
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        codes = values.cat.codes.to_numpy().astype(np.int64)
+        labels = values.cat.categories
+    else:
+        codes, labels = pd.factorize(values, sort=True)
+        codes = codes.astype(np.int64)
+    codes[codes < 0] = len(labels)
+    return codes, labels
+
+
+def _key_column(values: pd.Series, labels: pd.Index, codes: np.ndarray) -> pd.Series:
+    """整数编码还原为键列（分类列保持原类别，缺失组还原为NaN）"""
+    codes = np.where(codes >= len(labels), -1, codes)
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return pd.Series(pd.Categorical.from_codes(codes, dtype=values.dtype))
+    if not len(labels):
+        return pd.Series(np.full(len(codes), np.nan))
+    return pd.Series(np.asarray(labels).take(np.maximum(codes, 0))).where(codes >= 0)
+
+
+def group_sums(df: pd.DataFrame, keys: Sequence[str], values: Sequence[str] = (),
+               count_name: str = "record_count") -> pd.DataFrame:
+    """按keys分组，求每组的行数以及values各列的和（{列}_sum）与非缺失计数（{列}_n）
+    只输出实际出现的组合，按键的编码顺序排列（分类列为类别顺序，缺失值在最后），与groupby(observed=True, dropna=False)一致"""
+    keys = list(keys)
+    coded = [_key_codes(df[key]) for key in keys]
+    key_codes = [codes for codes, _ in coded]
+    sizes = [len(labels) + 1 for _, labels in coded]
+    if float(np.prod(sizes, dtype=np.float64)) < 2 ** 62:
+        # 多个键的编码合成一个组号（混合进制）
+        flat = np.ravel_multi_index(key_codes, sizes).astype(np.int64)
+        decode = lambda present: np.unravel_index(present, sizes)
+    else:
+        flat, combos = pd.MultiIndex.from_arrays(key_codes).factorize(sort=True)
+        decode = lambda present: [combos.get_level_values(i).to_numpy()[present] for i in range(len(keys))]
+
+    # 组合空间不大时直接在全空间上bincount（O(n)）；否则先排序去重再bincount
+    total = int(flat.max()) + 1 if len(flat) else 0
+    if total <= max(4 * len(flat), 1 << 20):
+        counts = np.bincount(flat, minlength=total)
+        present = np.flatnonzero(counts)
+        group = np.full(total, -1, dtype=np.int64)
+        group[present] = np.arange(len(present))
+        group = group[flat]
+        counts = counts[present]
+    else:
+        present, group = np.unique(flat, return_inverse=True)
+        counts = np.bincount(group, minlength=len(present))
+
+    result = pd.DataFrame({key: _key_column(df[key], labels, np.asarray(codes))
+                           for key, (_, labels), codes in zip(keys, coded, decode(present))})
+    result[count_name] = counts.astype(np.int64)
+    for col in values:
+        column = df[col].to_numpy(dtype=np.float64, na_value=np.nan)
+        valid = ~np.isnan(column)
+        result[f"{col}_sum"] = np.bincount(group, weights=np.where(valid, column, 0.0), minlength=len(present))
+        result[f"{col}_n"] = np.bincount(group, weights=valid, minlength=len(present)).astype(np.int64)
+    return result
+
+
+def group_counts(df: pd.DataFrame, index: str, columns: str) -> pd.DataFrame:
+    """index × columns 的计数交叉表（只含出现过的index，columns按编码顺序）"""
+    counts = group_sums(df[df[index].notna() & df[columns].notna()], [index, columns], count_name="数量")
+    table = counts.pivot(index=index, columns=columns, values="数量")
+    return table.fillna(0).astype(np.int64)
+
+
+# -------------------------- 3. 景区特征 --------------------------
+SCENIC_SUM_COLUMNS = {"sentiment_score": "score", "lon": "lon", "lat": "lat"}
+
+
+def scenic_aggregates(df: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """签到行 → 每个景区的(和, 计数)累计量与tag2计数（以景区名称为索引）；两次结果相加即等于合并后数据的累计量"""
+    df = df[df["name"].notna()]
+    if "sentiment_score" not in df.columns:
+        df = df.assign(sentiment_score=sentiment_score(df))
+    sums = group_sums(df, ["name"], list(SCENIC_SUM_COLUMNS)).set_index("name")
+    sums.index = sums.index.astype(str)  # 索引统一为字符串，不同批次的累计量可直接对齐相加
+    sums = sums.rename(columns={f"{col}_{part}": f"{short}_{part}"
+                                for col, short in SCENIC_SUM_COLUMNS.items() for part in ("sum", "n")})
+    sums = sums[["score_sum", "score_n", "lon_sum", "lon_n", "lat_sum", "lat_n", "record_count"]]
+    tag_counts = group_counts(df, "name", "tag2")
+    tag_counts.index = tag_counts.index.astype(str)
+    tag_counts.columns = tag_counts.columns.astype(str)
+    return sums, tag_counts.reindex(index=sums.index, fill_value=0)
+
+
+def scenic_table(sums: pd.DataFrame, tag_counts: pd.DataFrame) -> pd.DataFrame:
+    """由累计量得到景区聚合表（平均情感得分、众数类型、平均经纬度、记录数）"""
+    tag_counts = tag_counts.reindex(columns=sorted(tag_counts.columns))
+    # 众数：计数最大的类型，并列时取排序靠前的（与Series.mode()[0]一致）
+    main_type = tag_counts.idxmax(axis=1).where(tag_counts.sum(axis=1) > 0)
+    return pd.DataFrame({
+        "name": sums.index,
+        "avg_sentiment_score": (sums["score_sum"] / sums["score_n"].replace(0, np.nan)).to_numpy(),
+        "main_type": pd.Categorical(main_type.to_numpy(), categories=list(tag_counts.columns)),
+        "avg_lon": (sums["lon_sum"] / sums["lon_n"].replace(0, np.nan)).to_numpy(),
+        "avg_lat": (sums["lat_sum"] / sums["lat_n"].replace(0, np.nan)).to_numpy(),
+        "record_count": sums["record_count"].to_numpy(dtype=np.int64),
+    })
+
+
+def scenic_day_weather_features(df: pd.DataFrame, date_col: str = "ts_created",
+                                emotion_types: Optional[List[str]] = None) -> pd.DataFrame:
+    """每个(景区, 日期, 天气)的签到数、平均情感得分、平均强度、正面占比及各情感类型条数"""
+    from weather_fusion import parse_dates
+    dates = parse_dates(df[date_col]).dt.normalize()
+    work = pd.DataFrame({
+        "name": df["name"], "date": dates, "天气": df["天气"],
+        "sentiment_score": sentiment_score(df),
+        "intensity": df["intensity"],
+        "positive": (sentiment_direction(df["sentiment"]) > 0).astype(float),
+    })
+    keys = ["name", "date", "天气"]
+    features = group_sums(work, keys, ["sentiment_score", "intensity", "positive"])
+    features["avg_sentiment_score"] = features["sentiment_score_sum"] / features["sentiment_score_n"].replace(0, np.nan)
+    features["avg_intensity"] = features["intensity_sum"] / features["intensity_n"].replace(0, np.nan)
+    features["正面占比"] = features["positive_sum"] / features["record_count"]
+    features = features[keys + ["record_count", "avg_sentiment_score", "avg_intensity", "正面占比"]]
+
+    if "emotion_type" in df.columns:
+        work["emotion_type"] = df["emotion_type"]
+        emotion_counts = group_sums(work[work["emotion_type"].notna()], keys + ["emotion_type"], count_name="n")
+        emotion_counts = emotion_counts.pivot_table(index=keys, columns="emotion_type", values="n",
+                                                    aggfunc="sum", fill_value=0, observed=True, dropna=False)
+        if emotion_types is not None:
+            emotion_counts = emotion_counts.reindex(columns=emotion_types, fill_value=0)
+        emotion_counts.columns = [f"{c}条数" for c in emotion_counts.columns]
+        features = features.merge(emotion_counts.reset_index(), on=keys, how="left")
+        count_cols = list(emotion_counts.columns)
+        features[count_cols] = features[count_cols].fillna(0).astype(np.int64)
+    return features
@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+"""
+功能：微博签到点 → 南京景区AOI面的空间关联（替代QGIS手工“按位置连接属性”）
+流程：一次性读取Nanjing_AOI.shp → 按面外包框建立网格索引 → 向量化点在面内判断 → 输出name/tag*等景区字段
+"""
+
+import os
+import time
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+import shapefile  # pyshp
+
+# -------------------------- 1. 基础配置 --------------------------
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+AOI_SHP_PATH = os.path.join(BASE_DIR, "data", "raw_data", "Nanjing_AOI.shp")
+CHECKIN_CSV_PATH = os.path.join(BASE_DIR, "data", "raw_data", "南京市_20231114_1119.csv")   # 微博签到原始数据
+OUTPUT_CSV_PATH = os.path.join(BASE_DIR, "data", "processed_data", "南京景区-签到空间关联表.csv")
+CHECKIN_ENCODING = "utf-8-sig"
+GRID_CELLS_PER_AXIS = 256   # 网格索引每个方向的格子数（越大候选面越少，索引越占内存）
+BLOCK_ELEMENTS = 4_000_000  # 射线法每块的“点数×环顶点数”上限（控制临时数组大小，顶点多的环每块点数相应减少）
+
+
+# -------------------------- 2. AOI读取与网格索引 --------------------------
+class AoiIndex:
+    """AOI面的扁平化存储 + 外包框网格索引"""
+
+    def __init__(self, shp_path: str = AOI_SHP_PATH, grid_cells: int = GRID_CELLS_PER_AXIS):
+        reader = shapefile.Reader(shp_path, encoding=_read_cpg(shp_path))
+        shapes = reader.shapes()
+        n = len(shapes)
+
+        # 属性表（.dbf缺失时只保留序号aoi_id）
+        attrs = pd.DataFrame({"aoi_id": np.arange(n)})
+        if os.path.exists(os.path.splitext(shp_path)[0] + ".dbf"):
+            fields = [f[0] for f in reader.fields[1:]]
+            attrs = pd.concat([attrs, pd.DataFrame([list(r) for r in reader.records()], columns=fields)], axis=1)
+        self.attributes = attrs
+
+        # 顶点扁平化：ring_start/ring_end标记每个环在xy中的范围，poly_rings标记每个面的环范围
+        xy, ring_bounds, poly_rings = [], [], [0]
+        offset = 0
+        for shape in shapes:
+            pts = np.asarray(shape.points, dtype=np.float64).reshape(-1, 2)
+            parts = list(shape.parts) + [len(pts)]
+            for s, e in zip(parts[:-1], parts[1:]):
+                ring_bounds.append((offset + s, offset + e))
+            poly_rings.append(len(ring_bounds))
+            xy.append(pts)
+            offset += len(pts)
+        self.xy = np.concatenate(xy) if xy else np.empty((0, 2))
+        self.ring_bounds = np.asarray(ring_bounds, dtype=np.int64).reshape(-1, 2)
+        self.poly_rings = np.asarray(poly_rings, dtype=np.int64)
+        self.bbox = np.asarray([s.bbox if len(s.points) else [np.nan] * 4 for s in shapes], dtype=np.float64).reshape(-1, 4)
+        self.area = np.array([self._area(i) for i in range(n)])
+        self._build_grid(grid_cells)
+
+    def _rings(self, poly: int):
+        for r in range(self.poly_rings[poly], self.poly_rings[poly + 1]):
+            s, e = self.ring_bounds[r]
+            yield self.xy[s:e]
+
+    def _area(self, poly: int) -> float:
+        """鞋带公式求面积（各环带符号面积求和，shapefile中内环与外环方向相反，自动扣除洞）"""
+        total = 0.0
+        for ring in self._rings(poly):
+            x, y = ring[:, 0], ring[:, 1]
+            total += 0.5 * (np.dot(x, np.roll(y, -1)) - np.dot(y, np.roll(x, -1)))
+        return abs(total)
+
+    def _build_grid(self, cells: int):
+        """把每个面登记到其外包框覆盖的所有网格中，存成CSR结构（cell_start/cell_items）"""
+        valid = ~np.isnan(self.bbox).any(axis=1)
+        xmin, ymin = np.nanmin(self.bbox[:, 0]), np.nanmin(self.bbox[:, 1])
+        xmax, ymax = np.nanmax(self.bbox[:, 2]), np.nanmax(self.bbox[:, 3])
+        self.origin = np.array([xmin, ymin])
+        self.cell_size = np.array([(xmax - xmin) / cells or 1.0, (ymax - ymin) / cells or 1.0])
+        self.cells = cells
+
+        polys = np.flatnonzero(valid)
+        lo = self._cell_of(self.bbox[polys, 0], self.bbox[polys, 1])
+        hi = self._cell_of(self.bbox[polys, 2], self.bbox[polys, 3])
+        nx = hi[0] - lo[0] + 1
+        ny = hi[1] - lo[1] + 1
+        counts = nx * ny
+        owner = np.repeat(polys, counts)
+        # 对每个面展开其覆盖的(ix, iy)格子
+        local = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        ix = np.repeat(lo[0], counts) + local % np.repeat(nx, counts)
+        iy = np.repeat(lo[1], counts) + local // np.repeat(nx, counts)
+        cell_id = iy * cells + ix
+
+        order = np.argsort(cell_id, kind="stable")
+        self.cell_items = owner[order]
+        self.cell_start = np.searchsorted(cell_id[order], np.arange(cells * cells + 1))
+
+    def _cell_of(self, x, y):
+        ix = np.clip(((np.asarray(x) - self.origin[0]) / self.cell_size[0]).astype(np.int64), 0, self.cells - 1)
+        iy = np.clip(((np.asarray(y) - self.origin[1]) / self.cell_size[1]).astype(np.int64), 0, self.cells - 1)
+        return ix, iy
+
+    # -------------------------- 3. 点在面内判断 --------------------------
+    def candidate_pairs(self, lon: np.ndarray, lat: np.ndarray):
+        """网格索引+外包框过滤，返回候选(点序号, 面序号)对"""
+        inside_extent = (
+            (lon >= self.origin[0]) & (lat >= self.origin[1])
+            & (lon <= self.origin[0] + self.cell_size[0] * self.cells)
+            & (lat <= self.origin[1] + self.cell_size[1] * self.cells)
+        )
+        pts = np.flatnonzero(inside_extent)
+        ix, iy = self._cell_of(lon[pts], lat[pts])
+        cell_id = iy * self.cells + ix
+        starts, ends = self.cell_start[cell_id], self.cell_start[cell_id + 1]
+        counts = ends - starts
+        point_idx = np.repeat(pts, counts)
+        item_pos = np.repeat(starts, counts) + (np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts))
+        poly_idx = self.cell_items[item_pos]
+
+        box = self.bbox[poly_idx]
+        x, y = lon[point_idx], lat[point_idx]
+        keep = (x >= box[:, 0]) & (x <= box[:, 2]) & (y >= box[:, 1]) & (y <= box[:, 3])
+        return point_idx[keep], poly_idx[keep]
+
+    def contains(self, poly: int, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        """射线法（奇偶规则，自动处理内环/洞），对一批点向量化判断是否落在面poly内"""
+        inside = np.zeros(len(x), dtype=bool)
+        for ring in self._rings(poly):
+            x1, y1 = ring[:, 0], ring[:, 1]
+            x2, y2 = np.roll(x1, -1), np.roll(y1, -1)
+            block = max(1, BLOCK_ELEMENTS // len(ring))
+            for s in range(0, len(x), block):
+                px, py = x[s:s + block, None], y[s:s + block, None]
+                crosses = (y1 > py) != (y2 > py)
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    x_cross = x1 + (py - y1) * (x2 - x1) / (y2 - y1)
+                hits = (crosses & (px < x_cross)).sum(axis=1) % 2 == 1
+                inside[s:s + block] ^= hits
+        return inside
+
+    def assign(self, lon, lat) -> np.ndarray:
+        """为每个点返回所在AOI的序号（不在任何AOI内为-1；落在多个重叠面内时取面积最小、最具体的那个）"""
+        lon = np.asarray(lon, dtype=np.float64)
+        lat = np.asarray(lat, dtype=np.float64)
+        point_idx, poly_idx = self.candidate_pairs(lon, lat)
+
+        # 按面分组，每个面对其全部候选点做一次向量化判断
+        order = np.argsort(poly_idx, kind="stable")
+        point_idx, poly_idx = point_idx[order], poly_idx[order]
+        bounds = np.flatnonzero(np.diff(poly_idx)) + 1
+        matched = np.zeros(len(point_idx), dtype=bool)
+        for s, e in zip(np.r_[0, bounds], np.r_[bounds, len(poly_idx)]):
+            if e > s:
+                pts = point_idx[s:e]
+                matched[s:e] = self.contains(poly_idx[s], lon[pts], lat[pts])
+
+        point_idx, poly_idx = point_idx[matched], poly_idx[matched]
+        result = np.full(len(lon), -1, dtype=np.int64)
+        if len(point_idx):
+            # 面积从大到小写入，小面积的后写覆盖前者
+            order = np.argsort(-self.area[poly_idx], kind="stable")
+            result[point_idx[order]] = poly_idx[order]
+        return result
+
+
+def _read_cpg(shp_path: str) -> str:
+    """读取.cpg中的属性编码（缺失时默认UTF-8）"""
+    cpg = os.path.splitext(shp_path)[0] + ".cpg"
+    if os.path.exists(cpg):
+        with open(cpg, encoding="ascii", errors="ignore") as f:
+            return f.read().strip() or "utf-8"
+    return "utf-8"
+
+
+# -------------------------- 4. 签到数据融合 --------------------------
+def fuse_checkins(checkins: pd.DataFrame, aoi: AoiIndex, keep_unmatched: bool = False) -> pd.DataFrame:
+    """为签到表追加AOI属性列（name、tag*等）；默认丢弃不在任何景区内的签到"""
+    poly = aoi.assign(checkins["lon"].to_numpy(), checkins["lat"].to_numpy())
+    attrs = aoi.attributes.drop(columns=[c for c in aoi.attributes.columns if c in checkins.columns and c != "aoi_id"])
+    matched = poly >= 0
+    out = checkins if keep_unmatched else checkins.loc[matched]
+    poly = poly if keep_unmatched else poly[matched]
+    joined = attrs.reindex(poly).reset_index(drop=True)  # -1不在索引中，对应属性为空
+    return pd.concat([out.reset_index(drop=True), joined], axis=1)
+
+
+def run_spatial_fusion(checkin_path: str = CHECKIN_CSV_PATH, output_path: str = OUTPUT_CSV_PATH,
+                       aoi: Optional[AoiIndex] = None) -> pd.DataFrame:
+    """读取签到CSV→关联AOI→保存结果"""
+    t0 = time.time()
+    aoi = aoi or AoiIndex()
+    print(f"AOI加载与索引：{len(aoi.area)}个面，用时{time.time() - t0:.2f}s")
+    if "name" not in aoi.attributes.columns:
+        print("提示：未找到Nanjing_AOI.dbf属性表，仅输出aoi_id，name/tag*需补充.dbf后重跑")
+
+    checkins = pd.read_csv(checkin_path, encoding=CHECKIN_ENCODING, dtype={"mid": str, "userid": str})
+    t1 = time.time()
+    fused = fuse_checkins(checkins, aoi)
+    print(f"空间关联：{len(checkins)}条签到 → {len(fused)}条落在景区内，用时{time.time() - t1:.2f}s")
+
+    fused.to_csv(output_path, index=False, encoding="utf-8-sig")
+    print(f"📁 结果已保存：{output_path}")
+    return fused
+
+
+# -------------------------- 5. 运行入口 --------------------------
+if __name__ == "__main__":
+    run_spatial_fusion()
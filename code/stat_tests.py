@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+"""
+功能：天气 × 景区类型 × 情绪类别 分片的向量化统计检验
+各组的样本数、均值、方差由一次分组聚合（group_sums）得到，方差分析F检验直接用这些充分统计量计算；
+需要原始数据的检验（Levene、Kruskal-Wallis、置换检验、Bootstrap置信区间）先按组排序一次、切成连续数组，
+各分片在进程池中并行，重抽样按批在NumPy矩阵上一次完成；所有分片的p值统一做Benjamini-Hochberg多重比较校正
+"""
+
+import os
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+import scipy.stats as stats
+
+import metrics
+from scenic_features import _key_codes, group_sums
+
+# -------------------------- 1. 基础配置 --------------------------
+MIN_SAMPLE = 10            # 组内样本数不足时该组不参与检验
+N_RESAMPLES = 2000         # 置换检验与Bootstrap的重抽样次数
+RESAMPLE_BATCH = 200       # 每批重抽样次数（批内为一个 批次×样本数 的矩阵）
+FDR_ALPHA = 0.05           # BH校正后的显著性水平
+PARALLEL_MIN_SLICES = 8    # 分片数不少于该值时才启用进程池
+RANDOM_STATE = 2023
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TESTS_CSV_PATH = os.path.join(BASE_DIR, "data", "processed_data", "统计检验_分片结果.csv")
+GROUPS_CSV_PATH = os.path.join(BASE_DIR, "data", "processed_data", "统计检验_分组均值.csv")
+
+# 默认检验族：(检验因素, 分片键)；分片键为空表示全样本
+DEFAULT_FAMILY = [
+    ("原始天气类型", []),
+    ("tag5", []),
+    ("原始天气类型", ["tag5"]),
+    ("tag5", ["原始天气类型"]),
+    ("原始天气类型", ["emotion_type"]),
+    ("原始天气类型", ["tag5", "emotion_type"]),
+]
+P_COLUMNS = ["anova_p", "levene_p", "kruskal_p", "perm_p"]
+
+
+# -------------------------- 2. 充分统计量 --------------------------
+def group_moments(df: pd.DataFrame, keys: Sequence[str], value: str) -> pd.DataFrame:
+    """一次分组聚合求各组的 n、均值、方差（ddof=1）"""
+    squared = f"{value}__sq"
+    sums = group_sums(df.assign(**{squared: df[value].astype(float) ** 2}), keys, [value, squared])
+    n = sums[f"{value}_n"].to_numpy(dtype=np.float64)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = sums[f"{value}_sum"].to_numpy() / n
+        var = (sums[f"{squared}_sum"].to_numpy() - n * mean ** 2) / (n - 1)
+    result = sums[list(keys)].copy()
+    result["n"] = n.astype(np.int64)
+    result["mean"] = mean
+    result["var"] = np.maximum(var, 0.0)
+    return result
+
+
+def anova_from_moments(moments: pd.DataFrame, by: Sequence[str] = ()) -> pd.DataFrame:
+    """单因素方差分析（按by分片，每片内各行为一组），只用各组的 n/均值/方差"""
+    slice_id = (moments.groupby(list(by), observed=True, sort=False, dropna=False).ngroup().to_numpy()
+                if by else np.zeros(len(moments), dtype=np.int64))
+    n, mean, var = moments["n"].to_numpy(float), moments["mean"].to_numpy(), moments["var"].to_numpy()
+    n_slices = int(slice_id.max()) + 1 if len(slice_id) else 0
+    total_n = np.bincount(slice_id, weights=n, minlength=n_slices)
+    k = np.bincount(slice_id, minlength=n_slices)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        grand = np.bincount(slice_id, weights=n * mean, minlength=n_slices) / total_n
+        ss_between = np.bincount(slice_id, weights=n * (mean - grand[slice_id]) ** 2, minlength=n_slices)
+        ss_within = np.bincount(slice_id, weights=(n - 1) * np.nan_to_num(var), minlength=n_slices)
+        df_between, df_within = k - 1, total_n - k
+        f_stat = (ss_between / df_between) / (ss_within / df_within)
+        eta_sq = ss_between / (ss_between + ss_within)
+    result = (moments.drop_duplicates(list(by))[list(by)].reset_index(drop=True) if by
+              else pd.DataFrame(index=range(n_slices)))
+    result["n"] = total_n.astype(np.int64)
+    result["k"] = k
+    result["F"] = f_stat
+    result["anova_p"] = np.where(k > 1, stats.f.sf(f_stat, df_between, df_within), np.nan)
+    result["eta_sq"] = np.where(k > 1, eta_sq, np.nan)
+    return result
+
+
+def group_corr(df: pd.DataFrame, by: str, x: str, y: str) -> pd.Series:
+    """各组内x与y的皮尔逊相关系数（由各组的和、平方和、交叉积和一次求出）"""
+    valid = df[[by, x, y]].dropna()
+    xv, yv = valid[x].astype(float), valid[y].astype(float)
+    sums = group_sums(valid.assign(_x=xv, _y=yv, _xx=xv * xv, _yy=yv * yv, _xy=xv * yv),
+                      [by], ["_x", "_y", "_xx", "_yy", "_xy"])
+    n = sums["record_count"].to_numpy(float)
+    sx, sy = sums["_x_sum"].to_numpy(), sums["_y_sum"].to_numpy()
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cov = sums["_xy_sum"].to_numpy() - sx * sy / n
+        corr = cov / np.sqrt((sums["_xx_sum"].to_numpy() - sx ** 2 / n) * (sums["_yy_sum"].to_numpy() - sy ** 2 / n))
+    return pd.Series(corr, index=pd.Index(sums[by], name=by))
+
+
+# -------------------------- 3. 按组切分原始数据 --------------------------
+def _group_ids(df: pd.DataFrame, keys: Sequence[str]) -> np.ndarray:
+    """每行所属的组号（与group_sums输出的行顺序一致）"""
+    coded = [_key_codes(df[key]) for key in keys]
+    sizes = [len(labels) + 1 for _, labels in coded]
+    if float(np.prod(sizes, dtype=np.float64)) < 2 ** 62:
+        flat = np.ravel_multi_index([codes for codes, _ in coded], sizes)
+    else:
+        flat = pd.MultiIndex.from_arrays([codes for codes, _ in coded]).factorize(sort=True)[0]
+    return np.unique(flat, return_inverse=True)[1].ravel()
+
+
+def _split_groups(df: pd.DataFrame, keys: Sequence[str], value: str) -> Tuple[pd.DataFrame, List[np.ndarray]]:
+    """一次稳定排序后按组切成连续数组，返回(各组充分统计量, 各组取值)"""
+    moments = group_moments(df, keys, value)
+    order = np.argsort(_group_ids(df, keys), kind="stable")
+    values = df[value].to_numpy(dtype=np.float64)[order]
+    return moments, np.split(values, np.cumsum(moments["n"].to_numpy())[:-1])
+
+
+def value_groups(df: pd.DataFrame, group: str, value: str, min_sample: int = MIN_SAMPLE) -> Dict:
+    """{组名: 取值数组}，只保留样本数不少于min_sample的组（替代逐组布尔筛选）"""
+    df = df[df[group].notna() & df[value].notna()]
+    moments, arrays = _split_groups(df, [group], value)
+    return {label: arr for label, arr in zip(moments[group], arrays) if len(arr) >= min_sample}
+
+
+# -------------------------- 4. 重抽样检验 --------------------------
+def permutation_pvalue(groups: Sequence[np.ndarray], rng: np.random.Generator,
+                       n_resamples: int = N_RESAMPLES, batch: int = RESAMPLE_BATCH) -> float:
+    """单因素方差分析F统计量的置换检验p值（总平方和在置换下不变，只需比较组间平方和Σ S_g²/n_g）"""
+    values = np.concatenate(groups)
+    if np.ptp(values) == 0:  # 所有取值相同，无法检验
+        return np.nan
+    sizes = np.array([len(g) for g in groups], dtype=np.float64)
+    starts = np.concatenate([[0], np.cumsum(sizes)[:-1]]).astype(np.int64)
+    observed = (np.add.reduceat(values, starts) ** 2 / sizes).sum()
+    exceed = 0
+    for start in range(0, n_resamples, batch):
+        permuted = rng.permuted(np.tile(values, (min(batch, n_resamples - start), 1)), axis=1)
+        between = (np.add.reduceat(permuted, starts, axis=1) ** 2 / sizes).sum(axis=1)
+        exceed += int((between >= observed * (1 - 1e-12)).sum())
+    return (exceed + 1) / (n_resamples + 1)
+
+
+def bootstrap_mean_ci(values: np.ndarray, rng: np.random.Generator, n_resamples: int = N_RESAMPLES,
+                      batch: int = RESAMPLE_BATCH, level: float = 0.95) -> Tuple[float, float]:
+    """均值的Bootstrap百分位置信区间"""
+    means = np.concatenate([values[rng.integers(0, len(values), (min(batch, n_resamples - start), len(values)))].mean(axis=1)
+                            for start in range(0, n_resamples, batch)])
+    tail = (1 - level) / 2 * 100
+    low, high = np.percentile(means, [tail, 100 - tail])
+    return float(low), float(high)
+
+
+def _test_slice(groups: List[np.ndarray], seed: np.random.SeedSequence, n_resamples: int) -> Dict:
+    """一个分片内需要原始数据的检验"""
+    rng = np.random.default_rng(seed)
+    result = {"levene_p": np.nan, "kruskal_H": np.nan, "kruskal_p": np.nan, "perm_p": np.nan,
+              "ci_low": [], "ci_high": []}
+    for values in groups:
+        low, high = bootstrap_mean_ci(values, rng, n_resamples)
+        result["ci_low"].append(low)
+        result["ci_high"].append(high)
+    if len(groups) < 2:
+        return result
+    with warnings.catch_warnings(), np.errstate(invalid="ignore", divide="ignore"):
+        warnings.simplefilter("ignore")
+        result["levene_p"] = stats.levene(*groups, center="median").pvalue
+        try:
+            result["kruskal_H"], result["kruskal_p"] = stats.kruskal(*groups)
+        except ValueError:  # 所有取值相同
+            pass
+    result["perm_p"] = permutation_pvalue(groups, rng, n_resamples)
+    return result
+
+
+def _test_chunk(jobs: List[Tuple[List[np.ndarray], np.random.SeedSequence]], n_resamples: int) -> List[Dict]:
+    return [_test_slice(groups, seed, n_resamples) for groups, seed in jobs]
+
+
+# -------------------------- 5. 多重比较校正 --------------------------
+def bh_adjust(pvalues) -> np.ndarray:
+    """Benjamini-Hochberg校正后的q值（NaN保持为NaN，不计入检验数）"""
+    p = np.asarray(pvalues, dtype=np.float64)
+    q = np.full(p.shape, np.nan)
+    valid = np.flatnonzero(~np.isnan(p))
+    if not len(valid):
+        return q
+    order = valid[np.argsort(p[valid], kind="stable")]
+    ranked = p[order] * len(order) / np.arange(1, len(order) + 1)
+    q[order] = np.minimum(np.minimum.accumulate(ranked[::-1])[::-1], 1.0)
+    return q
+
+
+# -------------------------- 6. 分片检验入口 --------------------------
+@metrics.span("stats.run_tests")
+def run_tests(df: pd.DataFrame, value: str = "sentiment_score", family: Sequence[Tuple[str, Sequence[str]]] = DEFAULT_FAMILY,
+              min_sample: int = MIN_SAMPLE, n_resamples: int = N_RESAMPLES, alpha: float = FDR_ALPHA,
+              max_workers: Optional[int] = None, random_state: int = RANDOM_STATE) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """对检验族中每个(检验因素, 分片键)，在每个分片内检验value在检验因素各水平间是否有差异
+    返回(分片检验表, 各组均值与Bootstrap置信区间表)；分片检验表中的*_q为整个检验族统一BH校正后的q值"""
+    slice_tables, group_tables, slices = [], [], []
+    for group, by in family:
+        by = list(by)
+        keys = by + [group]
+        sub = df[df[keys].notna().all(axis=1) & df[value].notna()]
+        moments, arrays = _split_groups(sub, keys, value)
+        keep = moments["n"].to_numpy() >= min_sample
+        moments = moments[keep].reset_index(drop=True)
+        arrays = [arr for arr, k in zip(arrays, keep) if k]
+        tests = anova_from_moments(moments, by)
+        slice_id = (moments.groupby(by, observed=True, sort=False, dropna=False).ngroup().to_numpy()
+                    if by else np.zeros(len(moments), dtype=np.int64))
+        bounds = np.searchsorted(slice_id, np.arange(len(tests) + 1))
+        for i in range(len(tests)):
+            slices.append(arrays[bounds[i]:bounds[i + 1]])
+        tests.insert(0, "检验因素", group)
+        tests.insert(1, "分片", [" | ".join(f"{key}={row[key]}" for key in by) or "全样本"
+                               for _, row in tests.iterrows()])
+        moments.insert(0, "检验因素", group)
+        slice_tables.append(tests)
+        group_tables.append(moments)
+
+    # 每个分片一个独立的子种子，结果与是否并行、如何分块无关
+    jobs = list(zip(slices, np.random.SeedSequence(random_state).spawn(len(slices))))
+    workers = max_workers or os.cpu_count() or 1
+    if workers > 1 and len(jobs) >= PARALLEL_MIN_SLICES:
+        chunks = [jobs[i::workers * 4] for i in range(workers * 4)]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            chunk_results = list(pool.map(_test_chunk, chunks, [n_resamples] * len(chunks)))
+        results = [None] * len(jobs)
+        for i, chunk_result in enumerate(chunk_results):
+            results[i::workers * 4] = chunk_result
+    else:
+        results = _test_chunk(jobs, n_resamples)
+
+    key_columns = list(dict.fromkeys(key for group, by in family for key in list(by) + [group]))
+    tests = pd.concat(slice_tables, ignore_index=True)
+    tests = tests[["检验因素", "分片"] + [c for c in key_columns if c in tests.columns]
+                  + [c for c in tests.columns if c not in key_columns and c not in ("检验因素", "分片")]]
+    groups = pd.concat(group_tables, ignore_index=True)
+    groups = groups[["检验因素"] + key_columns + ["n", "mean", "var"]]
+    for col in ("levene_p", "kruskal_H", "kruskal_p", "perm_p"):
+        tests[col] = [r[col] for r in results]
+    groups["ci_low"] = [low for r in results for low in r["ci_low"]]
+    groups["ci_high"] = [high for r in results for high in r["ci_high"]]
+    for col in P_COLUMNS:
+        tests[col.replace("_p", "_q")] = bh_adjust(tests[col])
+    tests["显著"] = tests["perm_q"] < alpha
+    return tests, groups
+
+
+# -------------------------- 7. 运行入口 --------------------------
+if __name__ == "__main__":
+    from analysis_pivots import add_analysis_columns
+    from data_store import load_table
+
+    df = add_analysis_columns(load_table("emotion", columns=[
+        "tag5", "sentiment", "intensity", "emotion_type", "天气", "降水", "低能见度"]))
+    df["sentiment_score"] = df["sentiment_score"].fillna(0)   # 与统计笔记本口径一致
+    slice_tests, group_ci = run_tests(df)
+    slice_tests.to_csv(TESTS_CSV_PATH, index=False, encoding="utf-8-sig")
+    group_ci.to_csv(GROUPS_CSV_PATH, index=False, encoding="utf-8-sig")
+    print(f"共{len(slice_tests)}个分片检验，BH校正后显著{int(slice_tests['显著'].sum())}个")
+    print(f"结果已保存到：{TESTS_CSV_PATH}、{GROUPS_CSV_PATH}")
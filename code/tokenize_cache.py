@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""
+功能：微博文本的统一分词阶段（多进程jieba + SQLite分词缓存）
+每条message只做一次清洗+带词性分词，结果按 (mid, 文本哈希) 缓存；LDA、关键词统计等下游各自按需过滤停用词/词性，
+新增或修改过的微博才需要重新分词
+"""
+
+import hashlib
+import os
+import re
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import jieba
+import numpy as np
+
+import metrics
+from dedup import SIMILARITY_THRESHOLD, near_duplicate_groups
+
+# -------------------------- 1. 基础配置 --------------------------
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TOKEN_CACHE_PATH = os.path.join(BASE_DIR, "data", "processed_data", "分词缓存.sqlite")
+TOKENIZER_VERSION = "v1"   # 清洗或分词方式改变时修改，旧缓存自然失效
+PARALLEL_MIN_MESSAGES = 2000   # 待分词条数少于该值时在当前进程内完成（进程池启动与加载词典有固定开销）
+CHUNK_SIZE = 500
+NEAR_DUP_THRESHOLD = SIMILARITY_THRESHOLD   # 近重复message只分词一条，分词结果回填给同簇的其他message；设为None关闭
+
+# 统一停用词（原LDA笔记本与关键词统计两套停用词的并集）
+STOPWORDS = {
+    "我", "你", "他", "她", "它", "我们", "你们", "他们", "的", "了", "是", "在",
+    "有", "和", "及", "与", "也", "还", "都", "就", "很", "挺", "太", "非常", "比较", "呵呵",
+    "哈哈", "嗯", "哦", "呀", "啊", "啦", "吧", "呢", "吗", "今天", "昨天", "明天",
+    "南京", "这里", "一个", "景区", "景点", "天气",
+    "。", "，", "、", "；", "：", "？", "！", "（", "）", "【", "】", "《", "》", "##", " "
+}
+LDA_POS_FLAGS = ("n", "v", "a", "vn")  # LDA只保留名词、动词、形容词
+
+_NON_WORD = re.compile(r"[\W_]+")
+_SQL_CHUNK = 500
+
+
+# -------------------------- 2. 清洗与分词 --------------------------
+def clean_text(msg) -> str:
+    """只保留中文、字母、数字（去掉标点、表情、空白等）"""
+    return _NON_WORD.sub("", str(msg))
+
+
+def _segment_chunk(texts: List[str]) -> List[List[Tuple[str, str]]]:
+    """一批文本带词性分词（进程池中的任务）"""
+    import jieba.posseg as pseg
+    return [[(w, f) for w, f in pseg.cut(clean_text(text))] for text in texts]
+
+
+def segment(texts: Sequence[str], n_workers: Optional[int] = None,
+            chunk_size: int = CHUNK_SIZE) -> List[List[Tuple[str, str]]]:
+    """分块在进程池中分词，返回顺序与输入一致"""
+    texts = list(texts)
+    chunks = [texts[i:i + chunk_size] for i in range(0, len(texts), chunk_size)]
+    metrics.incr("tokenize_segmented", len(texts))
+    with metrics.span("tokenize.segment"):
+        if len(texts) < PARALLEL_MIN_MESSAGES or n_workers == 1:
+            results = [_segment_chunk(chunk) for chunk in chunks]
+        else:
+            with ProcessPoolExecutor(max_workers=n_workers) as pool:
+                results = list(pool.map(_segment_chunk, chunks))
+    return [tokens for chunk in results for tokens in chunk]
+
+
+# -------------------------- 3. 分词缓存 --------------------------
+class TokenCache:
+    """SQLite分词缓存：键 = sha256(分词器版本 + mid + 文本)，值为词与词性序列"""
+
+    def __init__(self, db_path: str = TOKEN_CACHE_PATH):
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(db_path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS tokens (key TEXT PRIMARY KEY, words TEXT NOT NULL, flags TEXT NOT NULL)")
+        self._conn.commit()
+        self._namespace = f"{TOKENIZER_VERSION}|jieba-{jieba.__version__}"
+
+    def key(self, mid, text: str) -> str:
+        mid = "" if mid is None else str(mid).strip()
+        return hashlib.sha256(f"{self._namespace}\x1f{mid}\x1f{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, List[Tuple[str, str]]]:
+        keys = list(keys)
+        found = {}
+        for k in range(0, len(keys), _SQL_CHUNK):
+            chunk = keys[k:k + _SQL_CHUNK]
+            rows = self._conn.execute(
+                f"SELECT key, words, flags FROM tokens WHERE key IN ({','.join('?' * len(chunk))})", chunk
+            ).fetchall()
+            for key, words, flags in rows:
+                found[key] = list(zip(words.split(" "), flags.split(" "))) if words else []
+        return found
+
+    def put_many(self, items: Iterable[Tuple[str, List[Tuple[str, str]]]]):
+        rows = [(key, " ".join(w for w, _ in tokens), " ".join(f for _, f in tokens)) for key, tokens in items]
+        self._conn.executemany("INSERT OR REPLACE INTO tokens VALUES (?, ?, ?)", rows)
+        self._conn.commit()
+
+    def close(self):
+        self._conn.close()
+
+
+# -------------------------- 4. 对外接口 --------------------------
+def tokenize_messages(messages: Sequence, mids: Optional[Sequence] = None, n_workers: Optional[int] = None,
+                      cache_path: Optional[str] = TOKEN_CACHE_PATH,
+                      near_dup_threshold: Optional[float] = NEAR_DUP_THRESHOLD) -> List[List[Tuple[str, str]]]:
+    """批量分词（带词性），命中缓存的直接返回，只对新的message分词；cache_path=None时不使用缓存
+    near_dup_threshold不为None时先合并近重复message，只对每簇的代表message分词（同簇message共用同一个分词结果列表）"""
+    texts = ["" if m is None or m != m else str(m) for m in messages]  # m != m：NaN/NA
+    mids = [None] * len(texts) if mids is None else list(mids)
+    if near_dup_threshold is not None and len(texts) > 1:
+        reps = near_duplicate_groups(texts, near_dup_threshold)
+        keep = np.flatnonzero(reps == np.arange(len(texts)))
+        metrics.incr("tokenize_near_dup_merged", len(texts) - len(keep))
+        tokens = tokenize_messages([texts[i] for i in keep], [mids[i] for i in keep], n_workers, cache_path, None)
+        position = np.empty(len(texts), dtype=np.int64)
+        position[keep] = np.arange(len(keep))
+        return [tokens[k] for k in position[reps]]
+    if cache_path is None:
+        return segment(texts, n_workers)
+
+    cache = TokenCache(cache_path)
+    try:
+        keys = [cache.key(mid, text) for mid, text in zip(mids, texts)]
+        found = cache.get_many(set(keys))
+        metrics.incr("tokenize_cache_hits", sum(key in found for key in keys))
+        todo = {}
+        for key, text in zip(keys, texts):
+            if key not in found:
+                todo.setdefault(key, text)
+        if todo:
+            print(f"分词：缓存命中{len(keys) - len(todo)}条，新分词{len(todo)}条")
+            new_tokens = dict(zip(todo, segment(list(todo.values()), n_workers)))
+            cache.put_many(new_tokens.items())
+            found.update(new_tokens)
+        return [found[key] for key in keys]
+    finally:
+        cache.close()
+
+
+def filter_tokens(tokens: List[Tuple[str, str]], stopwords=STOPWORDS, keep_flags: Optional[Sequence[str]] = None,
+                  min_len: int = 2) -> List[str]:
+    """按停用词、词性（keep_flags=None表示不限词性）和最短词长过滤"""
+    return [w for w, f in tokens
+            if w not in stopwords and len(w) >= min_len and (keep_flags is None or f in keep_flags)]
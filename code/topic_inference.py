@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+功能：LDA主题模型的保存与新微博主题推断（fold-in）
+训练后保存 主题→词分布(topic_word) 与词典；新微博只需分词、映射到词ID，再在topic_word固定的前提下
+按批迭代估计文档→主题分布，不重新训练，单条耗时在毫秒级
+"""
+
+import os
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from tokenize_cache import LDA_POS_FLAGS, filter_tokens, tokenize_messages
+
+# -------------------------- 1. 基础配置 --------------------------
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TOPIC_MODEL_PATH = os.path.join(BASE_DIR, "data", "processed_data", "LDA主题模型.npz")
+FOLD_IN_MAX_ITER = 100
+FOLD_IN_TOL = 1e-4
+INFER_BATCH_SIZE = 10000
+
+
+# -------------------------- 2. 模型保存与读取 --------------------------
+def save_topic_model(topic_word: np.ndarray, vocabulary: Sequence[str], path: str = TOPIC_MODEL_PATH) -> str:
+    """保存主题→词分布（每行和为1）与词典（vocabulary[词ID] = 词）"""
+    topic_word = np.asarray(topic_word, dtype=np.float64)
+    if topic_word.shape[1] != len(vocabulary):
+        raise ValueError(f"topic_word的列数（{topic_word.shape[1]}）与词典大小（{len(vocabulary)}）不一致")
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp.npz"
+    np.savez(tmp_path, topic_word=topic_word / topic_word.sum(axis=1, keepdims=True),
+             vocabulary=np.array(list(vocabulary), dtype=str))
+    os.replace(tmp_path, path)
+    return path
+
+
+def load_topic_model(path: str = TOPIC_MODEL_PATH) -> Dict:
+    with np.load(path) as data:
+        vocabulary = data["vocabulary"].tolist()
+        return {"topic_word": data["topic_word"], "vocabulary": vocabulary,
+                "word_index": {w: i for i, w in enumerate(vocabulary)}}
+
+
+# -------------------------- 3. fold-in推断 --------------------------
+def docs_to_csr(processed_words: Sequence[List[str]], word_index: Dict[str, int]) -> sparse.csr_matrix:
+    """分词结果 → 词频CSR矩阵（词典外的词忽略）"""
+    indptr, word_ids = [0], []
+    for words in processed_words:
+        word_ids.extend(word_index[w] for w in words if w in word_index)
+        indptr.append(len(word_ids))
+    data = np.ones(len(word_ids), dtype=np.float64)
+    doc_word = sparse.csr_matrix((data, np.array(word_ids, dtype=np.int64), np.array(indptr, dtype=np.int64)),
+                                 shape=(len(processed_words), len(word_index)))
+    doc_word.sum_duplicates()
+    return doc_word
+
+
+def fold_in(doc_word: sparse.csr_matrix, topic_word: np.ndarray, alpha: float = 0.0,
+            max_iter: int = FOLD_IN_MAX_ITER, tol: float = FOLD_IN_TOL) -> np.ndarray:
+    """topic_word固定，按批估计文档→主题分布θ（EM迭代，只在非零词上计算）：
+    θ_dk ∝ α + θ_dk · Σ_w n_dw·φ_kw / Σ_j θ_dj·φ_jw
+    alpha=0时即最小化各文档词频分布与θφ的KL散度（与训练目标一致）；无已知词的文档返回均匀分布"""
+    doc_word = sparse.csr_matrix(doc_word, dtype=np.float64)
+    n_docs, n_topics = doc_word.shape[0], topic_word.shape[0]
+    rows = np.repeat(np.arange(n_docs), np.diff(doc_word.indptr))
+    cols = doc_word.indices
+    phi_t = np.ascontiguousarray(topic_word.T)   # 词 × 主题
+    phi_nz = phi_t[cols]                           # 每个非零元素对应的φ_·w
+    theta = np.full((n_docs, n_topics), 1.0 / n_topics)
+    for _ in range(max_iter):
+        pred = np.einsum("ij,ij->i", theta[rows], phi_nz)          # 非零(d,w)上的预测概率
+        ratio = sparse.csr_matrix((doc_word.data / np.maximum(pred, 1e-300), cols, doc_word.indptr),
+                                  shape=doc_word.shape)
+        new_theta = theta * (ratio @ phi_t) + alpha
+        totals = new_theta.sum(axis=1, keepdims=True)
+        empty = totals[:, 0] <= 0
+        new_theta = np.where(empty[:, None], 1.0 / n_topics, new_theta / np.where(empty, 1.0, totals[:, 0])[:, None])
+        delta = np.abs(new_theta - theta).max() if n_docs else 0.0
+        theta = new_theta
+        if delta < tol:
+            break
+    return theta
+
+
+def infer_topics(messages: Sequence, mids: Optional[Sequence] = None, model: Optional[Dict] = None,
+                 batch_size: int = INFER_BATCH_SIZE, alpha: float = 0.0) -> pd.DataFrame:
+    """新微博 → 主主题ID与概率（分词走统一分词阶段的缓存，按batch_size分批推断）
+    返回与输入等长的DataFrame：topic_id、topic_prob、known_words（词典内的词数，为0时主题无意义，topic_id为-1）"""
+    model = load_topic_model() if model is None else model
+    messages = list(messages)
+    mids = None if mids is None else list(mids)
+    results = []
+    for start in range(0, len(messages), batch_size):
+        batch_mids = None if mids is None else mids[start:start + batch_size]
+        tokens = tokenize_messages(messages[start:start + batch_size], batch_mids)
+        doc_word = docs_to_csr([filter_tokens(t, keep_flags=LDA_POS_FLAGS) for t in tokens], model["word_index"])
+        theta = fold_in(doc_word, model["topic_word"], alpha=alpha)
+        known = np.asarray(doc_word.sum(axis=1)).ravel().astype(np.int64)
+        results.append(pd.DataFrame({
+            "topic_id": np.where(known > 0, theta.argmax(axis=1), -1),
+            "topic_prob": theta.max(axis=1),
+            "known_words": known,
+        }))
+    if not results:
+        return pd.DataFrame({"topic_id": [], "topic_prob": [], "known_words": []})
+    return pd.concat(results, ignore_index=True)
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+功能：天气时序关联（每日天气表 ↔ 签到记录）
+天气只按日期保存一份带类型的小表（数值气温、天气分类编码、降水/低能见度标记、风力等级），
+通过排序后的日期索引（searchsorted）关联到签到的ts_created，下游不再逐行解析"15℃""东南风 2级"等字符串
+"""
+
+import os
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+# -------------------------- 1. 基础配置 --------------------------
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROCESSED_DIR = os.path.join(BASE_DIR, "data", "processed_data")
+CHECKIN_AOI_CSV_PATH = os.path.join(PROCESSED_DIR, "南京景区-签到空间关联表.csv")   # spatial_fusion.py的输出
+DAILY_WEATHER_CSV_PATH = os.path.join(PROCESSED_DIR, "南京每日天气表.csv")
+FUSED_CSV_PATH = os.path.join(PROCESSED_DIR, "南京景区-天气-社媒情感融合表.csv")
+FUSED_ENCODING = "gbk"   # 融合表沿用Excel导出的GBK编码（data_store等读取方一致），GBK无法表示的字符（表情等）写为“?”
+COMPACT_OUTPUT = False   # True：融合表只保留ts_created，天气字段由data_store按日期从天气表关联（文件更小）
+
+WEATHER_TEXT_COLUMNS = ["最高气温", "最低气温", "天气", "风向"]
+WEATHER_CATEGORY_ORDER = ["晴", "雨", "云、雾", "其他"]
+
+
+# -------------------------- 2. 天气字符串解析（只对去重后的取值做一次） --------------------------
+def classify_weather(weather: pd.Series) -> pd.Series:
+    """天气描述 → 天气分类（雨 > 云、雾 > 晴 > 其他，与地图页筛选口径一致）"""
+    text = weather.astype("string")
+    category = np.select(
+        [text.str.contains("雨", na=False),
+         text.str.contains("云|雾", na=False),
+         text.str.contains("晴", na=False)],
+        ["雨", "云、雾", "晴"],
+        default="其他"
+    )
+    category = pd.Series(category, index=weather.index).where(weather.notna())
+    return pd.Categorical(category, categories=WEATHER_CATEGORY_ORDER)
+
+
+def parse_dates(values: pd.Series) -> pd.Series:
+    """ts_created → 日期（datetime64，精确到天）；先去重再解析"""
+    codes, uniques = pd.factorize(values.astype("string"))
+    parsed = pd.to_datetime(pd.Series(uniques), errors="coerce").dt.normalize().to_numpy()
+    out = np.full(len(values), np.datetime64("NaT"), dtype="datetime64[ns]")
+    out[codes >= 0] = parsed[codes[codes >= 0]]
+    return pd.Series(out, index=values.index)
+
+
+def build_daily_weather(raw: pd.DataFrame, date_col: str = "ts_created") -> pd.DataFrame:
+    """由含日期与天气字符串列的表（天气爬取表或旧融合表）生成按日期排序、带类型的每日天气表"""
+    daily = raw[[date_col] + WEATHER_TEXT_COLUMNS].copy()
+    daily["date"] = parse_dates(daily[date_col])
+    daily = daily.dropna(subset=["date"]).drop_duplicates(subset="date").sort_values("date")
+
+    weather = pd.DataFrame({"date": daily["date"].to_numpy()})
+    for col in ["最高气温", "最低气温"]:
+        weather[col] = pd.to_numeric(
+            daily[col].astype("string").str.replace("℃", "", regex=False).str.strip(), errors="coerce"
+        ).to_numpy(dtype=np.float32)
+    weather["天气"] = pd.Categorical(daily["天气"].to_numpy())
+    weather["天气分类"] = classify_weather(weather["天气"].astype(object))
+    weather["降水"] = weather["天气"].astype("string").str.contains("雨").astype("boolean")
+    weather["低能见度"] = weather["天气"].astype("string").str.contains("雾").astype("boolean")
+    wind = daily["风向"].astype("string").str.extract(r"^(\D*?)\s*(\d+)\s*级")
+    weather["风向"] = pd.Categorical(wind[0].str.strip().to_numpy())
+    weather["风力等级"] = pd.array(pd.to_numeric(wind[1], errors="coerce").to_numpy(), dtype="Int8")
+    return weather.reset_index(drop=True)
+
+
+def load_daily_weather(path: str = DAILY_WEATHER_CSV_PATH) -> pd.DataFrame:
+    """读取每日天气表并恢复类型"""
+    weather = pd.read_csv(path, encoding="utf-8-sig", parse_dates=["date"])
+    weather["最高气温"] = weather["最高气温"].astype(np.float32)
+    weather["最低气温"] = weather["最低气温"].astype(np.float32)
+    weather["天气"] = weather["天气"].astype("category")
+    weather["天气分类"] = pd.Categorical(weather["天气分类"], categories=WEATHER_CATEGORY_ORDER)
+    weather["风向"] = weather["风向"].astype("category")
+    weather["风力等级"] = weather["风力等级"].astype("Int8")
+    weather["降水"] = weather["降水"].astype("boolean")
+    weather["低能见度"] = weather["低能见度"].astype("boolean")
+    return weather.sort_values("date").reset_index(drop=True)
+
+
+# -------------------------- 3. 按日期关联 --------------------------
+def join_weather(checkins: pd.DataFrame, weather: pd.DataFrame, date_col: str = "ts_created") -> pd.DataFrame:
+    """在排序后的日期索引上二分查找，为每条签到追加当天的天气字段（无当天天气的为空）"""
+    weather = weather.reset_index(drop=True)
+    dates = parse_dates(checkins[date_col]).to_numpy()
+    weather_dates = weather["date"].to_numpy(dtype="datetime64[ns]")
+    pos = np.searchsorted(weather_dates, dates)
+    found = pos < len(weather_dates)
+    found[found] = weather_dates[pos[found]] == dates[found]
+
+    columns = [c for c in weather.columns if c != "date"]
+    picked = weather[columns].reindex(np.where(found, pos, -1)).reset_index(drop=True)  # -1 → 全空行
+    out = checkins.drop(columns=[c for c in columns if c in checkins.columns]).reset_index(drop=True)
+    return pd.concat([out, picked], axis=1)
+
+
+def add_weather_features(df: pd.DataFrame, weather: Optional[pd.DataFrame] = None,
+                         date_col: str = "ts_created") -> pd.DataFrame:
+    """为已含天气字符串列的表（如情感分析结果）换上带类型的天气字段
+    未传入天气表时，从表内按日期去重后解析一次，而不是逐行解析"""
+    if weather is None:
+        weather = build_daily_weather(df, date_col=date_col)
+    return join_weather(df, weather, date_col=date_col)
+
+
+def split_weather(fused: pd.DataFrame, date_col: str = "ts_created"):
+    """融合表 → (去掉天气字符串列的签到表, 每日天气表)"""
+    return fused.drop(columns=WEATHER_TEXT_COLUMNS), build_daily_weather(fused, date_col=date_col)
+
+
+# -------------------------- 4. 融合主流程 --------------------------
+def run_weather_fusion(checkin_path: str = CHECKIN_AOI_CSV_PATH, weather_path: str = DAILY_WEATHER_CSV_PATH,
+                       output_path: str = FUSED_CSV_PATH, compact: bool = COMPACT_OUTPUT) -> pd.DataFrame:
+    """签到空间关联表 + 每日天气表 → 融合表"""
+    if not os.path.exists(weather_path):
+        # 首次运行：从旧融合表中提取每日天气（旧表为Excel导出的GBK编码）
+        print(f"未找到每日天气表，从旧融合表提取 → {weather_path}")
+        legacy = pd.read_csv(FUSED_CSV_PATH, encoding=FUSED_ENCODING, usecols=["ts_created"] + WEATHER_TEXT_COLUMNS)
+        build_daily_weather(legacy).to_csv(weather_path, index=False, encoding="utf-8-sig")
+    weather = load_daily_weather(weather_path)
+
+    checkins = pd.read_csv(checkin_path, encoding="utf-8-sig", dtype={"mid": str, "userid": str})
+    if compact:
+        fused = checkins.drop(columns=[c for c in WEATHER_TEXT_COLUMNS if c in checkins.columns])
+    else:
+        fused = join_weather(checkins, weather)
+        missing = fused["天气"].isna().sum()
+        if missing:
+            print(f"提示：{missing}条签到的日期在天气表中不存在，天气字段为空")
+    fused.to_csv(output_path, index=False, encoding=FUSED_ENCODING, errors="replace")
+    print(f"📁 融合表已保存：{output_path}（{len(fused)}行，天气表{len(weather)}天）")
+    return fused
+
+
+# -------------------------- 5. 运行入口 --------------------------
+if __name__ == "__main__":
+    run_weather_fusion()
@@ -1,16 +1,28 @@
 import pandas as pd
-from sklearn.cluster import KMeans
 from sklearn.preprocessing import StandardScaler
-from sklearn.metrics import silhouette_score
 from sklearn.decomposition import PCA
 import matplotlib.pyplot as plt
 import warnings
 import os
+from data_store import TABLES, load_table
+from kmeans_sweep import best_k as select_best_k, sweep_k
+from incremental_clustering import build_state, fold_in, load_state, new_rows, save_state
+from scenic_features import scenic_aggregates, scenic_table, sentiment_score
 
 # -------------------------- 1. 配置保存路径 --------------------------
-# 结果保存目录
-save_dir = 'D:/大数据/聚类结果/'
-os.makedirs(save_dir, exist_ok=True)  # 确保目录存在，避免保存失败
+# 结果保存目录：聚类结果CSV写入处理后数据目录（data_store的clusters表），图片写入results/figures/
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+result_csv_path = TABLES['clusters']['csv']
+figure_dir = os.path.join(BASE_DIR, 'results', 'figures')
+
+# K值扫描配置
+cluster_range = range(2, 11)
+N_INIT = 10
+MAX_WORKERS = None           # 进程池大小，None为CPU核数；设为1则在当前进程内顺序拟合
+SILHOUETTE_MODE = 'auto'     # full/sample/precomputed/auto，大规模POI聚类时用sample或precomputed
+# 增量模式：只把上次运行后新增的签到并入持久化的景区累计量，MiniBatch方式更新簇中心并刷新聚类结果CSV
+# （不重新扫描K、不重画图；无状态文件或数据表被改写时自动全量运行）
+INCREMENTAL_MODE = False
 
 # -------------------------- 2. 屏蔽警告 & 中文配置 --------------------------
 warnings.filterwarnings('ignore', category=UserWarning)
@@ -18,99 +30,136 @@ plt.rcParams["font.family"] = ["SimHei"]
 plt.rcParams['axes.unicode_minus'] = False
 plt.rcParams['figure.dpi'] = 300  # 提高图片分辨率，保存更清晰
 
+
 # -------------------------- 3. 加载数据 & 预处理 --------------------------
-df = pd.read_csv('D:/大数据/情感分析结果（限制情感大类）.csv')
+def load_checkins():
+    df = load_table('emotion', columns=['mid', 'name', 'sentiment', 'intensity', 'tag2', 'lon', 'lat'])
 
-# 计算情感得分
-df['sentiment_num'] = df['sentiment'].map({'正面': 1, '负面': -1, '中性': 0})
-df['sentiment_score'] = df['sentiment_num'] * df['intensity']
+    # 计算情感得分（方向×强度，口径见scenic_features.py）
+    df['sentiment_score'] = sentiment_score(df)
+    return df
 
-# 按景区聚合（一景一类）
-scenic_agg = df.groupby('name').agg(
-    avg_sentiment_score=('sentiment_score', 'mean'),
-    main_type=('tag2', lambda x: x.mode()[0]),
-    avg_lon=('lon', 'mean'),
-    avg_lat=('lat', 'mean'),
-    record_count=('name', 'count')
-).reset_index()
 
 # -------------------------- 4. 聚类特征准备 --------------------------
-X = scenic_agg[['main_type', 'avg_sentiment_score', 'avg_lon', 'avg_lat']]
-X = pd.get_dummies(X, columns=['main_type'])
-X = X.dropna()
+def feature_frame(scenic_agg, feature_columns=None):
+    X = scenic_agg[['main_type', 'avg_sentiment_score', 'avg_lon', 'avg_lat']]
+    X = pd.get_dummies(X, columns=['main_type'])
+    if feature_columns is not None:
+        X = X.reindex(columns=feature_columns, fill_value=0)  # 增量模式：列顺序与全量聚类时一致
+    return X.dropna()
+
+
+def prepare_features(scenic_agg):
+    X = feature_frame(scenic_agg)
+    scaler = StandardScaler()
+    return scaler.fit_transform(X), scaler, list(X.columns)
 
-scaler = StandardScaler()
-X_scaled = scaler.fit_transform(X)
 
 # -------------------------- 5. 选择最优簇数 & 保存轮廓系数图 --------------------------
-silhouette_scores = []
-cluster_range = range(2, 11)
-for k in cluster_range:
-    kmeans = KMeans(n_clusters=k, random_state=42, n_init=10)
-    kmeans.fit(X_scaled)
-    silhouette_scores.append(silhouette_score(X_scaled, kmeans.labels_))
-
-# 绘制并保存轮廓系数图
-plt.figure(figsize=(8, 5))
-plt.plot(cluster_range, silhouette_scores, marker='o', color='#FF6B6B', linewidth=2)
-plt.xlabel('簇数（K）', fontsize=12)
-plt.ylabel('轮廓系数', fontsize=12)
-plt.title('轮廓系数法选择最优簇数', fontsize=14, pad=20)
-plt.grid(alpha=0.3, linestyle='--')
-plt.xticks(cluster_range)
-# 保存图片（PNG格式，清晰无压缩）
-plt.savefig(f'{save_dir}轮廓系数图.png', bbox_inches='tight')  # bbox_inches确保标签完整
-plt.close()  # 关闭图片，释放内存
-
-# 确定最优簇数
-best_k = cluster_range[silhouette_scores.index(max(silhouette_scores))]
-print(f'【最优聚类数量】: {best_k}，结果已保存至 {save_dir}\n')
-
-# -------------------------- 6. 执行聚类 --------------------------
-kmeans = KMeans(n_clusters=best_k, random_state=42, n_init=10)
-scenic_agg['cluster_label'] = kmeans.fit_predict(X_scaled)
-
-# -------------------------- 7. 聚类结果可视化 & 保存散点图 --------------------------
-pca = PCA(n_components=2)
-X_pca = pca.fit_transform(X_scaled)
-scenic_agg['pca_x'] = X_pca[:, 0]
-scenic_agg['pca_y'] = X_pca[:, 1]
-
-# 绘制并保存散点图
-plt.figure(figsize=(10, 8))
-colors = ['#FF6B6B', '#4ECDC4', '#45B7D1', '#96CEB4', '#FECA57', '#FF9FF3']
-for cluster in range(best_k):
-    cluster_data = scenic_agg[scenic_agg['cluster_label'] == cluster]
-    plt.scatter(
-        cluster_data['pca_x'],
-        cluster_data['pca_y'],
-        c=colors[cluster % len(colors)],
-        label=f'聚类{cluster + 1}（{len(cluster_data)}个景区）',
-        alpha=0.8,
-        s=80
-    )
-plt.xlabel(f'主成分1（解释方差：{pca.explained_variance_ratio_[0]:.1%}）', fontsize=11)
-plt.ylabel(f'主成分2（解释方差：{pca.explained_variance_ratio_[1]:.1%}）', fontsize=11)
-plt.title('景区聚类结果（按类型、情感、经纬度）', fontsize=14, pad=20)
-plt.legend(loc='best', fontsize=10)
-plt.grid(alpha=0.3, linestyle='--')
-# 保存散点图
-plt.savefig(f'{save_dir}聚类结果散点图.png', bbox_inches='tight')
-plt.close()
-
-# -------------------------- 8. 保存聚类结果为CSV --------------------------
-# 整理CSV结果（包含所有关键信息）
-result_df = scenic_agg[['name', 'cluster_label', 'avg_sentiment_score',
-                        'main_type', 'avg_lon', 'avg_lat', 'record_count']]
-# 重命名列名，便于阅读
-result_df.columns = ['景区名称', '聚类标签', '平均情感得分', '主要类型', '平均经度', '平均纬度', '评价记录数']
-# 保存为CSV（utf-8编码，兼容Excel）
-result_df.to_csv(f'{save_dir}景区聚类结果.csv', index=False, encoding='utf-8-sig')
-
-# -------------------------- 9. 控制台输出简要结果 --------------------------
-print('=' * 100)
-print(f'【结果保存完成】\n'
-      f'1. 聚类详细数据：{save_dir}景区聚类结果.csv\n'
-      f'2. 轮廓系数图：{save_dir}轮廓系数图.png\n'
-      f'3. 聚类散点图：{save_dir}聚类结果散点图.png')
-print('=' * 100)
\ No newline at end of file
+def plot_silhouette(silhouette_scores):
+    plt.figure(figsize=(8, 5))
+    plt.plot(cluster_range, silhouette_scores, marker='o', color='#FF6B6B', linewidth=2)
+    plt.xlabel('簇数（K）', fontsize=12)
+    plt.ylabel('轮廓系数', fontsize=12)
+    plt.title('轮廓系数法选择最优簇数', fontsize=14, pad=20)
+    plt.grid(alpha=0.3, linestyle='--')
+    plt.xticks(cluster_range)
+    # 保存图片（PNG格式，清晰无压缩）
+    plt.savefig(os.path.join(figure_dir, '轮廓系数图.png'), bbox_inches='tight')  # bbox_inches确保标签完整
+    plt.close()  # 关闭图片，释放内存
+
+
+# -------------------------- 6. 聚类结果可视化 & 保存散点图 --------------------------
+def plot_clusters(scenic_agg, X_scaled, best_k):
+    pca = PCA(n_components=2)
+    X_pca = pca.fit_transform(X_scaled)
+    scenic_agg['pca_x'] = X_pca[:, 0]
+    scenic_agg['pca_y'] = X_pca[:, 1]
+
+    # 绘制并保存散点图
+    plt.figure(figsize=(10, 8))
+    colors = ['#FF6B6B', '#4ECDC4', '#45B7D1', '#96CEB4', '#FECA57', '#FF9FF3']
+    for cluster in range(best_k):
+        cluster_data = scenic_agg[scenic_agg['cluster_label'] == cluster]
+        plt.scatter(
+            cluster_data['pca_x'],
+            cluster_data['pca_y'],
+            c=colors[cluster % len(colors)],
+            label=f'聚类{cluster + 1}（{len(cluster_data)}个景区）',
+            alpha=0.8,
+            s=80
+        )
+    plt.xlabel(f'主成分1（解释方差：{pca.explained_variance_ratio_[0]:.1%}）', fontsize=11)
+    plt.ylabel(f'主成分2（解释方差：{pca.explained_variance_ratio_[1]:.1%}）', fontsize=11)
+    plt.title('景区聚类结果（按类型、情感、经纬度）', fontsize=14, pad=20)
+    plt.legend(loc='best', fontsize=10)
+    plt.grid(alpha=0.3, linestyle='--')
+    # 保存散点图
+    plt.savefig(os.path.join(figure_dir, '聚类结果散点图.png'), bbox_inches='tight')
+    plt.close()
+
+
+# -------------------------- 7. 保存聚类结果为CSV --------------------------
+def save_results(scenic_agg):
+    # 整理CSV结果（包含所有关键信息）
+    result_df = scenic_agg[['name', 'cluster_label', 'avg_sentiment_score',
+                            'main_type', 'avg_lon', 'avg_lat', 'record_count']]
+    # 重命名列名，便于阅读
+    result_df.columns = ['景区名称', '聚类标签', '平均情感得分', '主要类型', '平均经度', '平均纬度', '评价记录数']
+    # 保存为CSV（utf-8编码，兼容Excel）
+    result_df.to_csv(result_csv_path, index=False, encoding='utf-8-sig')
+
+
+# -------------------------- 8. 运行入口 --------------------------
+def run_incremental(df, state):
+    """增量刷新聚类结果；数据表不是在上次基础上追加时返回False（需全量运行）"""
+    batch = new_rows(df, state)
+    if batch is None:
+        print('提示：数据表已被改写（非追加），改为全量聚类')
+        return False
+    scenic_agg = fold_in(state, batch, lambda agg: feature_frame(agg, state['feature_columns']))
+    save_results(scenic_agg)
+    save_state(state)
+    print(f'【增量聚类完成】新增{len(batch)}条签到，聚类结果已更新：{result_csv_path}')
+    return True
+
+
+# 进程池在Windows上以spawn方式启动子进程，会重新导入本脚本，因此主流程必须放在__main__保护下
+if __name__ == '__main__':
+    df = load_checkins()
+    state = load_state() if INCREMENTAL_MODE else None
+    if state is not None and run_incremental(df, state):
+        raise SystemExit(0)
+
+    os.makedirs(figure_dir, exist_ok=True)  # 确保目录存在，避免保存失败
+    # 按景区聚合（一景一类）：先求各景区的和/计数累计量，再得到均值与众数类型
+    sums, tag_counts = scenic_aggregates(df)
+    scenic_agg = scenic_table(sums, tag_counts)
+    X_scaled, scaler, feature_columns = prepare_features(scenic_agg)
+
+    # 各K并行拟合；同一特征矩阵的结果已缓存时直接读取
+    sweep = sweep_k(X_scaled, cluster_range, n_init=N_INIT, random_state=42,
+                    max_workers=MAX_WORKERS, silhouette=SILHOUETTE_MODE)
+    silhouette_scores = [sweep[k]['silhouette'] for k in cluster_range]
+    plot_silhouette(silhouette_scores)
+
+    # 确定最优簇数
+    best_k = select_best_k(sweep)
+    print(f'【最优聚类数量】: {best_k}，结果已保存至 {figure_dir}\n')
+
+    # 执行聚类：直接复用扫描中最优K的拟合结果（与单独重新拟合的结果相同），不再重复拟合
+    scenic_agg['cluster_label'] = sweep[best_k]['labels']
+
+    plot_clusters(scenic_agg, X_scaled, best_k)
+    save_results(scenic_agg)
+    # 保存增量状态，供之后的增量运行使用
+    save_state(build_state(df, sums, tag_counts, scaler, feature_columns, X_scaled,
+                           sweep[best_k]['centers']))
+
+    # 控制台输出简要结果
+    print('=' * 100)
+    print(f'【结果保存完成】\n'
+          f'1. 聚类详细数据：{result_csv_path}\n'
+          f'2. 轮廓系数图：{os.path.join(figure_dir, "轮廓系数图.png")}\n'
+          f'3. 聚类散点图：{os.path.join(figure_dir, "聚类结果散点图.png")}')
+    print('=' * 100)
@@ -1,6 +1,11 @@
 from dash import Dash, html, dcc, Input, Output
 import dash
 import dash_bootstrap_components as dbc
+import os
+import sys
+
+# 页面共用的数据处理模块（天气解析等）位于仓库根目录的code/下
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "code"))
 
 app = Dash(
     __name__,
@@ -13,6 +18,16 @@ app = Dash(
 )
 server = app.server
 
+# 回调耗时与响应大小埋点；/metrics输出Prometheus文本（见code/metrics.py）
+from metrics import instrument_dash
+instrument_dash(app)
+
+# 页面模块导入时不读数据，各页面数据在第一次打开时加载（见page_data.py）；
+# 以gunicorn -c gunicorn.conf.py启动时设置了DASH_PRELOAD=1：主进程在fork前加载好，worker写时复制共享
+if os.environ.get("DASH_PRELOAD") == "1":
+    from page_data import preload_datasets
+    preload_datasets()
+
 # 主布局：新增底部背景容器
 app.layout = html.Div([
     # 1. 原有内容：标题 + 导航栏
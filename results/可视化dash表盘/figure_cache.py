@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""
+页面图表缓存：按数据指纹缓存各页面的plotly图
+同一份数据只计算、绘制一次（内存 + 磁盘JSON），源数据更新后指纹变化，下次打开页面自动重新生成
+"""
+
+import json
+import os
+from typing import Callable, Dict, List
+
+import plotly.graph_objects as go
+import plotly.io as pio
+
+from data_store import PROCESSED_DIR, table_fingerprint
+
+FIGURE_CACHE_DIR = os.path.join(PROCESSED_DIR, "figure_cache")
+
+_memory_cache: Dict[str, Dict[str, go.Figure]] = {}
+
+
+def cached_figures(group: str, tables: List[str],
+                   build: Callable[[], Dict[str, go.Figure]]) -> Dict[str, go.Figure]:
+    """返回一组图（{图名: Figure}）；tables为这组图依赖的数据表，任一表的指纹变化即重新调用build"""
+    fingerprint = "_".join(table_fingerprint(name) for name in tables)
+    key = f"{group}-{fingerprint}"
+    if key in _memory_cache:
+        return _memory_cache[key]
+
+    path = os.path.join(FIGURE_CACHE_DIR, f"{key}.json")
+    figures = None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            figures = {name: pio.from_json(fig_json) for name, fig_json in json.load(f).items()}
+    except FileNotFoundError:
+        pass   # 尚未生成，或刚被其他worker作为旧版本清理
+    if figures is None:
+        figures = build()
+        os.makedirs(FIGURE_CACHE_DIR, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"   # gunicorn多个worker可能同时生成同一组图
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({name: fig.to_json() for name, fig in figures.items()}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        # 清理这组图的旧版本（其他worker可能已删除，或刚好在读取，删除失败时跳过）
+        for old in os.listdir(FIGURE_CACHE_DIR):
+            if old.startswith(f"{group}-") and old.endswith(".json") and old != f"{key}.json":
+                try:
+                    os.remove(os.path.join(FIGURE_CACHE_DIR, old))
+                except OSError:
+                    pass
+
+    for old_key in [k for k in _memory_cache if k.startswith(f"{group}-")]:
+        del _memory_cache[old_key]
+    _memory_cache[key] = figures
+    return figures
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+"""
+gunicorn部署配置（Linux）：在results/可视化dash表盘/目录下执行  gunicorn -c gunicorn.conf.py app:server
+preload_app：主进程先导入app并预加载页面数据，再fork出worker；worker以写时复制方式共享这份数据，
+启动时不再各自读取，每个worker独占的内存（USS）只有自身运行时的开销
+"""
+
+import os
+
+os.environ.setdefault("DASH_PRELOAD", "1")   # app.py据此在fork前调用preload_datasets()
+
+bind = os.environ.get("DASH_BIND", "0.0.0.0:8050")
+workers = int(os.environ.get("DASH_WORKERS", "4"))
+preload_app = True
+timeout = 120
+
+
+def when_ready(server):
+    from page_data import memory_usage
+    server.log.info(f"主进程预加载完成，内存（MB）：{memory_usage()}")
+
+
+def post_worker_init(worker):
+    from page_data import memory_usage
+    worker.log.info(f"worker {worker.pid} 启动，内存（MB）：{memory_usage()}")
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""
+页面数据提供者：各页面的数据集在第一次使用时才加载，每个进程只加载一次
+导入页面模块时不读数据（启动耗时与数据量无关）；gunicorn以preload_app方式启动时，主进程先调用preload_datasets()
+加载全部数据集，fork出的worker以写时复制方式共享这份内存，每个worker不再各自读取一遍
+"""
+
+import gc
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+import metrics
+
+_builders: Dict[str, Callable[[], Any]] = {}
+_datasets: Dict[str, Any] = {}
+_warmups: List[Callable[[], Any]] = []
+_lock = threading.Lock()
+
+
+def register_dataset(name: str):
+    """装饰器：登记数据集的构建函数（只登记，不执行）"""
+    def decorator(build: Callable[[], Any]) -> Callable[[], Any]:
+        _builders[name] = build
+        return build
+    return decorator
+
+
+def register_warmup(warm: Callable[[], Any]) -> Callable[[], Any]:
+    """装饰器：登记预加载时执行的预热函数（如生成默认视图的图，结果留在页面自己的缓存里，worker直接复用）"""
+    _warmups.append(warm)
+    return warm
+
+
+def get_dataset(name: str) -> Any:
+    """取数据集；本进程第一次调用时构建（多线程同时首次访问也只构建一次）"""
+    if name in _datasets:
+        return _datasets[name]
+    with _lock:
+        if name not in _datasets:
+            start = time.perf_counter()
+            _datasets[name] = _builders[name]()
+            metrics.observe("dash_dataset_build_seconds", time.perf_counter() - start, dataset=name)
+            print(f"数据集“{name}”加载完成：{time.perf_counter() - start:.2f}秒")
+    return _datasets[name]
+
+
+def set_dataset(name: str, data: Any):
+    """直接放入已构建好的数据集（如基准测试的合成数据），之后get_dataset返回该对象"""
+    with _lock:
+        _datasets[name] = data
+
+
+def preload_datasets(names: Optional[Iterable[str]] = None):
+    """预加载数据集（gunicorn主进程fork之前调用）
+    加载后执行gc.freeze()：这些对象不再被垃圾回收扫描，worker中的GC不会写这些内存页，共享页不会被逐页复制"""
+    for name in (list(_builders) if names is None else names):
+        get_dataset(name)
+    for warm in _warmups:
+        warm()
+    gc.freeze()
+
+
+def memory_usage() -> Dict[str, float]:
+    """本进程内存（MB）：rss=常驻内存，pss=按共享进程数分摊后的内存，uss=本进程独占的内存（仅Linux）"""
+    try:
+        with open("/proc/self/smaps_rollup", "r") as f:
+            fields = {line.split(":")[0]: int(line.split()[1]) for line in f if line.split()[-1] == "kB"}
+    except OSError:
+        return {}
+    return {"rss": fields["Rss"] / 1024, "pss": fields["Pss"] / 1024,
+            "uss": (fields["Private_Clean"] + fields["Private_Dirty"]) / 1024}
@@ -1,48 +1,74 @@
-from dash import html, register_page
-import pandas as pd
+from dash import html, dcc, register_page
+import plotly.express as px
+from analysis_pivots import add_analysis_columns, emotion_mean_intensity, share_pivot, top_keywords
+from data_store import load_table
+from figure_cache import cached_figures
+from page_data import register_warmup
 
 register_page(__name__, path="/emotion_view", name="情绪分析")
 
-df = pd.read_csv("data\processed_data\情感分析结果（限制情感大类）.csv")
+KEYWORD_EMOTIONS = ["愉悦", "怀旧"]  # 展示高频关键词的情感类型
 
-layout = html.Div([
-    html.H3("💬 情感与景区交叉分析", style={'margin': '20px 0'}),
 
-    # 外层容器：使用 CSS Grid 布局
-    html.Div([
-        # 各个图片卡片
-        html.Div([
-            html.H4("各景区情感类型分布"),
-            html.Img(src="/assets/可视化图片/不同情绪类型的平均强度.png",
-                     style={'width': '100%', 'borderRadius': '8px'})
-        ], className="image-card"),
+def build_figures(n_workers=1):
+    """按当前数据计算透视表并生成本页所有图（结果由figure_cache按数据指纹缓存）
+    n_workers：关键词分词未命中缓存时的进程数；页面请求中默认为1，不在Web worker里启动进程池"""
+    df = add_analysis_columns(load_table("emotion", columns=[
+        "mid", "message", "tag5", "sentiment", "intensity", "emotion_type", "天气", "降水", "低能见度"]))
 
-        html.Div([
-            html.H4("景区-情感类型占比"),
-            html.Img(src="/assets/可视化图片/景区-情感类型占比.png",
-                     style={'width': '100%', 'borderRadius': '8px'})
-        ], className="image-card"),
+    mean_intensity = emotion_mean_intensity(df)
+    intensity_fig = px.bar(x=mean_intensity.index.astype(str), y=mean_intensity.values,
+                           labels={'x': '情感类型', 'y': '平均强度'}, text_auto='.2f')
 
+    tag_emotion_pct = share_pivot(df, "tag5", "emotion_type")
+    share_fig = px.imshow(tag_emotion_pct, text_auto='.1%', color_continuous_scale='YlOrRd',
+                          labels={'x': '情感类型', 'y': '景区类型', 'color': '占比'}, aspect='auto')
 
-        html.Div([
-            html.H4("愉悦情感关键词云"),
-            html.Img(src="/assets/可视化图片/“愉悦”情感关键词云.png",
-                     style={'width': '100%', 'borderRadius': '8px'})
-        ], className="image-card"),
+    figures = {'emotion_intensity': intensity_fig, 'tag_emotion_share': share_fig}
+    for emotion in KEYWORD_EMOTIONS:
+        subset = df[df['emotion_type'] == emotion]
+        keywords = top_keywords(subset['message'], subset['mid'], n_workers=n_workers)
+        words, counts = zip(*keywords) if keywords else ((), ())
+        figures[f'keywords_{emotion}'] = px.bar(x=list(counts)[::-1], y=list(words)[::-1], orientation='h',
+                                                labels={'x': '词频', 'y': '关键词'})
+
+    for fig in figures.values():
+        fig.update_layout(height=420, margin=dict(l=20, r=20, t=30, b=20))
+    return figures
+
+
+@register_warmup
+def warm_figures():
+    """预加载时（gunicorn主进程fork之前）生成本页的图：冷启动时的分词在这里用进程池完成并写入分词缓存"""
+    cached_figures("emotion_view", ["emotion"], lambda: build_figures(n_workers=None))
+
+
+def figure_card(title, figure):
+    return html.Div([
+        html.H4(title),
+        dcc.Graph(figure=figure, config={'displaylogo': False}, style={'width': '100%'})
+    ], className="image-card", style={'width': '100%'})
+
+
+def layout():
+    # 每次打开页面都按数据指纹取图：数据未变时直接用缓存，数据更新后自动重新生成
+    figures = cached_figures("emotion_view", ["emotion"], build_figures)
+    return html.Div([
+        html.H3("💬 情感与景区交叉分析", style={'margin': '20px 0'}),
 
+        # 外层容器：使用 CSS Grid 布局
         html.Div([
-            html.H4("怀旧情感关键词云"),
-            html.Img(src="/assets/可视化图片/“怀旧”情感关键词云.png",
-                     style={'width': '100%', 'borderRadius': '8px'})
-        ], className="image-card")
-
-        
-    ], style={
-        'display': 'grid',
-        'gridTemplateColumns': 'repeat(auto-fit, minmax(450px, 1fr))',
-        'gap': '20px',
-        'justifyItems': 'center',
-        'alignItems': 'start',
-        'padding': '10px'
-    })
-])
+            figure_card("不同情绪类型的平均强度", figures['emotion_intensity']),
+            figure_card("景区-情感类型占比", figures['tag_emotion_share']),
+        ] + [
+            figure_card(f"{emotion}情感高频关键词", figures[f'keywords_{emotion}'])
+            for emotion in KEYWORD_EMOTIONS
+        ], style={
+            'display': 'grid',
+            'gridTemplateColumns': 'repeat(auto-fit, minmax(450px, 1fr))',
+            'gap': '20px',
+            'justifyItems': 'center',
+            'alignItems': 'start',
+            'padding': '10px'
+        })
+    ])
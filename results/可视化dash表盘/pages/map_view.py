@@ -1,142 +1,153 @@
-from dash import html, dcc, register_page, Input, Output
+from dash import html, dcc, register_page, Input, Output, State, no_update
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 import numpy as np
+from functools import lru_cache
+from data_store import VALID_EMOTION_TYPES, load_table
+from page_data import get_dataset, register_dataset, register_warmup
+from scenic_features import group_sums
 
 register_page(__name__, path="/map_view", name="地图分布")
 
-# 数据读取与预处理
-df = pd.read_csv("data\processed_data\情感分析结果（限制情感大类）.csv")
-df["最高气温"] = df["最高气温"].astype(str).str.replace("℃", "").astype(float)
-df["最低气温"] = df["最低气温"].astype(str).str.replace("℃", "").astype(float)
-
-# 确保情感分类合法
-valid_emotion_types = ['愉悦', '无情绪', '怀旧', '失望', '悲伤', '烦躁']
-df['emotion_type'] = df['emotion_type'].where(df['emotion_type'].isin(valid_emotion_types), '中性')
-
-# 确保intensity是数值（0-10范围）
-df['intensity'] = pd.to_numeric(df['intensity'], errors='coerce').fillna(0)
-
-
-# 定义天气映射关系
-def map_weather_to_category(weather):
-    if pd.isna(weather):
-        return None
-    weather = str(weather)
-    if "雨" in weather:
-        return "雨"
-    elif "云" in weather or "雾" in weather:
-        return "云、雾"
-    elif "晴" in weather:
-        return "晴"
-    else:
-        return "其他"
+valid_emotion_types = VALID_EMOTION_TYPES
+FILTER_COLUMNS = ['天气分类', 'tag5', 'emotion_type']
+
+# ---------------------- 地图聚合模式（服务端按景区汇总） ----------------------
+MAX_MAP_POINTS = 10000   # 筛选结果超过该行数时改为按景区聚合显示
+DETAIL_ZOOM = 10         # 地图缩放级别小于该值（缩得更远）时按景区聚合显示
+DETAIL_MESSAGES = 20     # 点击聚合点时最多展示的微博条数
+EMOTION_COLORS = {'愉悦': '#43A047', '无情绪': '#78909C', '怀旧': '#1E88E5',
+                  '悲伤': '#8E24AA', '烦躁': '#FB8C00', '失望': '#F4511E', '中性': '#B0BEC5'}
+
+
+# ---------------------- 页面数据：第一次打开页面时加载（每个进程一次），导入本模块时不读数据 ----------------------
+@register_dataset("map_view")
+def build_map_data():
+    """签到数据 + 预计算的筛选立方体与景区聚合表"""
+    # 数据读取（Parquet快照）：气温已为数值、天气分类已解析、非法情感类型已归为“中性”、intensity为0-10整数
+    return map_data_from_frame(load_table("emotion"))
+
+
+def map_data_from_frame(df):
+    """由情感分析结果表构建页面数据（基准测试中传入合成数据）"""
+    # 抖动坐标只生成一次（固定种子），同一筛选条件每次得到相同的图，也省去每次回调的复制与随机数
+    rng = np.random.default_rng(42)
+    df['lat_jittered'] = df['lat'] + rng.normal(0, 0.001, len(df))
+    df['lon_jittered'] = df['lon'] + rng.normal(0, 0.001, len(df))
+    df['row_id'] = np.arange(len(df))  # 点模式下每个点只携带行号，微博正文点击后再取
+
+    # 每个(天气分类, 景区类型, 情感类型)组合 → 行号数组；以及每个组合的计数（两个饼图直接由计数汇总）
+    cell_rows = df.groupby(FILTER_COLUMNS, observed=True, dropna=False).indices
+    cell_table = pd.DataFrame(list(cell_rows.keys()), columns=FILTER_COLUMNS)
+    cell_table['数量'] = [len(rows) for rows in cell_rows.values()]
+
+    # 每个(组合, 景区)的计数与强度/经纬度之和：聚合图由这张小表汇总，与签到总行数无关
+    aoi_cells = group_sums(df, FILTER_COLUMNS + ['name'], ['intensity', 'lon', 'lat'], count_name='数量').rename(
+        columns={'intensity_sum': '强度和', 'lon_sum': '经度和', 'lat_sum': '纬度和'})
+    return {'df': df, 'cell_rows': cell_rows, 'cell_table': cell_table, 'aoi_cells': aoi_cells}
+
+
+def select_cells(selected_weather, selected_poi_type, selected_emotion, table=None):
+    """筛选条件 → 命中的组合（None表示该维度不筛选）"""
+    table = get_dataset("map_view")['cell_table'] if table is None else table
+    mask = np.ones(len(table), dtype=bool)
+    for col, value in zip(FILTER_COLUMNS, (selected_weather, selected_poi_type, selected_emotion)):
+        if value:
+            mask &= (table[col] == value).to_numpy()
+    return table[mask]
+
+
+def select_rows(cells):
+    """命中组合的行号合并后按原始顺序取行"""
+    data = get_dataset("map_view")
+    if cells.empty:
+        return data['df'].iloc[:0]
+    keys = cells[FILTER_COLUMNS].itertuples(index=False, name=None)
+    return data['df'].take(np.sort(np.concatenate([data['cell_rows'][k] for k in keys])))
 
-# 创建新的天气分类列
-df['天气分类'] = df['天气'].apply(map_weather_to_category)
 
 # 定义天气分类的显示顺序
 weather_order = ["晴", "雨", "云、雾"]
 
-layout = html.Div([
-    html.H3("🗺 景点评价情感分布地图"),
+def layout():
+    # 第一次打开页面时才加载数据（景区类型选项来自数据）
+    return html.Div([
+        html.H3("🗺 景点评价情感分布地图"),
     
-    # 筛选器容器
-    html.Div([
-        # 天气筛选器
+        # 筛选器容器
         html.Div([
-            #下拉菜单中菜单中的文字改变为黑色字体
-
-            dcc.Dropdown(
-                id='weather_filter',
-                options=[{'label': w, 'value': w} for w in weather_order],
-                value=None,
-                placeholder="选择天气类型（空表示全部）",
-                clearable=True,
-                style={'width': '100%', 'color': 'black'}
-            )
-        ], style={'width': '32%', 'display': 'inline-block'}),
+            # 天气筛选器
+            html.Div([
+                #下拉菜单中菜单中的文字改变为黑色字体
+
+                dcc.Dropdown(
+                    id='weather_filter',
+                    options=[{'label': w, 'value': w} for w in weather_order],
+                    value=None,
+                    placeholder="选择天气类型（空表示全部）",
+                    clearable=True,
+                    style={'width': '100%', 'color': 'black'}
+                )
+            ], style={'width': '32%', 'display': 'inline-block'}),
         
-        # 景点类型筛选器
-        html.Div([
-            dcc.Dropdown(
-                id='poi_type_filter',
-                options=[{'label': t, 'value': t} for t in sorted(df['tag5'].dropna().unique())],
-                value=None,
-                placeholder="选择景区类型（空表示全部）",
-                clearable=True,
-                style={'width': '100%', 'color': 'black'}
-            )
-        ], style={'width': '32%', 'display': 'inline-block', 'margin-left': '2%'}),
+            # 景点类型筛选器
+            html.Div([
+                dcc.Dropdown(
+                    id='poi_type_filter',
+                    options=[{'label': t, 'value': t} for t in sorted(get_dataset("map_view")['df']['tag5'].dropna().unique())],
+                    value=None,
+                    placeholder="选择景区类型（空表示全部）",
+                    clearable=True,
+                    style={'width': '100%', 'color': 'black'}
+                )
+            ], style={'width': '32%', 'display': 'inline-block', 'margin-left': '2%'}),
         
-        # 情感筛选器
-        html.Div([
-            dcc.Dropdown(
-                id='emotion_filter',
-                options=[{'label': e, 'value': e} for e in valid_emotion_types],
-                value=None,
-                placeholder="选择情感类型（空表示全部）",
-                clearable=True,
-                style={'width': '100%', 'color': 'black'}
-            )
-        ], style={'width': '32%', 'display': 'inline-block', 'margin-left': '2%'})
-    ], style={'margin': '0 auto 30px auto', 'width': '90%'}),
+            # 情感筛选器
+            html.Div([
+                dcc.Dropdown(
+                    id='emotion_filter',
+                    options=[{'label': e, 'value': e} for e in valid_emotion_types],
+                    value=None,
+                    placeholder="选择情感类型（空表示全部）",
+                    clearable=True,
+                    style={'width': '100%', 'color': 'black'}
+                )
+            ], style={'width': '32%', 'display': 'inline-block', 'margin-left': '2%'})
+        ], style={'margin': '0 auto 30px auto', 'width': '90%'}),
     
-    # 主要内容区域 - 左侧地图，右侧两个饼图上下排列
-    html.Div([
-        # 左侧地图
+        # 主要内容区域 - 左侧地图，右侧两个饼图上下排列
         html.Div([
-            dcc.Graph(id='map_graph')
-        ], style={'width': '65%', 'display': 'inline-block', 'vertical-align': 'top'}),
+            # 左侧地图
+            html.Div([
+                dcc.Graph(id='map_graph'),
+                # 当前缩放级别是否低于DETAIL_ZOOM（只在跨过该级别时变化，平移、自适应尺寸等不触发重绘）
+                dcc.Store(id='map_zoomed_out', data=False),
+                # 点击地图后按需加载的微博正文
+                html.Div(id='map_click_detail', style={'maxHeight': '240px', 'overflowY': 'auto', 'padding': '8px'})
+            ], style={'width': '65%', 'display': 'inline-block', 'vertical-align': 'top'}),
         
-        # 右侧图表区域（上下排列两个饼图）
-        html.Div([
-            # 情感分布饼图
+            # 右侧图表区域（上下排列两个饼图）
             html.Div([
-                dcc.Graph(id='emotion_pie_chart')
-            ], style={'width': '100%', 'display': 'inline-block', 'vertical-align': 'top'}),
+                # 情感分布饼图
+                html.Div([
+                    dcc.Graph(id='emotion_pie_chart')
+                ], style={'width': '100%', 'display': 'inline-block', 'vertical-align': 'top'}),
             
-            # 景区分布饼图
-            html.Div([
-                dcc.Graph(id='poi_pie_chart')
-            ], style={'width': '100%', 'display': 'inline-block', 'vertical-align': 'top'})
-        ], 
-        style={'width': '33%', 'display': 'inline-block', 'margin-left': '2%', 'vertical-align': 'top'})
-    ], style={'width': '90%', 'margin': '0 auto'})
-])
+                # 景区分布饼图
+                html.Div([
+                    dcc.Graph(id='poi_pie_chart')
+                ], style={'width': '100%', 'display': 'inline-block', 'vertical-align': 'top'})
+            ], 
+            style={'width': '33%', 'display': 'inline-block', 'margin-left': '2%', 'vertical-align': 'top'})
+        ], style={'width': '90%', 'margin': '0 auto'})
+    ])
 
 
-# 回调函数（更新图表）
-def update_dashboard(selected_weather, selected_poi_type, selected_emotion):
-    # 筛选数据
-    filtered_df = df.copy()
-    if selected_weather:
-        filtered_df = filtered_df[filtered_df['天气分类'] == selected_weather]
-    if selected_poi_type:
-        filtered_df = filtered_df[filtered_df['tag5'] == selected_poi_type]
-    if selected_emotion:
-        filtered_df = filtered_df[filtered_df['emotion_type'] == selected_emotion]
-    
-    # 处理空数据情况
-    if filtered_df.empty:
-        empty_fig = go.Figure().update_layout(
-            annotations=[{'text': '无符合条件的数据', 'xref': 'paper', 'yref': 'paper', 
-                         'font': {'size': 16}, 'showarrow': False}],
-            title='筛选结果为空'
-        )
-        return empty_fig, empty_fig, empty_fig
-
-    # ----------------------
-    # 1. 地图：景点情感分布
-    # ----------------------
-    # 添加轻微的随机噪声以防止点重叠
-    filtered_df_copy = filtered_df.copy()
-    filtered_df_copy['lat_jittered'] = filtered_df_copy['lat'] + np.random.normal(0, 0.001, len(filtered_df_copy))
-    filtered_df_copy['lon_jittered'] = filtered_df_copy['lon'] + np.random.normal(0, 0.001, len(filtered_df_copy))
-    
+def build_point_map(filtered_df, title):
+    """逐点显示（抖动坐标已在启动时生成，防止点重叠）；悬停不含微博正文，点击后再按行号获取"""
     map_fig = px.scatter_mapbox(
-        filtered_df_copy,
+        filtered_df,
         lat='lat_jittered', lon='lon_jittered',  # 使用添加了抖动的坐标
         color='emotion_type',
         #透明度
@@ -144,8 +155,9 @@ def update_dashboard(selected_weather, selected_poi_type, selected_emotion):
         size='intensity',
         size_max=15,   # 0-10范围（比之前大一点）
         hover_name='name',
+        custom_data=['row_id'],
         hover_data={
-            'message': True, '天气': True, 'emotion_type': True,
+            '天气': True, 'emotion_type': True,
             '最高气温': True, '最低气温': True, 'tag5': True,   # 显示景区类型
             'lat': False, 'lon': False, 'lat_jittered': False, 'lon_jittered': False  # 隐藏抖动坐标
         },
@@ -160,11 +172,69 @@ def update_dashboard(selected_weather, selected_poi_type, selected_emotion):
             '烦躁': '#FB8C00',      # 深橙色，代表烦躁情绪，醒目但不过分刺眼
             '失望': '#F4511E'       # 深橙红色，代表失望情绪，温暖中带点冷色调
         },
-        title=f"景点情感分布（天气: {selected_weather if selected_weather else '全部'} | 景区: {selected_poi_type if selected_poi_type else '全部'} | 情感: {selected_emotion if selected_emotion else '全部'}）"
+        title=title
     )
-    # 限制地图范围为南京市
+    return map_fig
+
+
+def build_aggregate_map(selected_weather, selected_poi_type, selected_emotion, title):
+    """按景区聚合：每个景区一个点（位置=签到平均经纬度，大小=签到数，颜色=主导情感，悬停显示平均强度）"""
+    sub = select_cells(selected_weather, selected_poi_type, selected_emotion, table=get_dataset("map_view")['aoi_cells'])
+    per_aoi = sub.groupby('name', observed=True)[['数量', '强度和', '经度和', '纬度和']].sum()
+    per_aoi = per_aoi[per_aoi['数量'] > 0]
+    emotion_by_aoi = sub.pivot_table(index='name', columns='emotion_type', values='数量',
+                                     aggfunc='sum', fill_value=0, observed=True)
+    per_aoi['主导情感'] = emotion_by_aoi.idxmax(axis=1).reindex(per_aoi.index).astype(str)
+    per_aoi['平均强度'] = per_aoi['强度和'] / per_aoi['数量']
+    per_aoi['lon'] = per_aoi['经度和'] / per_aoi['数量']
+    per_aoi['lat'] = per_aoi['纬度和'] / per_aoi['数量']
+    per_aoi = per_aoi.reset_index()
+
+    map_fig = go.Figure()
+    for emotion, group in per_aoi.groupby('主导情感'):
+        map_fig.add_trace(go.Scattermapbox(
+            lat=group['lat'], lon=group['lon'], mode='markers', name=emotion,
+            marker=dict(size=np.clip(np.sqrt(group['数量']) * 3, 6, 40), color=EMOTION_COLORS.get(emotion), opacity=0.7),
+            customdata=group[['name', '数量', '平均强度']].to_numpy(),
+            hovertemplate='<b>%{customdata[0]}</b><br>签到数：%{customdata[1]}<br>平均强度：%{customdata[2]:.1f}'
+                          f'<br>主导情感：{emotion}<extra></extra>'
+        ))
+    map_fig.update_layout(
+        title=f"{title}（按景区聚合，点击查看微博）", height=600,
+        mapbox=dict(style='carto-positron', zoom=11, center=dict(lat=32.0603, lon=118.7969))
+    )
+    return map_fig
+
+
+# 回调函数（更新图表）
+# 同一筛选组合的三张图只生成一次，之后直接从LRU缓存返回（返回的是共享对象，回调中复制后再返回）
+@lru_cache(maxsize=256)
+def update_dashboard(selected_weather, selected_poi_type, selected_emotion, zoomed_out=False):
+    # 筛选数据：只在预分组的组合上做判断
+    cells = select_cells(selected_weather, selected_poi_type, selected_emotion)
+    
+    # 处理空数据情况
+    if cells['数量'].sum() == 0:
+        empty_fig = go.Figure().update_layout(
+            annotations=[{'text': '无符合条件的数据', 'xref': 'paper', 'yref': 'paper', 
+                         'font': {'size': 16}, 'showarrow': False}],
+            title='筛选结果为空'
+        )
+        return empty_fig, empty_fig, empty_fig
+
+    # ----------------------
+    # 1. 地图：景点情感分布
+    # ----------------------
+    title = f"景点情感分布（天气: {selected_weather if selected_weather else '全部'} | 景区: {selected_poi_type if selected_poi_type else '全部'} | 情感: {selected_emotion if selected_emotion else '全部'}）"
+    if zoomed_out or cells['数量'].sum() > MAX_MAP_POINTS:
+        # 行数过多或地图缩得较远：服务端聚合，传给浏览器的数据量只与景区数有关
+        map_fig = build_aggregate_map(selected_weather, selected_poi_type, selected_emotion, title)
+    else:
+        map_fig = build_point_map(select_rows(cells), title)
+    # 限制地图范围为南京市；uirevision保持用户当前的缩放与平移
     map_fig.update_layout(
         margin={'r':0,'t':40,'l':0,'b':0},
+        uirevision='map',
         mapbox=dict(
             center=dict(lat=32.0603, lon=118.7969)
             )
@@ -173,7 +243,8 @@ def update_dashboard(selected_weather, selected_poi_type, selected_emotion):
     # ----------------------
     # 2. 情感分布饼图
     # ----------------------
-    emotion_counts = filtered_df['emotion_type'].value_counts().reset_index()
+    emotion_counts = cells.groupby('emotion_type', observed=True)['数量'].sum().sort_values(ascending=False)
+    emotion_counts = emotion_counts[emotion_counts > 0].reset_index()
     emotion_counts.columns = ['情感类型', '数量']
     
     # 如果没有数据，创建空的饼图
@@ -209,7 +280,8 @@ def update_dashboard(selected_weather, selected_poi_type, selected_emotion):
     # ----------------------
     # 3. 景区分布饼图（使用tag5）
     # ----------------------
-    poi_counts = filtered_df['tag5'].value_counts().reset_index()
+    poi_counts = cells.groupby('tag5', observed=True)['数量'].sum().sort_values(ascending=False)
+    poi_counts = poi_counts[poi_counts > 0].reset_index()
     poi_counts.columns = ['景区', '数量']
     
     # 如果没有数据，创建空的饼图
@@ -232,6 +304,12 @@ def update_dashboard(selected_weather, selected_poi_type, selected_emotion):
     return map_fig, emotion_pie_fig, poi_pie_fig
 
 
+@register_warmup
+def warm_default_view():
+    """预加载时生成默认（不筛选）视图的三张图，worker的首个请求直接命中update_dashboard的缓存"""
+    update_dashboard(None, None, None)
+
+
 # 注册回调函数
 from dash import callback
 @callback(
@@ -240,7 +318,64 @@ from dash import callback
      Output('poi_pie_chart', 'figure')],
     [Input('weather_filter', 'value'),
      Input('poi_type_filter', 'value'),
-     Input('emotion_filter', 'value')]
+     Input('emotion_filter', 'value'),
+     Input('map_zoomed_out', 'data')]
+)
+def update_map(selected_weather, selected_poi_type, selected_emotion, zoomed_out):
+    figures = update_dashboard(selected_weather, selected_poi_type, selected_emotion, zoomed_out=bool(zoomed_out))
+    return tuple(go.Figure(fig) for fig in figures)   # 复制缓存中的图，避免多个请求共享同一个Figure对象
+
+
+def relayout_zoom(relayout_data):
+    """从relayoutData中取出mapbox缩放级别；平移、自适应尺寸等不含缩放的relayout返回None"""
+    relayout_data = relayout_data or {}
+    if 'mapbox.zoom' in relayout_data:
+        return relayout_data['mapbox.zoom']
+    for key in ('mapbox', 'mapbox._derived'):
+        value = relayout_data.get(key)
+        if isinstance(value, dict) and 'zoom' in value:
+            return value['zoom']
+    return None
+
+
+@callback(
+    Output('map_zoomed_out', 'data'),
+    Input('map_graph', 'relayoutData'),
+    State('map_zoomed_out', 'data')
+)
+def update_zoom_mode(relayout_data, zoomed_out):
+    zoom = relayout_zoom(relayout_data)
+    if zoom is None or (zoom < DETAIL_ZOOM) == bool(zoomed_out):
+        return no_update   # 缩放级别未跨过DETAIL_ZOOM：地图不重绘
+    return zoom < DETAIL_ZOOM
+
+
+def message_details(click_data, selected_weather, selected_poi_type, selected_emotion):
+    """点击地图后才取微博正文：点模式取该点所在行，聚合模式取该景区（当前筛选条件下）的前几条"""
+    if not click_data or not click_data.get('points'):
+        return "点击地图上的点查看微博内容"
+    key = click_data['points'][0].get('customdata')
+    key = key[0] if isinstance(key, (list, tuple)) else key
+    if isinstance(key, str):
+        cells = select_cells(selected_weather, selected_poi_type, selected_emotion)
+        rows = select_rows(cells)
+        rows = rows[rows['name'] == key].head(DETAIL_MESSAGES)
+        header = f"{key}（当前筛选下前{len(rows)}条）"
+    else:
+        rows = get_dataset("map_view")['df'].iloc[[int(key)]]
+        header = str(rows['name'].iloc[0])
+    return [html.H5(header)] + [
+        html.P(f"【{r.emotion_type}·{r.天气}】{r.message}", style={'margin': '4px 0'})
+        for r in rows.itertuples()
+    ]
+
+
+@callback(
+    Output('map_click_detail', 'children'),
+    Input('map_graph', 'clickData'),
+    [State('weather_filter', 'value'),
+     State('poi_type_filter', 'value'),
+     State('emotion_filter', 'value')]
 )
-def update_map(selected_weather, selected_poi_type, selected_emotion):
-    return update_dashboard(selected_weather, selected_poi_type, selected_emotion)
\ No newline at end of file
+def show_message_details(click_data, selected_weather, selected_poi_type, selected_emotion):
+    return message_details(click_data, selected_weather, selected_poi_type, selected_emotion)
\ No newline at end of file
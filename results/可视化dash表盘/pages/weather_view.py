@@ -1,103 +1,82 @@
 from dash import html, dcc, register_page
-import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+from analysis_pivots import (TYPICAL_WEATHER, add_analysis_columns, box_stats, group_mean_ci, mean_pivot,
+                             share_pivot, top_emotion_intensity)
+from data_store import load_table
+from figure_cache import cached_figures
 
 # 注册新页面
 register_page(__name__, path="/weather_view", name="气象-情感-景区-三维交叉分析")
 
-layout = html.Div([
 
-    html.H3("气象-情感-景区-三维交叉分析", style={'margin': '20px 0'}),
+def grouped_bar(stats, hue, legend_title):
+    """景区类型 × 天气分组的平均情感得分柱状图（误差线为95%置信区间）"""
+    fig = px.bar(stats, x='tag5', y='mean', color=hue, barmode='group', error_y='ci95',
+                 labels={'tag5': '景区类型', 'mean': '情感得分（正值=正面，绝对值=强度）', hue: legend_title})
+    fig.update_xaxes(tickangle=45)
+    return fig
 
-    # 使用 CSS Grid 创建两栏布局
-    html.Div([
-        # 第一行左
-        html.Div([
-            html.H4("降水与景区情感对比", style={'fontSize': 16}),
-            html.Img(
-                src="/assets/可视化图片/降水-景区情感对比.png",
-                style={
-                    'width': '100%',
-                    'maxWidth': '450px',
-                    'height': 'auto',
-                    'border': '1px solid #ddd',
-                    'borderRadius': '8px'
-                }
-            )
-        ], className="image-card"),
-
-        # 第一行右
-        html.Div([
-            html.H4("能见度与景区情感对比", style={'fontSize': 16}),
-            html.Img(
-                src="/assets/可视化图片/能见度-景区情感对比.png",
-                style={
-                    'width': '100%',
-                    'maxWidth': '450px',
-                    'height': 'auto',
-                    'border': '1px solid #ddd',
-                    'borderRadius': '8px'
-                }
-            )
-        ], className="image-card"),
-
-        # 第二行左
-        html.Div([
-            html.H4("天气情感分布箱线图", style={'fontSize': 16}),
-            html.Img(
-                src="/assets/可视化图片/天气情感分布箱线图.png",
-                style={
-                    'width': '100%',
-                    'maxWidth': '450px',
-                    'height': 'auto',
-                    'border': '1px solid #ddd',
-                    'borderRadius': '8px'
-                }
-            )
-        ], className="image-card"),
-
-        # 第二行右
-        html.Div([
-            html.H4("天气-情感类型占比", style={'fontSize': 16}),
-            html.Img(
-                src="/assets/可视化图片/天气-情感类型占比.png",
-                style={
-                    'width': '100%',
-                    'maxWidth': '450px',
-                    'height': 'auto',
-                    'border': '1px solid #ddd',
-                    'borderRadius': '8px'
-                }
-            )
-        ], className="image-card"),
-
-        # 第三行横跨两列
-        html.Div([
-            html.H4("天气与景区情感热力图", style={'fontSize': 16}),
-            html.Img(
-                src="/assets/可视化图片/天气-景区情感热力图.png",
-                style={
-                    'width': '100%',
-                    'maxWidth': '920px',
-                    'height': 'auto',
-                    'border': '1px solid #ddd',
-                    'borderRadius': '8px'
-                }
-            )
-        ], className="image-card wide-card"),
-
-        # 第四行横跨两列
+
+def build_figures():
+    """按当前数据计算透视表并生成本页所有图（结果由figure_cache按数据指纹缓存）"""
+    df = add_analysis_columns(load_table("emotion", columns=[
+        "tag5", "sentiment", "intensity", "emotion_type", "天气", "降水", "低能见度"]))
+
+    rain_fig = grouped_bar(group_mean_ci(df, "tag5", "是否降水"), "是否降水", "天气类型")
+    visibility_fig = grouped_bar(group_mean_ci(df, "tag5", "能见度等级"), "能见度等级", "能见度等级")
+
+    box = box_stats(df, "原始天气类型")
+    box_fig = go.Figure(go.Box(x=box.index.tolist(), q1=box['q1'], median=box['median'], q3=box['q3'],
+                               lowerfence=box['lowerfence'], upperfence=box['upperfence'], name='情感得分'))
+    box_fig.update_layout(xaxis_title='原始天气类型', yaxis_title='情感得分')
+
+    weather_emotion_pct = share_pivot(df[df["原始天气类型"].isin(TYPICAL_WEATHER)], "原始天气类型", "emotion_type")
+    weather_share_fig = px.imshow(weather_emotion_pct, text_auto='.1%', color_continuous_scale='YlOrRd',
+                                  labels={'x': '情感类型', 'y': '天气', 'color': '占比'}, aspect='auto')
+
+    heatmap_fig = px.imshow(mean_pivot(df, "tag5", "原始天气类型"), text_auto='.1f',
+                            color_continuous_scale='YlGnBu',
+                            labels={'x': '天气', 'y': '景区类型', 'color': '平均情感得分'}, aspect='auto')
+
+    three_dim = top_emotion_intensity(df)
+    three_dim.columns = [f"{weather}｜{emotion}" for weather, emotion in three_dim.columns]
+    three_dim_fig = px.imshow(three_dim, text_auto='.1f', color_continuous_scale='YlGnBu',
+                              labels={'x': '天气｜情感类型', 'y': '景区类型', 'color': '平均强度'}, aspect='auto')
+
+    figures = {'rain': rain_fig, 'visibility': visibility_fig, 'box': box_fig,
+               'weather_emotion_share': weather_share_fig, 'weather_tag_heatmap': heatmap_fig,
+               'three_dim': three_dim_fig}
+    for fig in figures.values():
+        fig.update_layout(height=450, margin=dict(l=20, r=20, t=30, b=20))
+    return figures
+
+
+def figure_card(title, figure, wide=False):
+    return html.Div([
+        html.H4(title, style={'fontSize': 16}),
+        dcc.Graph(figure=figure, config={'displaylogo': False},
+                  style={'width': '100%', 'maxWidth': '920px' if wide else '450px', 'margin': '0 auto'})
+    ], className="image-card wide-card" if wide else "image-card", style={'width': '100%'})
+
+
+def layout():
+    # 每次打开页面都按数据指纹取图：数据未变时直接用缓存，数据更新后自动重新生成
+    figures = cached_figures("weather_view", ["emotion"], build_figures)
+    return html.Div([
+
+        html.H3("气象-情感-景区-三维交叉分析", style={'margin': '20px 0'}),
+
+        # 使用 CSS Grid 创建两栏布局
         html.Div([
-            html.H4("情感强度三维交叉分析", style={'fontSize': 16}),
-            html.Img(
-                src="/assets/可视化图片/三维交叉-情感强度.png",
-                style={
-                    'width': '100%',
-                    'maxWidth': '920px',
-                    'height': 'auto',
-                    'border': '1px solid #ddd',
-                    'borderRadius': '8px'
-                }
-            )
-        ], className="image-card wide-card"),
-    ], className="two-column-grid")
-])
+            # 第一行
+            figure_card("降水与景区情感对比", figures['rain']),
+            figure_card("能见度与景区情感对比", figures['visibility']),
+            # 第二行
+            figure_card("天气情感分布箱线图", figures['box']),
+            figure_card("天气-情感类型占比", figures['weather_emotion_share']),
+            # 第三、四行横跨两列
+            figure_card("天气与景区情感热力图", figures['weather_tag_heatmap'], wide=True),
+            figure_card("情感强度三维交叉分析", figures['three_dim'], wide=True),
+        ], className="two-column-grid")
+    ])
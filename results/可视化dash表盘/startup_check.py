@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""
+启动耗时与内存检查（Linux）：python startup_check.py
+分两种方式模拟gunicorn多worker部署并对比：
+  preload：主进程导入app并预加载页面数据后fork出worker（gunicorn.conf.py的方式）
+  lazy   ：主进程只导入app，fork后每个worker第一次访问时各自加载
+每个worker执行一次地图回调后，在所有worker都存活时报告各自的RSS/PSS/USS（MB）
+"""
+
+import json
+import multiprocessing as mp
+import os
+import subprocess
+import sys
+import time
+
+N_WORKERS = 4
+
+
+def _worker(barrier, queue):
+    import app  # noqa: F401  已在主进程导入，这里只取引用
+    from page_data import memory_usage
+    from pages import map_view
+    start = time.perf_counter()
+    map_view.update_dashboard(None, None, None)
+    first_request = time.perf_counter() - start
+    barrier.wait()   # 所有worker都完成后再统计，PSS按实际共享进程数分摊
+    queue.put({"pid": os.getpid(), "first_request_s": round(first_request, 3),
+               **{k: round(v, 1) for k, v in memory_usage().items()}})
+    barrier.wait()
+
+
+def run(mode: str):
+    """在当前进程中按mode启动并fork出worker，打印JSON结果"""
+    start = time.perf_counter()
+    import app  # noqa: F401
+    from page_data import memory_usage, preload_datasets
+    result = {"mode": mode, "import_s": round(time.perf_counter() - start, 3)}
+    if mode == "preload":
+        start = time.perf_counter()
+        preload_datasets()
+        result["preload_s"] = round(time.perf_counter() - start, 3)
+    result["master"] = {k: round(v, 1) for k, v in memory_usage().items()}
+
+    ctx = mp.get_context("fork")
+    barrier, queue = ctx.Barrier(N_WORKERS), ctx.Queue()
+    workers = [ctx.Process(target=_worker, args=(barrier, queue)) for _ in range(N_WORKERS)]
+    for w in workers:
+        w.start()
+    result["workers"] = [queue.get() for _ in workers]
+    for w in workers:
+        w.join()
+    print(json.dumps(result, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        run(sys.argv[1])
+    else:
+        # 每种方式在独立的子进程中运行，互不影响
+        for mode in ("lazy", "preload"):
+            output = subprocess.run([sys.executable, os.path.abspath(__file__), mode], capture_output=True,
+                                    text=True, cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            workers = result["workers"]
+            print(f"\n[{mode}] 导入app：{result['import_s']}秒"
+                  + (f"，预加载：{result['preload_s']}秒" if "preload_s" in result else "")
+                  + f"，主进程内存：{result['master']}")
+            for w in workers:
+                print(f"  worker {w['pid']}：首次请求{w['first_request_s']}秒，"
+                      f"RSS {w.get('rss')}MB，PSS {w.get('pss')}MB，USS {w.get('uss')}MB")
+            print(f"  worker平均USS：{sum(w.get('uss', 0) for w in workers) / len(workers):.1f}MB")